@@ -0,0 +1,64 @@
+"""
+Benchmark: single-day aggregate for one user as their history grows.
+
+Compares the old `func.date(timestamp) == day` predicate with the range predicate
+backed by the (user_id, timestamp) index.
+
+    python -m benchmarks.bench_day_query
+"""
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, func, select
+from database.db import Base
+from database.models import Meal, User
+from services.analytics import day_bounds
+
+HISTORY_SIZES = [1_000, 10_000, 100_000]
+REPEATS = 200
+
+def _seed(conn, user_id, rows):
+    start = datetime(2020, 1, 1)
+    batch = []
+    for i in range(rows):
+        batch.append({
+            "user_id": user_id,
+            "timestamp": start + timedelta(minutes=37 * i),
+            "food_name": "Rice",
+            "calories": random.uniform(50, 800),
+            "protein": random.uniform(0, 60),
+            "carbs": random.uniform(0, 100),
+            "fats": random.uniform(0, 40),
+        })
+        if len(batch) == 10_000:
+            conn.execute(Meal.__table__.insert(), batch)
+            batch = []
+    if batch:
+        conn.execute(Meal.__table__.insert(), batch)
+    return (start + timedelta(minutes=37 * (rows // 2))).date()
+
+def _time(conn, stmt):
+    began = time.perf_counter()
+    for _ in range(REPEATS):
+        conn.execute(stmt).first()
+    return (time.perf_counter() - began) / REPEATS * 1000
+
+def main():
+    print(f"{'rows':>8} | {'func.date ms':>12} | {'range ms':>9}")
+    for size in HISTORY_SIZES:
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(User.__table__.insert(), [{"id": 1, "telegram_id": 1}, {"id": 2, "telegram_id": 2}])
+            _seed(conn, 2, size)  # another user's rows share the table
+            day = _seed(conn, 1, size)
+
+            aggregate = select(func.sum(Meal.calories), func.sum(Meal.protein))
+            old = aggregate.where(Meal.user_id == 1, func.date(Meal.timestamp) == day.isoformat())
+            start, end = day_bounds(day)
+            new = aggregate.where(Meal.user_id == 1, Meal.timestamp >= start, Meal.timestamp < end)
+
+            print(f"{size:>8} | {_time(conn, old):>12.3f} | {_time(conn, new):>9.3f}")
+
+if __name__ == "__main__":
+    main()
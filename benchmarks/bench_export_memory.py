@@ -0,0 +1,73 @@
+"""
+Benchmark: peak Python memory of the Excel export as a user's history grows.
+
+Compares the pandas export (generate_excel_report) with the streaming, write-only export
+(generate_excel_report_streaming). Peak memory comes from tracemalloc, so the numbers cover
+allocations made by Python code and not the C allocations inside SQLite itself.
+
+    python -m benchmarks.bench_export_memory
+"""
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Point the app at a scratch database before anything imports database.db
+_workdir = tempfile.mkdtemp(prefix="export_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'bench.db')}"
+
+from database.db import Base, engine  # noqa: E402
+from database.models import Meal, Workout, DailySummary, User  # noqa: E402
+from services.export import generate_excel_report, generate_excel_report_streaming  # noqa: E402
+
+HISTORY_DAYS = [180, 730, 2920]
+MEALS_PER_DAY = 5
+WORKOUTS_PER_DAY = 2
+
+def _seed(user_id, days):
+    start = datetime(2015, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{"id": user_id, "telegram_id": user_id}])
+        meals, workouts, summaries = [], [], []
+        for d in range(days):
+            day = start + timedelta(days=d)
+            for m in range(MEALS_PER_DAY):
+                meals.append({"user_id": user_id, "timestamp": day + timedelta(hours=7 + 3 * m),
+                              "food_name": "Chicken rice bowl", "calories": random.uniform(200, 800),
+                              "protein": 30.0, "carbs": 60.0, "fats": 15.0, "notes": "logged from chat"})
+            for w in range(WORKOUTS_PER_DAY):
+                workouts.append({"user_id": user_id, "timestamp": day + timedelta(hours=18 + w),
+                                 "exercise_name": "Bench press", "sets": 3, "reps": 10,
+                                 "calories_burned": random.uniform(50, 300), "notes": None})
+            summaries.append({"user_id": user_id, "date": day.date(), "total_calories_in": 2200.0,
+                              "total_calories_out": 400.0, "total_protein": 150.0,
+                              "weight_kg": 80 + random.uniform(-1, 1) if d % 3 == 0 else None})
+        # Raw table inserts: the summary hook only watches ORM flushes, so totals stay as seeded
+        conn.execute(Meal.__table__.insert(), meals)
+        conn.execute(Workout.__table__.insert(), workouts)
+        conn.execute(DailySummary.__table__.insert(), summaries)
+
+def _measure(func, user_id):
+    tracemalloc.start()
+    began = time.perf_counter()
+    func(user_id)
+    elapsed = time.perf_counter() - began
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2 ** 20, elapsed
+
+def main():
+    os.chdir(_workdir)  # exports/ and images/plots/ land in the scratch directory
+    Base.metadata.create_all(engine)
+    print(f"{'days':>6} | {'rows':>7} | {'pandas MiB':>10} | {'pandas s':>8} | {'stream MiB':>10} | {'stream s':>8}")
+    for user_id, days in enumerate(HISTORY_DAYS, start=1):
+        _seed(user_id, days)
+        rows = days * (1 + MEALS_PER_DAY + WORKOUTS_PER_DAY)
+        pandas_mib, pandas_s = _measure(generate_excel_report, user_id)
+        stream_mib, stream_s = _measure(generate_excel_report_streaming, user_id)
+        print(f"{days:>6} | {rows:>7} | {pandas_mib:>10.1f} | {pandas_s:>8.2f} | {stream_mib:>10.1f} | {stream_s:>8.2f}")
+
+if __name__ == "__main__":
+    main()
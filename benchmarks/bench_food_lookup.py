@@ -0,0 +1,64 @@
+"""
+Benchmark: SmartParser.parse_food over 100k messages against a 50k-item food table.
+
+The table is synthetic (real base foods combined with preparation words and brands),
+so the token postings have a realistic skew.
+
+    python -m benchmarks.bench_food_lookup
+"""
+import random
+import time
+from services import smart_parser
+from services.food_db import FoodDatabase, get_food_db
+from services.smart_parser import SmartParser, FOOD_CACHE
+
+TABLE_SIZE = 50_000
+MESSAGES = 100_000
+
+PREPARATIONS = ["grilled", "fried", "boiled", "baked", "roasted", "steamed", "raw", "smoked", "spicy", "creamy"]
+BRANDS = ["acme", "farmfresh", "goldleaf", "nordic", "sunvalley", "homestyle", "organic", "classic"]
+
+def _synthetic_table(base):
+    rng = random.Random(1)
+    foods = dict((name, macros) for name, macros in zip(base.names, base.entries))
+    while len(foods) < TABLE_SIZE:
+        name = " ".join(filter(None, [
+            rng.choice(BRANDS) if rng.random() < 0.5 else "",
+            rng.choice(PREPARATIONS) if rng.random() < 0.7 else "",
+            rng.choice(base.names),
+            f"variant{rng.randrange(5000)}" if rng.random() < 0.6 else "",
+        ]))
+        foods.setdefault(name, rng.choice(base.entries))
+    return list(foods.items())
+
+def _messages(base):
+    rng = random.Random(2)
+    typos = {"chicken": "chiken", "banana": "bananna", "yogurt": "yoghurt"}
+    out = []
+    for _ in range(MESSAGES):
+        food = rng.choice(base.names)
+        if rng.random() < 0.1:
+            food = typos.get(food, food)
+        prep = rng.choice(PREPARATIONS) + " " if rng.random() < 0.5 else ""
+        out.append(f"{rng.randrange(20, 500)}g {prep}{food}")
+    return out
+
+def main():
+    base = get_food_db(fallback=FOOD_CACHE)
+
+    began = time.perf_counter()
+    table = FoodDatabase(_synthetic_table(base))
+    build_s = time.perf_counter() - began
+    smart_parser.get_food_db = lambda fallback=None: table
+
+    messages = _messages(base)
+    began = time.perf_counter()
+    hits = sum(1 for m in messages if SmartParser.parse_food(m))
+    parse_s = time.perf_counter() - began
+
+    print(f"table: {len(table)} foods, index built in {build_s:.2f}s")
+    print(f"parsed {len(messages)} messages in {parse_s:.2f}s "
+          f"({parse_s / len(messages) * 1e6:.1f} us/message), {hits / len(messages):.1%} matched")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark: trend analytics over multi-year histories for many users.
+
+Times compute_trends() on synthetic users x days arrays and checks it against a plain
+Python per-user reference. Also times load_series(), which loads a cohort with one query
+from a scratch SQLite database.
+
+    python -m benchmarks.bench_trends
+"""
+import math
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+import numpy as np
+
+_workdir = tempfile.mkdtemp(prefix="trends_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'bench.db')}"
+
+from database.db import Base, engine  # noqa: E402
+from database.models import DailySummary, User  # noqa: E402
+from services.trends import (  # noqa: E402
+    DailySeries, compute_trends, load_series, WEIGHT_ALPHA, TDEE_WINDOW, KCAL_PER_KG, MIN_LOGGED_FRACTION,
+)
+
+COHORTS = [(1_000, 3 * 365), (5_000, 3 * 365)]
+REFERENCE_USERS = 50
+LOAD_USERS, LOAD_DAYS = 200, 3 * 365
+
+def _synthetic(users, days, seed=0):
+    rng = np.random.default_rng(seed)
+    series = DailySeries(range(users), date(2020, 1, 1), days)
+    logged = rng.random((users, days)) < 0.8
+    series.intake[:] = np.where(logged, rng.normal(2300, 400, (users, days)), 0.0)
+    series.protein[:] = np.where(logged, rng.normal(120, 30, (users, days)), 0.0)
+    drift = rng.normal(-0.01, 0.01, (users, 1)) * np.arange(days)
+    weights = 80 + drift + rng.normal(0, 0.5, (users, days))
+    series.weight[:] = np.where(rng.random((users, days)) < 0.3, weights, np.nan)
+    return series
+
+def _reference_tdee(intake, weight):
+    """Per-user, per-day pure Python version of weight_trend + adaptive_tdee."""
+    trend, current = [], None
+    for w in weight:
+        if not math.isnan(w):
+            current = w if current is None else current + WEIGHT_ALPHA * (w - current)
+        trend.append(math.nan if current is None else current)
+    tdee = []
+    for t in range(len(intake)):
+        if t < TDEE_WINDOW:
+            tdee.append(math.nan)
+            continue
+        window = [x for x in intake[t - TDEE_WINDOW + 1:t + 1] if x > 0]
+        if len(window) < MIN_LOGGED_FRACTION * TDEE_WINDOW:
+            tdee.append(math.nan)
+            continue
+        tdee.append(sum(window) / len(window) - (trend[t] - trend[t - TDEE_WINDOW]) * KCAL_PER_KG / TDEE_WINDOW)
+    return tdee
+
+def main():
+    print(f"{'users':>6} | {'days':>5} | {'numpy s':>8} | {'python s (extrapolated)':>24}")
+    for users, days in COHORTS:
+        series = _synthetic(users, days)
+        began = time.perf_counter()
+        trends = compute_trends(series)
+        vectorized = time.perf_counter() - began
+
+        began = time.perf_counter()
+        for u in range(REFERENCE_USERS):
+            expected = _reference_tdee(series.intake[u].tolist(), series.weight[u].tolist())
+            np.testing.assert_allclose(trends["tdee"][u], expected, rtol=1e-9, equal_nan=True)
+        reference = (time.perf_counter() - began) / REFERENCE_USERS * users
+        print(f"{users:>6} | {days:>5} | {vectorized:>8.2f} | {reference:>24.2f}")
+
+    Base.metadata.create_all(engine)
+    synthetic = _synthetic(LOAD_USERS, LOAD_DAYS, seed=1)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{"id": u + 1, "telegram_id": u + 1} for u in range(LOAD_USERS)])
+        conn.execute(DailySummary.__table__.insert(), [
+            {"user_id": u + 1, "date": synthetic.start_date + timedelta(days=d),
+             "total_calories_in": float(synthetic.intake[u, d]), "total_protein": float(synthetic.protein[u, d]),
+             "total_calories_out": 0.0,
+             "weight_kg": None if np.isnan(synthetic.weight[u, d]) else float(synthetic.weight[u, d])}
+            for u in range(LOAD_USERS) for d in range(LOAD_DAYS)
+        ])
+    began = time.perf_counter()
+    loaded = load_series(range(1, LOAD_USERS + 1), synthetic.start_date,
+                         synthetic.start_date + timedelta(days=LOAD_DAYS - 1))
+    elapsed = time.perf_counter() - began
+    assert np.allclose(loaded.intake, synthetic.intake)
+    print(f"load_series: {LOAD_USERS * LOAD_DAYS} rows in {elapsed:.2f}s (one query)")
+
+if __name__ == "__main__":
+    main()
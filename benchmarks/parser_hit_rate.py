@@ -0,0 +1,38 @@
+"""
+Reports how many sample messages SmartParser handles locally (zero API cost).
+
+Every local hit saves a Gemini round-trip (2-5 s) and a request from the quota.
+
+    python -m benchmarks.parser_hit_rate [messages.txt] [-v]
+"""
+import os
+import sys
+import time
+from services.smart_parser import SmartParser
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "sample_messages.txt")
+
+def main():
+    args = [a for a in sys.argv[1:] if a != "-v"]
+    verbose = "-v" in sys.argv
+    path = args[0] if args else DEFAULT_CORPUS
+    with open(path, encoding="utf-8") as f:
+        messages = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    hits = 0
+    items = 0
+    began = time.perf_counter()
+    for message in messages:
+        parsed = SmartParser.parse_message(message)
+        if parsed:
+            hits += 1
+            items += len(parsed["meals"]) + len(parsed["workouts"])
+        if verbose:
+            print(f"{'LOCAL' if parsed else 'AI   '} | {message}")
+    elapsed = time.perf_counter() - began
+
+    print(f"{hits}/{len(messages)} messages parsed locally ({hits / max(len(messages), 1):.1%}), "
+          f"{items} entries, {elapsed / max(len(messages), 1) * 1e6:.0f} us/message")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Builds the telegram Application: update processor, handlers and scheduled jobs.
+
+Shared by the single-process bot (main.py) and the shard workers (bot/sharding.py).
+"""
+import asyncio
+import logging
+from datetime import time as dt_time, timezone
+from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from config import TELEGRAM_BOT_TOKEN, PLAN_BATCH_TIME
+from bot.handlers import handle_message, pregenerate_plans_job
+from bot.update_processor import PerUserUpdateProcessor
+from services.export_jobs import export_queue
+
+logger = logging.getLogger(__name__)
+
+async def _shutdown(application):
+    """Stops background export workers when the bot exits."""
+    export_queue.shutdown()
+
+def build_application(polling=True, queue_size=0, schedule_jobs=True):
+    """
+    polling=False builds an Application without an Updater; updates are then fed to
+    `application.update_queue` (bounded by queue_size) by a webhook or a shard front.
+    """
+    # Different users are handled in parallel; each user's messages stay in order
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor())
+        .post_shutdown(_shutdown)
+    )
+    if not polling:
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=queue_size))
+    application = builder.build()
+
+    # Unified message handler for Photos and Text (Conversational)
+    # Note: We can keep a basic /start for new users, but handled conversationally
+    application.add_handler(CommandHandler("start", handle_message))
+
+    # Catch all text and photos
+    application.add_handler(MessageHandler(filters.PHOTO | filters.TEXT, handle_message))
+
+    if not schedule_jobs:
+        return application
+
+    # Nightly plan pre-generation (needs python-telegram-bot[job-queue])
+    if application.job_queue is not None:
+        hour, minute = (int(part) for part in PLAN_BATCH_TIME.split(":"))
+        application.job_queue.run_daily(pregenerate_plans_job, time=dt_time(hour, minute, tzinfo=timezone.utc),
+                                        name="pregenerate_plans")
+        logger.info(f"Plan pre-generation scheduled daily at {PLAN_BATCH_TIME} UTC.")
+    else:
+        logger.warning("JobQueue unavailable; run generate_plans.py from cron to pre-generate plans.")
+    return application
@@ -1,10 +1,9 @@
 import google.generativeai as genai
 import json
 import logging
-import os
-import asyncio
-import time
 from config import GEMINI_API_KEY
+from services.rate_limiter import DEFAULT
+from services.llm_client import LLMClient, LLMError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -17,31 +16,15 @@ if GEMINI_API_KEY:
 class GeminiAnalyzer:
     def __init__(self):
         self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.llm = LLMClient(self.model.generate_content, name="gemini")
 
-    async def _generate_with_retry(self, inputs):
-        """Helper to run generation with retry logic for rate limits."""
-        max_retries = 3
-        delay = 60  # Retry delay for rate limits
-
-        for attempt in range(max_retries):
-            try:
-                # 3-second pacing delay to avoid hitting rate limits
-                await asyncio.sleep(3)
-                
-                response = await asyncio.to_thread(self.model.generate_content, inputs)
-                return response
-            except Exception as e:
-                error_str = str(e)
-                # Check for rate limit indicators (429 or Resource Exhausted)
-                if "429" in error_str or "Resource" in error_str or "quota" in error_str.lower():
-                    logger.warning(f"Rate limit exceeded. Waiting {delay} seconds before retry (Attempt {attempt + 1}/{max_retries})...")
-                    await asyncio.sleep(delay)
-                    continue
-                else:
-                    # Reraise or return None for other errors
-                    logger.error(f"Gemini API Error: {e}")
-                    return None
-        return None
+    async def _generate(self, inputs, priority=DEFAULT):
+        """Runs generation through the shared LLM client (rate limit, retries, circuit breaker)."""
+        try:
+            return await self.llm.generate(inputs, priority=priority)
+        except LLMError as e:
+            logger.error(f"Gemini API Error: {e}")
+            return None
 
     async def analyze_meal(self, image_path, user_notes=None):
         """
@@ -76,7 +59,7 @@ class GeminiAnalyzer:
             sample_file = genai.upload_file(path=image_path, display_name="Meal Image")
             
             # Use the retry helper
-            response = await self._generate_with_retry([prompt, sample_file])
+            response = await self._generate([prompt, sample_file])
             
             if not response:
                 return None
@@ -117,7 +100,7 @@ class GeminiAnalyzer:
         try:
             sample_file = genai.upload_file(path=image_path, display_name="Workout Image")
             
-            response = await self._generate_with_retry([prompt, sample_file])
+            response = await self._generate([prompt, sample_file])
             
             if not response:
                 return None
@@ -156,7 +139,7 @@ class GeminiAnalyzer:
         try:
             sample_file = genai.upload_file(path=image_path, display_name="Health App Screenshot")
             
-            response = await self._generate_with_retry([prompt, sample_file])
+            response = await self._generate([prompt, sample_file])
             
             if not response:
                 return None
@@ -1,13 +1,21 @@
-import os
 import logging
-from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
-from database.db import SessionLocal
-from database.models import User, Meal, Workout, BodyMetric
+from database.db import run_db
+from database import repository
+from database.user_cache import user_cache
 from services.smart_parser import SmartParser
+from services import photo_pipeline
 from services.gemini_service import GeminiService
-from services.analytics import get_daily_totals
+from bot.recommendations import RecommendationEngine
+from services.ollama_service import OllamaService
+from services.llm_router import LLMRouter
+from services.analytics import get_daily_totals_async
+from services.chat_context import chat_context_cache
+from services.export_jobs import export_queue, RUNNING
+from services.llm_client import LLMError, RateLimited
+from bot.streaming import reply_streaming
+from config import CHAT_STREAMING, OLLAMA_ENABLED
 
 # Enable logging
 logging.basicConfig(
@@ -16,18 +24,16 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 gemini = GeminiService()
+recommendations = RecommendationEngine()
+# Chat goes to whichever backend is fastest right now; Ollama joins only when enabled
+router = LLMRouter.for_services(gemini, OllamaService() if OLLAMA_ENABLED else None)
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Unified handler for text and photos."""
     user = update.effective_user
-    db = SessionLocal()
     
-    # 1. Get/Create User
-    db_user = db.query(User).filter(User.telegram_id == user.id).first()
-    if not db_user:
-        db_user = User(telegram_id=user.id, name=user.full_name)
-        db.add(db_user)
-        db.commit()
+    # 1. Get/Create User (cached; all DB work runs on the DB thread pool, never on the event loop)
+    user_id = await user_cache.get_or_create(user.id, user.full_name)
 
     response_text = ""
     
@@ -35,16 +41,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.message.photo:
         await update.message.reply_chat_action("upload_photo")
         
-        # Download
-        photo_file = await update.message.photo[-1].get_file()
-        os.makedirs("images", exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_path = f"images/upload_{user.id}_{timestamp}.jpg"
-        await photo_file.download_to_drive(file_path)
+        # Download the smallest adequate size into memory and downscale off the loop
+        image_bytes = await photo_pipeline.fetch_photo(update.message.photo)
+        # Optional archival copy, written in the background
+        file_path = photo_pipeline.archive_photo(image_bytes, user.id)
         
         # Analyze
         caption = update.message.caption or ""
-        result = await gemini.analyze_image(file_path, caption)
+        result = await gemini.analyze_image(image_bytes, caption, user_id)
         
         if result:
             r_type = result.get('type')
@@ -52,22 +56,17 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply = result.get('reply', 'Processed.')
             
             if r_type == 'meal':
-                m = Meal(user_id=db_user.id, image_path=file_path, **data)
-                db.add(m)
+                await run_db(repository.add_meal, user_id, data, image_path=file_path)
                 response_text = f"✅ {reply}"
             elif r_type == 'workout':
-                w = Workout(user_id=db_user.id, image_path=file_path, **data)
-                db.add(w)
+                await run_db(repository.add_workout, user_id, data, image_path=file_path)
                 response_text = f"💪 {reply}"
             elif r_type == 'metric':
                 if 'weight_kg' in data:
-                    bm = BodyMetric(user_id=db_user.id, weight_kg=data['weight_kg'], source='gemini_vision')
-                    db.add(bm)
+                    await run_db(repository.add_body_metric, user_id, data['weight_kg'], 'gemini_vision')
                 response_text = f"📊 {reply}"
             else:
                 response_text = reply
-            
-            db.commit()
         else:
             response_text = "Sorry, I couldn't analyze that photo."
 
@@ -86,12 +85,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "❓ Questions like 'how am I doing?'"
             )
             await update.message.reply_text(response_text)
-            db.close()
             return
 
         # B. Local Data Query (Zero Cost)
         if text_lower in ['stats', 'summary', 'calories', 'how many calories', 'how many calories today', 'progress']:
-            totals = get_daily_totals(db_user.id)
+            totals = await get_daily_totals_async(user_id)
             response_text = (
                 f"📊 *Today's Stats:*\n"
                 f"🔥 Calories: {totals['calories_in']:.0f} In / {totals['calories_out']:.0f} Out\n"
@@ -100,50 +98,87 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"⚖️ Weight: {totals['weight'] or 'Not logged'} kg"
             )
             await update.message.reply_text(response_text, parse_mode="Markdown")
-            db.close()
             return
 
-        # C. Try Smart Parser (Zero Cost)
-        food_data = SmartParser.parse_food(text)
-        workout_data = SmartParser.parse_workout(text)
+        # B2. Excel Export (rendered in a background process, sent back as a document)
+        if text_lower in ['export', '/export', 'report', 'excel']:
+            job, created = export_queue.submit(context.bot, user_id, update.effective_chat.id)
+            if job is None:
+                response_text = "Lots of reports are being built right now. Please try again in a few minutes."
+            elif created:
+                response_text = "📊 Building your report... I'll send it here when it's ready."
+            else:
+                state = "being built" if job.status == RUNNING else "queued"
+                response_text = f"⏳ Your report is already {state} ({job.wait_seconds + (job.render_seconds or 0):.0f}s so far)."
+            await update.message.reply_text(response_text)
+            return
+
+        if text_lower in ['export status', '/export status']:
+            job = export_queue.status(user_id)
+            if job is None:
+                response_text = "No reports yet. Send 'export' to get one."
+            else:
+                info = job.snapshot()
+                response_text = f"Report #{info['id']}: {info['status']} (waited {info['wait_s']:.0f}s"
+                response_text += f", built in {info['render_s']:.0f}s)" if info['render_s'] is not None else ")"
+            await update.message.reply_text(response_text)
+            return
+
+        # B3. Daily Plan (pre-generated overnight; generated now only if missing)
+        if text_lower in ['plan', '/plan', 'my plan', 'today plan', "today's plan"]:
+            await update.message.reply_chat_action("typing")
+            response_text = await recommendations.get_plan(user_id)
+            await update.message.reply_text(response_text)
+            return
+
+        # C. Try Smart Parser (Zero Cost) - may log several meals/workouts from one message
+        parsed = SmartParser.parse_message(text)
         
-        if food_data:
-            m = Meal(user_id=db_user.id, **food_data)
-            db.add(m)
-            db.commit()
-            response_text = (
-                f"✅ Logged: {food_data['food_name']}\n"
-                f"🔥 {food_data['calories']} cal | 🥩 {food_data['protein']}g protein"
-            )
-            
-        elif workout_data:
-            w = Workout(user_id=db_user.id, **workout_data)
-            db.add(w)
-            db.commit()
-            response_text = (
-                f"💪 Logged: {workout_data['exercise_name']}\n"
-                f"⏱ {workout_data['duration_minutes']} min | 🔥 {workout_data['calories_burned']} cal"
-            )
+        if parsed:
+            await run_db(repository.add_entries, user_id, parsed['meals'], parsed['workouts'])
+            lines = []
+            for food_data in parsed['meals']:
+                lines.append(
+                    f"✅ Logged: {food_data['food_name']} ({food_data['weight_grams']:g}g)\n"
+                    f"🔥 {food_data['calories']} cal | 🥩 {food_data['protein']}g protein"
+                )
+            for workout_data in parsed['workouts']:
+                detail = f"{workout_data['sets']}x{workout_data['reps']}" if workout_data.get('reps') else ""
+                if workout_data.get('weight_kg'):
+                    detail += f" @ {workout_data['weight_kg']:g}kg"
+                lines.append(
+                    f"💪 Logged: {workout_data['exercise_name']} {detail}".rstrip() + "\n"
+                    f"⏱ {workout_data['duration_minutes']:g} min | 🔥 {workout_data['calories_burned']} cal"
+                )
+            response_text = "\n".join(lines)
             
         else:
             # B. Complex Query -> Gemini Chat
             await update.message.reply_chat_action("typing")
             
-            # Build Context
-            totals = get_daily_totals(db_user.id)
-            context = (
-                f"Date: {datetime.now().strftime('%A, %d %b')}\n"
-                f"Today's Stats:\n"
-                f"- Calories: {totals['calories_in']:.0f} In / {totals['calories_out']:.0f} Out\n"
-                f"- Protein: {totals['protein']:.1f}g\n"
-                f"- Workouts: {totals['workout_count']}\n"
-                f"- Current Weight: {totals['weight'] or 'Unknown'} kg"
-            )
+            # Build Context (cached per user until they log something new)
+            context = await chat_context_cache.get_context(user_id)
             
-            response_text = await gemini.chat(text, context)
+            if CHAT_STREAMING:
+                try:
+                    # Reply appears within the first chunk and grows as the model writes
+                    if await reply_streaming(update.message, router.stream_chat(text, context)):
+                        return
+                except LLMError as e:
+                    logger.warning(f"Streaming chat failed before the first chunk, falling back: {e}")
+
+            try:
+                response_text = await router.chat(text, context)
+            except RateLimited:
+                response_text = "My brain is tired (Rate Limit). Please try again in 1 minute! 🧠💤"
+            except LLMError as e:
+                logger.warning(f"Chat failed on every backend: {e}")
+                response_text = "I'm having trouble thinking right now. Try again?"
 
-    db.close()
-    
     # Send Final Response
     if response_text:
-        await update.message.reply_text(response_text)
\ No newline at end of file
+        await update.message.reply_text(response_text)
+
+async def pregenerate_plans_job(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue callback: nightly plan batch."""
+    await recommendations.pregenerate_plans()
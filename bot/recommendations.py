@@ -1,11 +1,17 @@
 import google.generativeai as genai
 from sqlalchemy import func
 from datetime import datetime, timedelta
-from database.db import SessionLocal
-from database.models import User, DailySummary, Workout, Meal
-from config import GEMINI_API_KEY
+from database.db import SessionLocal, run_db
+from database.models import User, DailySummary, Workout, Meal, PeriodSummary, RecommendationPlan
+from database.summaries import WEEK, MONTH, period_start
+from config import (GEMINI_API_KEY, LLM_BATCH_DEADLINE_SECONDS, PLAN_BATCH_CONCURRENCY,
+                    PLAN_BATCH_BUDGET, PLAN_ACTIVE_DAYS)
+from services.rate_limiter import BATCH, INTERACTIVE
+from services.llm_client import LLMClient, LLMError
+from services.trends import user_trend_summary, format_trends
 import logging
 import asyncio
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -14,30 +20,17 @@ class RecommendationEngine:
         if GEMINI_API_KEY:
             genai.configure(api_key=GEMINI_API_KEY)
         self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.llm = LLMClient(self.model.generate_content, name="gemini")
 
-    async def _generate_with_retry(self, inputs):
-        """Helper to run generation with retry logic for rate limits."""
-        max_retries = 3
-        delay = 60  # Retry delay for rate limits
-
-        for attempt in range(max_retries):
-            try:
-                # 3-second pacing delay to avoid hitting rate limits
-                await asyncio.sleep(3)
-                
-                response = await asyncio.to_thread(self.model.generate_content, inputs)
-                return response
-            except Exception as e:
-                error_str = str(e)
-                # Check for rate limit indicators (429 or Resource Exhausted)
-                if "429" in error_str or "Resource" in error_str or "quota" in error_str.lower():
-                    logger.warning(f"Rate limit exceeded. Waiting {delay} seconds before retry (Attempt {attempt + 1}/{max_retries})...")
-                    await asyncio.sleep(delay)
-                    continue
-                else:
-                    logger.error(f"Gemini API Error: {e}")
-                    return None
-        return None
+    async def _generate(self, inputs, priority=BATCH):
+        """Runs generation through the shared LLM client (rate limit, retries, circuit breaker)."""
+        try:
+            # Batch work may queue behind live chats for a while; on-demand plans use the normal deadline
+            deadline = LLM_BATCH_DEADLINE_SECONDS if priority == BATCH else None
+            return await self.llm.generate(inputs, priority=priority, deadline=deadline)
+        except LLMError as e:
+            logger.error(f"Gemini API Error: {e}")
+            return None
 
     def get_user_history(self, user_id, days=7):
         db = SessionLocal()
@@ -61,16 +54,36 @@ class RecommendationEngine:
                 Workout.timestamp >= datetime.utcnow() - timedelta(days=7)
             ).order_by(Workout.timestamp.desc()).limit(5).all()
             
+            # Longer horizons come from the precomputed rollups: 4 weekly + 6 monthly rows at most
+            today = datetime.utcnow().date()
+            weeks = db.query(PeriodSummary).filter(
+                PeriodSummary.user_id == user_id,
+                PeriodSummary.period == WEEK,
+                PeriodSummary.period_start >= period_start(WEEK, today) - timedelta(weeks=3)
+            ).order_by(PeriodSummary.period_start).all()
+            months = db.query(PeriodSummary).filter(
+                PeriodSummary.user_id == user_id,
+                PeriodSummary.period == MONTH,
+                PeriodSummary.period_start >= period_start(MONTH, today - timedelta(days=155))
+            ).order_by(PeriodSummary.period_start).all()
+
             return {
                 "summaries": summaries,
+                "trends": user_trend_summary(user_id),
+                "weeks": weeks,
+                "months": months,
                 "recent_meals": [m.food_name for m in recent_meals],
                 "recent_workouts": [w.exercise_name for w in recent_workouts]
             }
         finally:
             db.close()
 
-    async def generate_recommendations(self, user_id):
-        history = self.get_user_history(user_id)
+    async def _plan_text(self, user_id, priority=BATCH):
+        """
+        Generates a day's plan; returns the text, or None if Gemini failed. The text names no
+        date, so carry_forward() can re-date an unchanged user's plan without regenerating it.
+        """
+        history = await run_db(self.get_user_history, user_id)
         
         # Calculate averages
         total_cals = sum(s.total_calories_in for s in history['summaries'])
@@ -80,9 +93,19 @@ class RecommendationEngine:
         avg_cals = total_cals / days_count
         avg_protein = total_protein / days_count
         
+        trends = [
+            f"- Week of {w.period_start:%d %b}: {w.avg_calories_in:.0f} kcal/day, {w.avg_protein:.0f} g protein/day, "
+            f"{w.days_logged}/{w.days_in_period} days logged, {w.workout_days} workout days"
+            for w in history['weeks']
+        ] + [
+            f"- {m.period_start:%B %Y}: {m.avg_calories_in:.0f} kcal/day, {m.workout_days} workout days"
+            + (f", weight {m.weight_delta:+.1f} kg" if m.weight_delta is not None else "")
+            for m in history['months']
+        ]
+        
         prompt = f"""
         Act as an expert fitness and nutrition coach.
-        Based on the user's recent data (Last {days_count} days), generate a personalized plan for TOMORROW.
+        Based on the user's recent data (Last {days_count} days), generate a personalized plan for the day ahead.
         
         DATA:
         - Average Daily Calories: {avg_cals:.0f} kcal
@@ -90,18 +113,134 @@ class RecommendationEngine:
         - Recent Meals: {', '.join(history['recent_meals'])}
         - Recent Workouts: {', '.join(history['recent_workouts'])}
         
+        LONGER-TERM TRENDS:
+        {chr(10).join(trends) or 'Not enough history yet'}
+        {format_trends(history['trends'])}
+        
         TASK:
         1. Analyze their current trends (Are they eating enough protein? Consistent with workouts?).
-        2. Suggest a specific Meal Plan for tomorrow (Breakfast, Lunch, Dinner, Snack) that complements their habits but improves nutrition.
-        3. Suggest a specific Workout Routine for tomorrow (considering what they did recently to avoid overtraining same muscles).
+        2. Suggest a specific Meal Plan for that day (Breakfast, Lunch, Dinner, Snack) that complements their habits but improves nutrition.
+        3. Suggest a specific Workout Routine for that day (considering what they did recently to avoid overtraining same muscles).
         
         FORMAT:
         Use clear headings (## Analysis, ## Meal Plan, ## Workout). Keep it concise and motivating.
         """
         
-        response = await self._generate_with_retry(prompt)
-        
-        if response:
-            return response.text
-        else:
-            return "Sorry, I couldn't generate recommendations right now. Please try tracking more data first!"
\ No newline at end of file
+        response = await self._generate(prompt, priority=priority)
+        return response.text if response else None
+
+    async def generate_recommendations(self, user_id):
+        text = await self._plan_text(user_id)
+        return text or "Sorry, I couldn't generate recommendations right now. Please try tracking more data first!"
+
+    def load_plan(self, user_id, plan_date):
+        """The stored plan text for plan_date, or None. Blocking."""
+        db = SessionLocal()
+        try:
+            return db.query(RecommendationPlan.content).filter(
+                RecommendationPlan.user_id == user_id,
+                RecommendationPlan.plan_date == plan_date
+            ).scalar()
+        finally:
+            db.close()
+
+    def save_plan(self, user_id, plan_date, content, generated_at):
+        db = SessionLocal()
+        try:
+            plan = db.query(RecommendationPlan).filter(RecommendationPlan.user_id == user_id).first()
+            if plan is None:
+                plan = RecommendationPlan(user_id=user_id)
+                db.add(plan)
+            plan.plan_date = plan_date
+            plan.content = content
+            plan.generated_at = generated_at
+            db.commit()
+        finally:
+            db.close()
+
+    def plan_candidates(self):
+        """
+        Splits active users (something logged in the last PLAN_ACTIVE_DAYS) into those whose
+        data changed since their plan was generated (most recently active first) and those
+        whose plan can simply be carried forward. Blocking.
+        """
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(days=PLAN_ACTIVE_DAYS)
+            last_change = func.max(DailySummary.updated_at)
+            rows = db.query(DailySummary.user_id, last_change, RecommendationPlan.generated_at).outerjoin(
+                RecommendationPlan, RecommendationPlan.user_id == DailySummary.user_id
+            ).group_by(DailySummary.user_id, RecommendationPlan.generated_at).having(
+                last_change >= cutoff
+            ).order_by(last_change.desc()).all()
+
+            stale, unchanged = [], []
+            for user_id, changed_at, generated_at in rows:
+                if generated_at is None or changed_at > generated_at:
+                    stale.append(user_id)
+                else:
+                    unchanged.append(user_id)
+            return stale, unchanged
+        finally:
+            db.close()
+
+    def carry_forward(self, user_ids, plan_date):
+        """Re-dates unchanged users' plans without a Gemini call (plan text is undated). Blocking."""
+        if not user_ids:
+            return
+        db = SessionLocal()
+        try:
+            db.query(RecommendationPlan).filter(RecommendationPlan.user_id.in_(user_ids)).update(
+                {RecommendationPlan.plan_date: plan_date}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _generate_and_store(self, user_id, plan_date, priority):
+        started = datetime.utcnow()  # data changed after this point makes the plan stale again
+        text = await self._plan_text(user_id, priority=priority)
+        if text:
+            await run_db(self.save_plan, user_id, plan_date, text, started)
+        return text
+
+    async def pregenerate_plans(self, plan_date=None, concurrency=PLAN_BATCH_CONCURRENCY, budget=PLAN_BATCH_BUDGET):
+        """
+        Batch job: makes sure every active user has a plan for plan_date (default: today, UTC).
+        Gemini is called only for users whose data changed since their last plan, at most
+        `budget` times and `concurrency` at once, at BATCH priority so live chats go first.
+        """
+        plan_date = plan_date or datetime.utcnow().date()
+        stale, unchanged = await run_db(self.plan_candidates)
+        await run_db(self.carry_forward, unchanged, plan_date)
+
+        selected, skipped = stale[:budget], len(stale) - min(len(stale), budget)
+        slots = asyncio.Semaphore(concurrency)
+        started = time.monotonic()
+
+        async def one(user_id):
+            async with slots:
+                try:
+                    return bool(await self._generate_and_store(user_id, plan_date, BATCH))
+                except Exception as e:
+                    logger.error(f"Plan generation failed for user {user_id}: {e}")
+                    return False
+
+        results = await asyncio.gather(*(one(user_id) for user_id in selected))
+        stats = {
+            "generated": sum(results),
+            "failed": len(results) - sum(results),
+            "carried_forward": len(unchanged),
+            "over_budget": skipped,
+            "seconds": round(time.monotonic() - started, 1),
+        }
+        logger.info(f"Plan batch for {plan_date}: {stats}")
+        return stats
+
+    async def get_plan(self, user_id):
+        """Today's plan: served from storage when the batch made one, generated (and stored) otherwise."""
+        today = datetime.utcnow().date()
+        text = await run_db(self.load_plan, user_id, today)
+        if text:
+            return text
+        text = await self._generate_and_store(user_id, today, INTERACTIVE)
+        return text or "Sorry, I couldn't generate recommendations right now. Please try tracking more data first!"
@@ -0,0 +1,326 @@
+"""
+Multi-process mode (BOT_WORKERS > 1).
+
+A front process receives updates, either by long polling or through the webhook server.
+It routes each update to one of BOT_WORKERS worker processes by `telegram_id % BOT_WORKERS`.
+A user always lands on the same worker, and that worker's PerUserUpdateProcessor keeps their
+messages in order. Different users' CPU-bound work (photo decoding, prompt building,
+exports) spreads across cores.
+
+- IPC: one bounded multiprocessing queue per worker (spawn context), carrying the raw
+  update JSON, and one ack queue back. The worker acks each update once it has taken it
+  off the queue. Until then the front keeps the update in the shard's `pending` buffer.
+  A full buffer, or a worker that is down, makes the webhook answer 503; the poller
+  waits and holds its offset instead.
+- Workers run the usual Application without an Updater. The Gemini quota (GEMINI_RPM,
+  GEMINI_TPM) is per API key, so each worker limits itself to 1/BOT_WORKERS of it.
+  DB_POOL_SIZE and EXPORT_WORKERS are per process: every worker has its own DB pool
+  and export render pool. Only worker 0 schedules the nightly plan job.
+- The supervisor restarts a worker that dies, with exponential backoff when it keeps
+  crashing. The new process gets fresh queues (a worker killed inside `get()` never
+  releases the old queue's lock) and every unacked update from `pending`, in order.
+  An update whose ack was still in flight is delivered twice. An update the dead
+  worker had already acked is lost.
+- Workers report their processor stats every SHARD_STATS_INTERVAL_SECONDS. The front logs
+  them and serves them from /healthz in webhook mode.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from collections import OrderedDict
+from telegram import Bot, Update
+from telegram.error import NetworkError
+from config import (TELEGRAM_BOT_TOKEN, BOT_MODE, BOT_WORKERS, SHARD_QUEUE_SIZE,
+                    SHARD_STATS_INTERVAL_SECONDS, GEMINI_RPM, GEMINI_TPM)
+from bot.webhook import stop_on_signals, register_webhook, start_server
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30
+RESTART_BACKOFF_MAX = 60.0
+STABLE_SECONDS = 30.0  # a worker that ran this long before dying restarts without delay
+
+def telegram_id(data):
+    """The user (or failing that, the chat) an update is about, from its raw JSON."""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        for field in ("from", "user"):
+            user = value.get(field)
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+def shard_for(data, shards):
+    key = telegram_id(data)
+    return (key if key is not None else data["update_id"]) % shards
+
+# --- worker process ---
+
+def _worker_main(index, workers, updates, acks, reports):
+    """Entry point of a worker process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the whole group; the front stops us
+    logging.basicConfig(
+        format=f"%(asctime)s - shard{index} - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO, force=True,
+    )
+    asyncio.run(_run_worker(index, workers, updates, acks, reports))
+
+async def _report(index, application, reports):
+    processor = application.update_processor
+    while True:
+        await asyncio.sleep(SHARD_STATS_INTERVAL_SECONDS)
+        stats = {"pid": os.getpid(), "update_queue": application.update_queue.qsize()}
+        if hasattr(processor, "stats"):
+            stats.update(processor.stats())
+        try:
+            reports.put_nowait((index, stats))
+        except queue.Full:
+            pass
+
+async def _run_worker(index, workers, updates, acks, reports):
+    from bot.application import build_application
+    from services.rate_limiter import gemini_limiter
+    gemini_limiter.set_budget(GEMINI_RPM / workers, GEMINI_TPM / workers)
+    application = build_application(polling=False, queue_size=SHARD_QUEUE_SIZE, schedule_jobs=index == 0)
+    loop = asyncio.get_running_loop()
+    async with application:
+        await application.start()
+        reporter = asyncio.create_task(_report(index, application, reports))
+        logger.info(f"Shard {index} ready (pid {os.getpid()}).")
+        try:
+            while True:
+                data = await loop.run_in_executor(None, updates.get)
+                if data is None:  # stop signal from the front
+                    break
+                try:
+                    update = Update.de_json(data, application.bot)
+                except Exception as e:
+                    logger.warning(f"Dropping unparseable update {data.get('update_id')}: {e}")
+                else:
+                    await application.update_queue.put(update)
+                acks.put(data.get("update_id"))
+        finally:
+            reporter.cancel()
+            await application.stop()  # drains what is already queued
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+# --- front process ---
+
+class _Shard:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.queue = None
+        self.acks = None
+        self.pending = OrderedDict()  # update_id -> raw update not yet acked by the worker
+        self.started_at = None
+        self.restart_at = None
+        self.backoff = 1.0
+        self.restarts = 0
+        self.dispatched = 0
+        self.report = {}
+
+    def queued(self):
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:  # macOS
+            return None
+
+class ShardSupervisor:
+    """Starts, feeds and restarts the worker processes. Also the webhook server's sink."""
+    def __init__(self, workers=BOT_WORKERS, queue_size=SHARD_QUEUE_SIZE):
+        self._ctx = multiprocessing.get_context("spawn")
+        self.queue_size = queue_size
+        self.shards = [_Shard(i) for i in range(workers)]
+        self.reports = self._ctx.Queue(maxsize=workers * 16)
+        self._stopping = False
+        self._last_log = time.monotonic()
+
+    def _spawn(self, shard):
+        if shard.queue is not None:
+            self._collect_acks(shard)
+            for old in (shard.queue, shard.acks):
+                old.close()
+                old.cancel_join_thread()
+        shard.queue = self._ctx.Queue(maxsize=self.queue_size)
+        shard.acks = self._ctx.Queue()
+        for data in shard.pending.values():
+            shard.queue.put_nowait(data)  # pending never exceeds queue_size
+        if shard.pending:
+            logger.info(f"Resending {len(shard.pending)} unacked updates to the new shard {shard.index} worker.")
+        shard.process = self._ctx.Process(
+            target=_worker_main, args=(shard.index, len(self.shards), shard.queue, shard.acks, self.reports),
+            name=f"bot-shard-{shard.index}",
+        )
+        shard.process.start()
+        shard.started_at = time.monotonic()
+        shard.restart_at = None
+        shard.report = {}
+
+    @staticmethod
+    def _collect_acks(shard):
+        """Forgets the updates the worker has taken off its queue."""
+        while True:
+            try:
+                update_id = shard.acks.get_nowait()
+            except (queue.Empty, EOFError, OSError):
+                return
+            shard.pending.pop(update_id, None)
+
+    def start(self):
+        for shard in self.shards:
+            self._spawn(shard)
+        logger.info(f"Started {len(self.shards)} shard workers.")
+
+    def accept(self, data):
+        """Queues a raw update for its shard; False while that shard is full or its worker is down."""
+        shard = self.shards[shard_for(data, len(self.shards))]
+        if not shard.process.is_alive():
+            return False
+        if len(shard.pending) >= self.queue_size:
+            self._collect_acks(shard)
+            if len(shard.pending) >= self.queue_size:
+                return False
+        try:
+            shard.queue.put_nowait(data)
+        except queue.Full:
+            return False
+        shard.pending[data["update_id"]] = data
+        shard.dispatched += 1
+        return True
+
+    def stats(self):
+        return [
+            {
+                "shard": shard.index,
+                "pid": shard.process.pid if shard.process else None,
+                "alive": bool(shard.process and shard.process.is_alive()),
+                "restarts": shard.restarts,
+                "dispatched": shard.dispatched,
+                "unacked": len(shard.pending),
+                "queued": shard.queued(),
+                **{k: v for k, v in shard.report.items() if k != "pid"},
+            }
+            for shard in self.shards
+        ]
+
+    def health(self):
+        """(ready, details) for /healthz: ready while every worker is up."""
+        workers = self.stats()
+        return all(w["alive"] for w in workers), {"workers": workers}
+
+    def _collect_reports(self):
+        while True:
+            try:
+                index, stats = self.reports.get_nowait()
+            except queue.Empty:
+                return
+            self.shards[index].report = stats
+
+    def check_workers(self):
+        """Schedules restarts for dead workers and performs the ones that are due."""
+        now = time.monotonic()
+        for shard in self.shards:
+            if shard.process.is_alive() or self._stopping:
+                continue
+            if shard.restart_at is None:
+                if now - shard.started_at >= STABLE_SECONDS:
+                    shard.backoff = 1.0
+                shard.restart_at = now + shard.backoff
+                logger.error(f"Shard {shard.index} worker exited with code {shard.process.exitcode}; "
+                             f"restarting in {shard.backoff:.0f}s.")
+                shard.backoff = min(shard.backoff * 2, RESTART_BACKOFF_MAX)
+            elif now >= shard.restart_at:
+                shard.process.close()
+                self._spawn(shard)
+                shard.restarts += 1
+
+    async def monitor(self, interval=1.0):
+        while True:
+            await asyncio.sleep(interval)
+            self._collect_reports()
+            for shard in self.shards:
+                self._collect_acks(shard)
+            self.check_workers()
+            if time.monotonic() - self._last_log >= SHARD_STATS_INTERVAL_SECONDS:
+                self._last_log = time.monotonic()
+                for worker in self.stats():
+                    logger.info(f"Shard stats: {worker}")
+
+    async def stop(self, timeout=30.0):
+        """Asks every worker to finish its queue, then waits; stragglers are terminated."""
+        self._stopping = True
+        loop = asyncio.get_running_loop()
+
+        def stop_shard(shard):
+            if shard.process.is_alive():
+                try:
+                    shard.queue.put(None, timeout=timeout)
+                except queue.Full:
+                    pass
+                shard.process.join(timeout)
+            if shard.process.is_alive():
+                logger.warning(f"Shard {shard.index} did not stop in {timeout:.0f}s; terminating.")
+                shard.process.terminate()
+                shard.process.join()
+            for q in (shard.queue, shard.acks):
+                q.close()
+                q.cancel_join_thread()
+
+        await asyncio.gather(*(loop.run_in_executor(None, stop_shard, s) for s in self.shards))
+        logger.info("Shard workers stopped.")
+
+async def _poll(bot, supervisor):
+    """Long-polls Telegram and routes updates; a full shard holds the offset until it has room."""
+    await bot.delete_webhook()
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES)
+        except NetworkError as e:  # includes timeouts; anything else (bad token, conflict) ends polling
+            logger.warning(f"getUpdates failed: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            data = update.to_dict()
+            while not supervisor.accept(data):
+                await asyncio.sleep(0.1)
+            offset = update.update_id + 1
+
+async def run_sharded(mode=BOT_MODE, workers=BOT_WORKERS):
+    """Runs the front process with `workers` shard workers until SIGINT/SIGTERM."""
+    stop = stop_on_signals()
+    supervisor = ShardSupervisor(workers)
+    supervisor.start()
+    monitor = asyncio.create_task(supervisor.monitor())
+    try:
+        if mode == "webhook":
+            async with Bot(TELEGRAM_BOT_TOKEN) as bot:
+                await register_webhook(bot)
+            runner = await start_server(supervisor)
+            try:
+                await stop.wait()
+            finally:
+                await runner.cleanup()
+        else:
+            logger.info(f"Bot is polling ({workers} shard workers)...")
+            async with Bot(TELEGRAM_BOT_TOKEN) as bot:
+                poller = asyncio.create_task(_poll(bot, supervisor))
+                stopped = asyncio.create_task(stop.wait())
+                await asyncio.wait({poller, stopped}, return_when=asyncio.FIRST_COMPLETED)
+                stopped.cancel()
+                if poller.done():
+                    poller.result()  # re-raise what ended polling
+                poller.cancel()
+    finally:
+        monitor.cancel()
+        await supervisor.stop()
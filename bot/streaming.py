@@ -0,0 +1,117 @@
+"""
+Progressive Telegram replies for streamed model output.
+
+The first message is sent as soon as the first text arrives and is then edited in place
+as more text streams in. Edits are throttled to Telegram's per-chat edit rate, and a
+RetryAfter pushes the next edit back instead of failing the reply.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from telegram.error import BadRequest, RetryAfter
+from config import STREAM_EDIT_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_MESSAGE = 4096
+CURSOR = " ▌"
+FINAL_EDIT_ATTEMPTS = 3
+
+class StreamStats:
+    """Rolling time-to-first-byte and total reply durations for streamed chats."""
+    def __init__(self, size=500):
+        self.ttfb = deque(maxlen=size)
+        self.total = deque(maxlen=size)
+
+    def record(self, ttfb, total):
+        self.ttfb.append(ttfb)
+        self.total.append(total)
+
+    @staticmethod
+    def _percentile(values, pct):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+    def summary(self):
+        return {
+            "count": len(self.ttfb),
+            "ttfb_p50_ms": round(self._percentile(self.ttfb, 0.5) * 1000),
+            "ttfb_p95_ms": round(self._percentile(self.ttfb, 0.95) * 1000),
+            "total_p50_ms": round(self._percentile(self.total, 0.5) * 1000),
+            "total_p95_ms": round(self._percentile(self.total, 0.95) * 1000),
+        }
+
+stream_stats = StreamStats()
+
+async def _edit(sent, text):
+    """Edits the message; returns seconds to wait before the next edit (Telegram RetryAfter)."""
+    try:
+        await sent.edit_text(text)
+    except RetryAfter as e:
+        retry = e.retry_after
+        return retry.total_seconds() if hasattr(retry, "total_seconds") else float(retry)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+    return 0.0
+
+async def _finalize(message, sent, text, attempts=FINAL_EDIT_ATTEMPTS):
+    """
+    The final edit must land, or the user keeps the partial text and cursor. A throttled edit
+    is retried after Telegram's backoff; if it is still refused, the text is sent as a new message.
+    """
+    for _ in range(attempts):
+        backoff = await _edit(sent, text)
+        if not backoff:
+            return
+        await asyncio.sleep(backoff)
+    logger.warning("Final streamed edit kept being throttled; sending the reply as a new message")
+    await message.reply_text(text)
+
+async def reply_streaming(message, chunks, min_interval=STREAM_EDIT_INTERVAL_SECONDS):
+    """
+    Replies to `message` with text from the async iterator `chunks`, editing as it grows.
+    Returns the full text, or "" when nothing was sent (an empty or all-whitespace stream), so the
+    caller falls back to a one-shot reply. Errors before anything was sent propagate too; errors
+    afterwards finalize the partial message.
+    """
+    started = time.monotonic()
+    text = ""
+    sent = None
+    shown = ""
+    next_edit = 0.0
+    try:
+        async for piece in chunks:
+            text += piece
+            visible = text[:TELEGRAM_MAX_MESSAGE - len(CURSOR)]
+            now = time.monotonic()
+            if sent is None:
+                if not text.strip():
+                    continue
+                ttfb = now - started
+                sent = await message.reply_text(visible + CURSOR)
+                shown = visible
+                next_edit = now + min_interval
+            elif now >= next_edit and visible != shown:
+                backoff = await _edit(sent, visible + CURSOR)
+                shown = visible
+                next_edit = time.monotonic() + max(min_interval, backoff)
+    except Exception as e:
+        if sent is None:
+            raise
+        logger.warning(f"Stream interrupted after {len(text)} chars: {e}")
+        text += " …"
+
+    if sent is None:
+        return ""
+
+    # Final edit without the cursor; overflow beyond one message goes out as follow-ups
+    await _finalize(message, sent, text[:TELEGRAM_MAX_MESSAGE])
+    for start in range(TELEGRAM_MAX_MESSAGE, len(text), TELEGRAM_MAX_MESSAGE):
+        await message.reply_text(text[start:start + TELEGRAM_MAX_MESSAGE])
+
+    total = time.monotonic() - started
+    stream_stats.record(ttfb, total)
+    logger.info(f"Streamed reply: TTFB {ttfb * 1000:.0f} ms, total {total * 1000:.0f} ms, {len(text)} chars")
+    return text
@@ -0,0 +1,119 @@
+"""
+Concurrent update processing that keeps each user's messages in order.
+
+Updates from different users run in parallel, up to UPDATE_CONCURRENCY at once. Updates
+from the same user run one after another, in arrival order. An update takes its user's
+lock *before* it takes one of the global worker slots, so a user who sends ten photos
+occupies one slot and not ten.
+
+Backpressure: an update arriving while UPDATE_MAX_PENDING updates are already admitted,
+or while its user already has UPDATE_MAX_PENDING_PER_USER queued, is shed. It is not
+processed, and the user gets a short "busy" reply instead of silence.
+"""
+import asyncio
+import logging
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import UPDATE_CONCURRENCY, UPDATE_MAX_PENDING, UPDATE_MAX_PENDING_PER_USER
+
+logger = logging.getLogger(__name__)
+
+BUSY_REPLY = "I'm handling a lot right now. Please send that again in a moment 🙏"
+
+class _UserQueue:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()  # FIFO: waiters acquire in arrival order
+        self.pending = 0
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, concurrency=UPDATE_CONCURRENCY, max_pending=UPDATE_MAX_PENDING,
+                 max_pending_per_user=UPDATE_MAX_PENDING_PER_USER):
+        # The base class semaphore bounds admitted updates (running + waiting); shedding keeps us below it
+        super().__init__(max_concurrent_updates=max_pending + 1)
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.max_pending_per_user = max_pending_per_user
+        self._workers = None
+        self._users = {}
+        self._admitted = 0
+        self._running = 0
+        self.processed = 0
+        self.shed = 0
+
+    async def initialize(self):
+        self._workers = asyncio.Semaphore(self.concurrency)
+
+    async def shutdown(self):
+        pass
+
+    @staticmethod
+    def _user_key(update):
+        if isinstance(update, Update) and update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def _shed(self, update, coroutine, reason):
+        coroutine.close()  # never awaited: the handlers for this update do not run
+        self.shed += 1
+        logger.warning(f"Shedding update ({reason}); {self.stats()}")
+        message = update.effective_message if isinstance(update, Update) else None
+        if message is not None:
+            try:
+                await message.reply_text(BUSY_REPLY)
+            except Exception as e:
+                logger.debug(f"Could not send busy reply: {e}")
+
+    async def do_process_update(self, update, coroutine):
+        key = self._user_key(update)
+        queue = self._users.get(key) if key is not None else None
+
+        if self._admitted >= self.max_pending:
+            await self._shed(update, coroutine, "global backlog full")
+            return
+        if queue is not None and queue.pending >= self.max_pending_per_user:
+            await self._shed(update, coroutine, f"user {key} backlog full")
+            return
+
+        if key is not None and queue is None:
+            queue = self._users[key] = _UserQueue()
+        self._admitted += 1
+        if queue is not None:
+            queue.pending += 1
+        try:
+            if queue is None:
+                async with self._workers:
+                    await self._run(coroutine)
+            else:
+                # Per-user order first, then a global slot
+                async with queue.lock:
+                    async with self._workers:
+                        await self._run(coroutine)
+        finally:
+            self._admitted -= 1
+            if queue is not None:
+                queue.pending -= 1
+                if queue.pending == 0:
+                    self._users.pop(key, None)
+
+    async def _run(self, coroutine):
+        self._running += 1
+        try:
+            await coroutine
+        finally:
+            self._running -= 1
+            self.processed += 1
+
+    def saturated(self):
+        """True when a new update would be shed; webhook ingress answers 503 instead of accepting it."""
+        return self._admitted >= self.max_pending
+
+    def stats(self):
+        return {
+            "running": self._running,
+            "waiting": self._admitted - self._running,
+            "users_queued": len(self._users),
+            "processed": self.processed,
+            "shed": self.shed,
+        }
@@ -0,0 +1,167 @@
+"""
+Webhook ingress: Telegram POSTs updates to an embedded aiohttp server instead of being long-polled.
+
+- Requests must carry the configured secret in X-Telegram-Bot-Api-Secret-Token, and the body
+  must be a JSON object with an integer update_id, at most WEBHOOK_MAX_BODY_BYTES long.
+  The secret is required once WEBHOOK_URL is set; it may only be left empty for local testing.
+- Accepted updates go onto the application's bounded update queue. When that queue is full,
+  or the update processor is already at its backlog limit, the server answers 503 and
+  Telegram redelivers later. Load is pushed back to Telegram instead of piling up here.
+- GET /healthz reports queue depth and processor stats (503 until the application is running).
+
+Several instances can sit behind a load balancer. Ordering per user is only guaranteed
+within one instance. With BOT_WORKERS > 1 the same server runs in the shard front
+process (bot/sharding.py) and hands updates to the workers.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from aiohttp import web
+from telegram import Update
+from config import (WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+                    WEBHOOK_MAX_BODY_BYTES)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookStats:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.overloaded = 0
+
+class ApplicationSink:
+    """Feeds updates to an Application in this process."""
+    def __init__(self, application):
+        self.application = application
+
+    def accept(self, data):
+        """False when the update cannot be taken now; raises on updates that do not parse."""
+        application = self.application
+        saturated = getattr(application.update_processor, "saturated", None)
+        if saturated is not None and saturated():
+            return False
+        try:
+            application.update_queue.put_nowait(Update.de_json(data, application.bot))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def health(self):
+        """(ready, details) for /healthz."""
+        processor = self.application.update_processor
+        details = {"update_queue": self.application.update_queue.qsize()}
+        if hasattr(processor, "stats"):
+            details["processor"] = processor.stats()
+        return self.application.running, details
+
+def create_webhook_app(sink, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET, max_body=WEBHOOK_MAX_BODY_BYTES):
+    """
+    aiohttp app passing updates to `sink` (an ApplicationSink, or the shard supervisor).
+    Usable on its own for local testing.
+    """
+    stats = WebhookStats()
+
+    async def receive_update(request):
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            stats.rejected += 1
+            return web.Response(status=403, text="bad secret token")
+        try:
+            data = await request.json(loads=json.loads)
+        except (ValueError, UnicodeDecodeError):
+            stats.rejected += 1
+            return web.Response(status=400, text="body is not JSON")
+        if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+            stats.rejected += 1
+            return web.Response(status=400, text="not a Telegram update")
+
+        try:
+            accepted = sink.accept(data)
+        except Exception as e:
+            stats.rejected += 1
+            logger.warning(f"Could not parse update {data.get('update_id')}: {e}")
+            return web.Response(status=400, text="invalid update")
+        if not accepted:
+            stats.overloaded += 1
+            return web.Response(status=503, text="busy")
+        stats.accepted += 1
+        return web.Response(text="ok")
+
+    async def healthz(request):
+        ready, details = sink.health()
+        body = {
+            "status": "ok" if ready else "starting",
+            "accepted": stats.accepted,
+            "rejected": stats.rejected,
+            "overloaded": stats.overloaded,
+            **details,
+        }
+        return web.json_response(body, status=200 if ready else 503)
+
+    app = web.Application(client_max_size=max_body)
+    app.router.add_post(path, receive_update)
+    app.router.add_get("/healthz", healthz)
+    app["webhook_stats"] = stats
+    return app
+
+def config_error():
+    """Why webhook mode must not start with the current settings, or None."""
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        return ("WEBHOOK_SECRET must be set when WEBHOOK_URL is: without it anyone could post "
+                "forged updates as any user. An empty secret is only allowed for local testing.")
+    return None
+
+def stop_on_signals():
+    """An event set on SIGINT/SIGTERM."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    return stop
+
+async def register_webhook(bot):
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(f"Webhook registered at {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+    else:
+        logger.warning("WEBHOOK_URL not set; expecting the webhook to be registered already.")
+
+async def start_server(sink, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    """Starts serving; returns the runner to clean up."""
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET is empty: accepting updates without authentication (local testing only).")
+    runner = web.AppRunner(create_webhook_app(sink))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Bot is serving webhooks on {host}:{port}{WEBHOOK_PATH}")
+    return runner
+
+async def serve_webhook(application, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    """Runs the bot in webhook mode until SIGINT/SIGTERM."""
+    stop = stop_on_signals()
+    async with application:  # initialize() / shutdown()
+        if application.post_init:
+            await application.post_init(application)
+        await register_webhook(application.bot)
+        await application.start()
+
+        runner = await start_server(ApplicationSink(application), host, port)
+        try:
+            await stop.wait()
+        finally:
+            await runner.cleanup()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+    if application.post_shutdown:
+        await application.post_shutdown(application)
@@ -6,3 +6,94 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Number of threads (and pooled connections) used for blocking DB work, per process (each shard worker has its own)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+
+# Max Telegram users kept in the in-process identity cache
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+# Nutrition table (per 100g) used by the local parser; .csv or SQLite (.db/.sqlite)
+FOOD_DB_PATH = os.getenv("FOOD_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "foods.csv"))
+
+# Vision analysis cache: entry lifetime, max stored entries, and the max dHash bit distance
+# for treating two photos as the same image (0 = exact content matches only)
+VISION_CACHE_TTL_HOURS = float(os.getenv("VISION_CACHE_TTL_HOURS", "168"))
+VISION_CACHE_MAX_ENTRIES = int(os.getenv("VISION_CACHE_MAX_ENTRIES", "5000"))
+VISION_CACHE_MAX_DISTANCE = int(os.getenv("VISION_CACHE_MAX_DISTANCE", "4"))
+
+# Gemini quota shared by every caller in the process; with BOT_WORKERS > 1 split evenly across the workers
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "15"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+
+# LLM calls: attempts per call, overall deadline, and circuit breaker tuning
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+LLM_BATCH_DEADLINE_SECONDS = float(os.getenv("LLM_BATCH_DEADLINE_SECONDS", "300"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Photo pipeline: longest side sent to the model, JPEG quality, resize threads,
+# and where to archive photos ("" disables archiving)
+PHOTO_TARGET_PX = int(os.getenv("PHOTO_TARGET_PX", "1024"))
+PHOTO_JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "85"))
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", "2"))
+PHOTO_ARCHIVE_DIR = os.getenv("PHOTO_ARCHIVE_DIR", "images")
+
+# Local Ollama server (optional secondary model backend)
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_TIMEOUT_SECONDS", "120"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "4"))
+OLLAMA_ENABLED = os.getenv("OLLAMA_ENABLED", "0") == "1"
+
+# Provider router: hedge to the other backend once the first is slower than its p95
+# (never sooner than ROUTER_HEDGE_MIN_SECONDS; ROUTER_HEDGE_DEFAULT_SECONDS until enough samples)
+ROUTER_HEDGE_MIN_SECONDS = float(os.getenv("ROUTER_HEDGE_MIN_SECONDS", "1.5"))
+ROUTER_HEDGE_DEFAULT_SECONDS = float(os.getenv("ROUTER_HEDGE_DEFAULT_SECONDS", "8"))
+
+# Stream chat replies into an edited Telegram message; min seconds between edits
+CHAT_STREAMING = os.getenv("CHAT_STREAMING", "1") == "1"
+STREAM_EDIT_INTERVAL_SECONDS = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", "1.0"))
+
+# Background Excel exports: render processes and max users waiting/rendering at once, per bot process
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_MAX_QUEUED = int(os.getenv("EXPORT_MAX_QUEUED", "50"))
+
+# Rendered report charts: shared on-disk cache ("" keeps the cache in memory only), in-memory entries,
+# and files kept on disk (least recently used are removed beyond this)
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", "images/plots/cache")
+CHART_CACHE_ENTRIES = int(os.getenv("CHART_CACHE_ENTRIES", "256"))
+CHART_CACHE_MAX_FILES = int(os.getenv("CHART_CACHE_MAX_FILES", "2000"))
+
+# Columnar (Parquet/CSV) analytics export
+COLUMNAR_EXPORT_DIR = os.getenv("COLUMNAR_EXPORT_DIR", "exports/columnar")
+
+# Users whose chat prompt context is kept in memory (dropped when their data changes)
+CHAT_CONTEXT_CACHE_SIZE = int(os.getenv("CHAT_CONTEXT_CACHE_SIZE", "5000"))
+
+# Nightly plan pre-generation: UTC run time (HH:MM), parallel Gemini calls, max calls per run,
+# and how recently a user must have logged something to get a plan
+PLAN_BATCH_TIME = os.getenv("PLAN_BATCH_TIME", "03:00")
+PLAN_BATCH_CONCURRENCY = int(os.getenv("PLAN_BATCH_CONCURRENCY", "4"))
+PLAN_BATCH_BUDGET = int(os.getenv("PLAN_BATCH_BUDGET", "500"))
+PLAN_ACTIVE_DAYS = int(os.getenv("PLAN_ACTIVE_DAYS", "7"))
+
+# Update dispatch: handlers running at once, and admitted-update caps beyond which updates are shed
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "256"))
+UPDATE_MAX_PENDING_PER_USER = int(os.getenv("UPDATE_MAX_PENDING_PER_USER", "10"))
+
+# How updates arrive: "polling" (default) or "webhook" (embedded HTTP server)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # public base URL; when set the webhook is registered on startup
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # required with WEBHOOK_URL; empty only for local testing
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY_BYTES", str(1024 * 1024)))
+
+# Worker processes; above 1 updates are sharded across them by telegram_id (bot/sharding.py)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "1000"))
+SHARD_STATS_INTERVAL_SECONDS = float(os.getenv("SHARD_STATS_INTERVAL_SECONDS", "60"))
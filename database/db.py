@@ -1,16 +1,35 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from config import DATABASE_URL
+from config import DATABASE_URL, DB_POOL_SIZE
+
+logger = logging.getLogger(__name__)
 
 # For development purposes, fallback to sqlite if no DATABASE_URL is provided or if it's the example one
 if not DATABASE_URL or DATABASE_URL.startswith("postgresql://user:password"):
     DATABASE_URL = "sqlite:///./fitness_tracker.db"
 
-engine = create_engine(DATABASE_URL)
+if DATABASE_URL.startswith("sqlite"):
+    # Sessions are opened on the DB worker threads, not the thread that created the engine
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+else:
+    # One pooled connection per DB worker thread, plus headroom for scripts/exports
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_POOL_SIZE,
+        pool_pre_ping=True,
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Dedicated pool for blocking DB work so queries never run on the bot's event loop
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -18,7 +37,18 @@ def get_db():
     finally:
         db.close()
 
+async def run_db(func, *args, **kwargs):
+    """Runs a blocking DB function on the DB thread pool and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
 def init_db():
     # Import models here to ensure they are registered with Base.metadata before creation
     from database import models
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    from database.migrations import upgrade_schema
+    Base.metadata.create_all(bind=engine)
+    if upgrade_schema(engine, Base.metadata):
+        # One-off after upgrading an old database: rebuild every summary from the raw rows
+        from services.analytics import backfill_daily_summaries
+        count = backfill_daily_summaries()
+        logger.info(f"Schema upgrade: rebuilt {count} daily summaries.")
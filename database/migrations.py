@@ -0,0 +1,94 @@
+"""
+In-place upgrades for databases created by older versions.
+
+create_all() only creates missing tables; it never alters existing ones. init_db() runs
+upgrade_schema() afterwards. Every step checks the live schema first, so it is a no-op on
+an up-to-date database and safe to run at every start.
+"""
+import logging
+from sqlalchemy import inspect, text, UniqueConstraint
+
+logger = logging.getLogger(__name__)
+
+def _add_missing_columns(conn, metadata):
+    """ALTER TABLE ... ADD COLUMN for model columns the table lacks. Returns {table: [columns]}."""
+    inspector = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+    added = {}
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {col_type}"))
+            # Existing rows get the model's scalar default rather than NULL
+            if column.default is not None and column.default.is_scalar:
+                conn.execute(
+                    text(f"UPDATE {quote(table.name)} SET {quote(column.name)} = :value"),
+                    {"value": column.default.arg},
+                )
+            added.setdefault(table.name, []).append(column.name)
+            logger.info(f"Schema upgrade: added column {table.name}.{column.name}")
+    return added
+
+def _existing_index_names(inspector, table_name):
+    names = {ix["name"] for ix in inspector.get_indexes(table_name)}
+    names |= {uc["name"] for uc in inspector.get_unique_constraints(table_name)}
+    return names
+
+def _dedupe(conn, table, columns):
+    """Keeps the oldest row (lowest id) of each duplicate group. Returns the rows removed."""
+    quote = conn.dialect.identifier_preparer.quote
+    cols = ", ".join(quote(c) for c in columns)
+    # Wrapped in a derived table so engines that forbid deleting from a table they read accept it
+    result = conn.execute(text(
+        f"DELETE FROM {quote(table.name)} WHERE id NOT IN "
+        f"(SELECT id FROM (SELECT MIN(id) AS id FROM {quote(table.name)} GROUP BY {cols}) AS keep)"
+    ))
+    return result.rowcount
+
+def _add_missing_indexes(conn, metadata):
+    """
+    Creates model indexes and unique constraints missing from existing tables. Unique
+    constraints become unique indexes (SQLite cannot add constraints to a table), after
+    duplicate rows are removed. Returns {table: rows removed as duplicates}.
+    """
+    inspector = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+    removed = {}
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = _existing_index_names(inspector, table.name)
+        wanted = [(ix.name, [c.name for c in ix.columns], ix.unique) for ix in table.indexes]
+        wanted += [(uc.name, [c.name for c in uc.columns], True) for uc in table.constraints
+                   if isinstance(uc, UniqueConstraint) and uc.name]
+        for name, columns, unique in wanted:
+            if name in existing:
+                continue
+            if unique:
+                dropped = _dedupe(conn, table, columns)
+                if dropped:
+                    removed[table.name] = removed.get(table.name, 0) + dropped
+                    logger.warning(f"Schema upgrade: removed {dropped} duplicate {table.name} rows on {columns}")
+            conn.execute(text(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX {quote(name)} ON {quote(table.name)} "
+                f"({', '.join(quote(c) for c in columns)})"
+            ))
+            logger.info(f"Schema upgrade: created index {name} on {table.name}")
+    return removed
+
+def upgrade_schema(engine, metadata):
+    """
+    Brings an existing database up to the current models in one transaction.
+    Returns True when DailySummary predates incremental maintenance and must be rebuilt.
+    """
+    with engine.begin() as conn:
+        added = _add_missing_columns(conn, metadata)
+        removed = _add_missing_indexes(conn, metadata)
+    # Older versions only wrote a day's summary when it was read, so rows may be stale or missing;
+    # after a dedupe it is also unknown which copy was right
+    return "updated_at" in added.get("daily_summary", []) or "daily_summary" in removed
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Date, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .db import Base
@@ -19,6 +19,7 @@ class User(Base):
 
 class Workout(Base):
     __tablename__ = "workouts"
+    __table_args__ = (Index("ix_workouts_user_timestamp", "user_id", "timestamp"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -36,6 +37,7 @@ class Workout(Base):
 
 class Meal(Base):
     __tablename__ = "meals"
+    __table_args__ = (Index("ix_meals_user_timestamp", "user_id", "timestamp"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -53,6 +55,7 @@ class Meal(Base):
 
 class BodyMetric(Base):
     __tablename__ = "body_metrics"
+    __table_args__ = (Index("ix_body_metrics_user_timestamp", "user_id", "timestamp"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -66,6 +69,7 @@ class BodyMetric(Base):
 
 class DailySummary(Base):
     __tablename__ = "daily_summary"
+    __table_args__ = (UniqueConstraint("user_id", "date", name="uq_daily_summary_user_date"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -73,7 +77,66 @@ class DailySummary(Base):
     total_calories_in = Column(Float, default=0.0)
     total_calories_out = Column(Float, default=0.0)
     total_protein = Column(Float, default=0.0)
+    total_carbs = Column(Float, default=0.0)
+    total_fats = Column(Float, default=0.0)
     workout_count = Column(Integer, default=0)
-    weight_kg = Column(Float, nullable=True)
+    weight_kg = Column(Float, nullable=True) # last weight logged that day
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="daily_summaries")
+
+class PeriodSummary(Base):
+    """Weekly (Monday-start) and monthly rollups of DailySummary, kept in step by the flush hook."""
+    __tablename__ = "period_summary"
+    __table_args__ = (UniqueConstraint("user_id", "period", "period_start", name="uq_period_summary_user_period"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    period = Column(String(8)) # "week" or "month"
+    period_start = Column(Date)
+    days_in_period = Column(Integer)
+    total_calories_in = Column(Float, default=0.0)
+    total_calories_out = Column(Float, default=0.0)
+    total_protein = Column(Float, default=0.0)
+    total_carbs = Column(Float, default=0.0)
+    total_fats = Column(Float, default=0.0)
+    workout_count = Column(Integer, default=0)
+    avg_calories_in = Column(Float, default=0.0) # per day with meals logged
+    avg_protein = Column(Float, default=0.0) # per day with meals logged
+    days_logged = Column(Integer, default=0) # days with any meal
+    workout_days = Column(Integer, default=0)
+    weigh_in_days = Column(Integer, default=0)
+    weight_start = Column(Float, nullable=True) # first weigh-in of the period
+    weight_end = Column(Float, nullable=True) # last weigh-in of the period
+    weight_delta = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class RecommendationPlan(Base):
+    """Latest generated daily plan per user; refreshed by the nightly batch when their data changed."""
+    __tablename__ = "recommendation_plans"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), unique=True)
+    plan_date = Column(Date) # day the plan is for
+    content = Column(Text)
+    generated_at = Column(DateTime, default=datetime.utcnow)
+
+class VisionCacheEntry(Base):
+    __tablename__ = "vision_cache"
+    __table_args__ = (
+        UniqueConstraint("content_hash", "caption_hash", name="uq_vision_cache_content_caption"),
+        Index("ix_vision_cache_user_caption_created", "user_id", "caption_hash", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True) # who sent it; near-duplicates match only their own photos
+    content_hash = Column(String(64)) # sha256 of the image bytes
+    perceptual_hash = Column(String(16), nullable=True) # 64-bit dHash (hex), for near-duplicates
+    caption_hash = Column(String(64)) # sha256 of the normalized caption
+    result = Column(Text) # JSON analysis
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_hit_at = Column(DateTime, default=datetime.utcnow)
+    hit_count = Column(Integer, default=0)
+
+# Registers the flush hook that keeps DailySummary and PeriodSummary in step with the rows above
+from . import summaries  # noqa: E402,F401
@@ -0,0 +1,66 @@
+"""
+Blocking data-access helpers used by the bot.
+
+Each function opens its own session so it can be handed to `run_db` and executed
+on the DB thread pool instead of the event loop.
+"""
+from sqlalchemy.exc import IntegrityError
+from database.db import SessionLocal
+from database.models import User, Meal, Workout, BodyMetric
+
+def _model_fields(model, data):
+    """Drops keys that are not columns of the model (AI/parser output may carry extras)."""
+    columns = model.__table__.columns.keys()
+    return {k: v for k, v in data.items() if k in columns and k != "id"}
+
+def get_or_create_user(telegram_id: int, name: str = None):
+    """Returns the internal user id for a Telegram user, creating the row if needed."""
+    db = SessionLocal()
+    try:
+        db_user = db.query(User).filter(User.telegram_id == telegram_id).first()
+        if not db_user:
+            db_user = User(telegram_id=telegram_id, name=name)
+            db.add(db_user)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another process created the user first; use its row
+                db.rollback()
+                db_user = db.query(User).filter(User.telegram_id == telegram_id).one()
+        return db_user.id
+    finally:
+        db.close()
+
+def add_meal(user_id: int, data: dict, **extra):
+    db = SessionLocal()
+    try:
+        db.add(Meal(user_id=user_id, **_model_fields(Meal, {**data, **extra})))
+        db.commit()
+    finally:
+        db.close()
+
+def add_workout(user_id: int, data: dict, **extra):
+    db = SessionLocal()
+    try:
+        db.add(Workout(user_id=user_id, **_model_fields(Workout, {**data, **extra})))
+        db.commit()
+    finally:
+        db.close()
+
+def add_entries(user_id: int, meals: list, workouts: list):
+    """Adds several parsed meals/workouts in one transaction."""
+    db = SessionLocal()
+    try:
+        db.add_all([Meal(user_id=user_id, **_model_fields(Meal, m)) for m in meals])
+        db.add_all([Workout(user_id=user_id, **_model_fields(Workout, w)) for w in workouts])
+        db.commit()
+    finally:
+        db.close()
+
+def add_body_metric(user_id: int, weight_kg: float, source: str = "manual"):
+    db = SessionLocal()
+    try:
+        db.add(BodyMetric(user_id=user_id, weight_kg=weight_kg, source=source))
+        db.commit()
+    finally:
+        db.close()
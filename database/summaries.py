@@ -0,0 +1,238 @@
+"""
+Incremental DailySummary and PeriodSummary maintenance.
+
+Every flush that inserts, updates or deletes a Meal, Workout or BodyMetric applies
+the matching deltas to the affected (user_id, date) summary rows inside the same
+transaction, so stats reads can be served straight from DailySummary. The week and
+month containing each touched day are then re-rolled from their (at most 31) daily
+rows, so long-horizon reads touch a few dozen PeriodSummary rows instead of raw history.
+"""
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from sqlalchemy import event, select, and_, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from .models import Meal, Workout, BodyMetric, DailySummary, PeriodSummary
+
+# Summary column -> source attribute (None counts the row itself)
+TRACKED_COLUMNS = {
+    Meal: {
+        "total_calories_in": "calories",
+        "total_protein": "protein",
+        "total_carbs": "carbs",
+        "total_fats": "fats",
+    },
+    Workout: {
+        "total_calories_out": "calories_burned",
+        "workout_count": None,
+    },
+    BodyMetric: {},
+}
+
+def _load_old_value(target, value, oldvalue, initiator):
+    return value
+
+# Make assignments load the previous value first. Otherwise, on an instance expired by a
+# commit, the history of the changed attribute has no "deleted" side, and the old amount
+# (or the old day) would never be subtracted.
+for _model, _columns in TRACKED_COLUMNS.items():
+    for _attr in {"user_id", "timestamp", *(a for a in _columns.values() if a)}:
+        event.listen(getattr(_model, _attr), "set", _load_old_value, active_history=True, retval=True)
+
+_UPSERT_DIALECTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+def _snapshot(obj, attrs, old=False):
+    """Returns the pre-flush (old=True) or post-flush values of the given attributes."""
+    values = {}
+    for attr in attrs:
+        hist = get_history(obj, attr)
+        seq = (hist.deleted or hist.unchanged) if old else (hist.added or hist.unchanged)
+        values[attr] = seq[0] if seq else None
+    return values
+
+def _contribute(obj, sign, old, deltas, weight_days):
+    columns = TRACKED_COLUMNS[type(obj)]
+    attrs = ["user_id", "timestamp"] + [a for a in columns.values() if a]
+    values = _snapshot(obj, attrs, old=old)
+    if values["user_id"] is None or values["timestamp"] is None:
+        return
+
+    key = (values["user_id"], values["timestamp"].date())
+    if isinstance(obj, BodyMetric):
+        weight_days.add(key)
+        return
+
+    day = deltas[key]
+    for column, attr in columns.items():
+        amount = 1 if attr is None else (values[attr] or 0)
+        day[column] += sign * amount
+
+def _day_weight(conn, user_id, day):
+    """Latest weight logged on the given day, or None."""
+    start = datetime.combine(day, datetime.min.time())
+    return conn.execute(
+        select(BodyMetric.weight_kg)
+        .where(
+            BodyMetric.user_id == user_id,
+            BodyMetric.timestamp >= start,
+            BodyMetric.timestamp < start + timedelta(days=1),
+        )
+        .order_by(BodyMetric.timestamp.desc())
+        .limit(1)
+    ).scalar()
+
+def apply_summary_deltas(conn, user_id, day, deltas, weight_changed=False):
+    """Adds deltas to one summary row, creating the row if it does not exist yet."""
+    table = DailySummary.__table__
+    row = dict(deltas)
+    if weight_changed:
+        row["weight_kg"] = _day_weight(conn, user_id, day)
+    row["updated_at"] = datetime.utcnow()
+
+    # Atomic upsert on the (user_id, date) unique key so concurrent writers can't lose deltas
+    dialect_insert = _UPSERT_DIALECTS.get(conn.dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(table).values(user_id=user_id, date=day, **row)
+        updates = {col: func.coalesce(table.c[col], 0) + stmt.excluded[col] for col in deltas}
+        updates.update({col: stmt.excluded[col] for col in row if col not in deltas})
+        conn.execute(stmt.on_conflict_do_update(index_elements=["user_id", "date"], set_=updates))
+        return
+
+    values = {col: func.coalesce(table.c[col], 0) + amount for col, amount in deltas.items()}
+    values.update({col: value for col, value in row.items() if col not in deltas})
+    result = conn.execute(
+        table.update()
+        .where(and_(table.c.user_id == user_id, table.c.date == day))
+        .values(**values)
+    )
+    if result.rowcount == 0:
+        conn.execute(table.insert().values(user_id=user_id, date=day, **row))
+
+WEEK = "week"
+MONTH = "month"
+
+def period_start(period, day):
+    """First day of the week (Monday) or month containing `day`."""
+    return day - timedelta(days=day.weekday()) if period == WEEK else day.replace(day=1)
+
+def period_end(period, start):
+    """First day after the period starting at `start`."""
+    if period == WEEK:
+        return start + timedelta(days=7)
+    return date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+
+def _rollup(rows, days_in_period):
+    """PeriodSummary values from a period's DailySummary rows (ordered by date)."""
+    logged = [r for r in rows if r.total_calories_in]
+    weights = [r.weight_kg for r in rows if r.weight_kg is not None]
+    values = {
+        "days_in_period": days_in_period,
+        "total_calories_in": sum(r.total_calories_in or 0 for r in rows),
+        "total_calories_out": sum(r.total_calories_out or 0 for r in rows),
+        "total_protein": sum(r.total_protein or 0 for r in rows),
+        "total_carbs": sum(r.total_carbs or 0 for r in rows),
+        "total_fats": sum(r.total_fats or 0 for r in rows),
+        "workout_count": sum(r.workout_count or 0 for r in rows),
+        "days_logged": len(logged),
+        "workout_days": sum(1 for r in rows if r.workout_count),
+        "weigh_in_days": len(weights),
+        "weight_start": weights[0] if weights else None,
+        "weight_end": weights[-1] if weights else None,
+        "weight_delta": weights[-1] - weights[0] if weights else None,
+    }
+    values["avg_calories_in"] = values["total_calories_in"] / len(logged) if logged else 0.0
+    values["avg_protein"] = values["total_protein"] / len(logged) if logged else 0.0
+    return values
+
+def refresh_period(conn, user_id, period, start):
+    """Recomputes one week/month rollup from its daily rows; removes it when the period is empty."""
+    end = period_end(period, start)
+    daily = DailySummary.__table__
+    table = PeriodSummary.__table__
+    rows = conn.execute(
+        select(daily).where(daily.c.user_id == user_id, daily.c.date >= start, daily.c.date < end)
+        .order_by(daily.c.date)
+    ).all()
+    key = and_(table.c.user_id == user_id, table.c.period == period, table.c.period_start == start)
+
+    if not rows:
+        conn.execute(table.delete().where(key))
+        return
+
+    values = _rollup(rows, (end - start).days)
+    values["updated_at"] = datetime.utcnow()
+    dialect_insert = _UPSERT_DIALECTS.get(conn.dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(table).values(user_id=user_id, period=period, period_start=start, **values)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "period", "period_start"],
+            set_={col: stmt.excluded[col] for col in values}
+        ))
+        return
+
+    if conn.execute(table.update().where(key).values(**values)).rowcount == 0:
+        conn.execute(table.insert().values(user_id=user_id, period=period, period_start=start, **values))
+
+def refresh_periods(conn, days):
+    """Re-rolls every week and month containing one of the given (user_id, date) keys."""
+    periods = {(user_id, period, period_start(period, day)) for user_id, day in days for period in (WEEK, MONTH)}
+    for user_id, period, start in sorted(periods):
+        refresh_period(conn, user_id, period, start)
+
+def rebuild_period_summaries(conn, user_ids=None, start_date=None, end_date=None):
+    """
+    Rebuilds the rollups overlapping [start_date, end_date] for the given users (default: all)
+    from DailySummary. Used after bulk backfills, which bypass the flush hook.
+    """
+    table = PeriodSummary.__table__
+    daily = DailySummary.__table__
+    delete = table.delete()
+    days = select(daily.c.user_id, daily.c.date).distinct()
+    if user_ids is not None:
+        delete = delete.where(table.c.user_id.in_(user_ids))
+        days = days.where(daily.c.user_id.in_(user_ids))
+    # Widen to whole weeks/months: every overlapping period is dropped, then re-rolled from its days
+    if start_date:
+        lo = min(period_start(WEEK, start_date), period_start(MONTH, start_date))
+        delete = delete.where(table.c.period_start >= lo)
+        days = days.where(daily.c.date >= lo)
+    if end_date:
+        hi = max(period_end(p, period_start(p, end_date)) for p in (WEEK, MONTH))
+        delete = delete.where(table.c.period_start <= end_date)
+        days = days.where(daily.c.date < hi)
+    conn.execute(delete)
+    refresh_periods(conn, conn.execute(days).all())
+
+@event.listens_for(Session, "after_flush")
+def _maintain_daily_summaries(session, flush_context):
+    deltas = defaultdict(lambda: defaultdict(float))
+    weight_days = set()
+
+    for obj in session.new:
+        if type(obj) in TRACKED_COLUMNS:
+            _contribute(obj, +1, False, deltas, weight_days)
+    for obj in session.deleted:
+        if type(obj) in TRACKED_COLUMNS:
+            _contribute(obj, -1, True, deltas, weight_days)
+    for obj in session.dirty:
+        if type(obj) in TRACKED_COLUMNS and session.is_modified(obj):
+            _contribute(obj, -1, True, deltas, weight_days)
+            _contribute(obj, +1, False, deltas, weight_days)
+
+    if not deltas and not weight_days:
+        return
+
+    conn = session.connection()
+    touched = set()
+    for key in set(deltas) | weight_days:
+        user_id, day = key
+        changed = {col: amount for col, amount in deltas.get(key, {}).items() if amount}
+        # Applied even without net change: updated_at marks the day as changed for incremental exports
+        apply_summary_deltas(conn, user_id, day, changed, weight_changed=key in weight_days)
+        if changed or key in weight_days:
+            touched.add(key)
+    refresh_periods(conn, touched)
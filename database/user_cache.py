@@ -0,0 +1,81 @@
+"""
+In-process cache mapping Telegram ids to internal user ids.
+
+The get-or-create lookup is the first thing every update does; caching it removes a
+DB round-trip from the hot path. Concurrent first messages from the same user share a
+single in-flight lookup, and the entry is dropped whenever the User row changes.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import get_history
+from config import USER_CACHE_SIZE
+from database.db import run_db
+from database.models import User
+from database import repository
+
+class UserIdentityCache:
+    def __init__(self, maxsize=USER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        # Invalidation fires from DB worker threads, lookups from the event loop
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def get(self, telegram_id):
+        with self._lock:
+            user_id = self._entries.get(telegram_id)
+            if user_id is not None:
+                self._entries.move_to_end(telegram_id)
+            return user_id
+
+    def put(self, telegram_id, user_id):
+        with self._lock:
+            self._entries[telegram_id] = user_id
+            self._entries.move_to_end(telegram_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id):
+        with self._lock:
+            self._entries.pop(telegram_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    async def _load(self, telegram_id, name):
+        user_id = await run_db(repository.get_or_create_user, telegram_id, name)
+        self.put(telegram_id, user_id)
+        return user_id
+
+    def _finish(self, telegram_id, task):
+        self._inflight.pop(telegram_id, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    async def get_or_create(self, telegram_id, name=None):
+        """Returns the internal user id, hitting the DB at most once per uncached user."""
+        user_id = self.get(telegram_id)
+        if user_id is not None:
+            return user_id
+
+        # Single-flight: later callers wait on the lookup already in progress
+        task = self._inflight.get(telegram_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load(telegram_id, name))
+            self._inflight[telegram_id] = task
+            task.add_done_callback(lambda t: self._finish(telegram_id, t))
+        # Shield so a cancelled update doesn't abort the lookup other updates are waiting on
+        return await asyncio.shield(task)
+
+user_cache = UserIdentityCache()
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    hist = get_history(target, "telegram_id")
+    for telegram_id in (*hist.deleted, *hist.added, *hist.unchanged):
+        if telegram_id is not None:
+            user_cache.invalidate(telegram_id)
@@ -0,0 +1,22 @@
+import argparse
+import logging
+from database.db import init_db
+from services.columnar_export import export_columnar
+from config import COLUMNAR_EXPORT_DIR
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export meals, workouts, metrics and daily summaries as monthly Parquet/CSV partitions.")
+    parser.add_argument("--out-dir", default=COLUMNAR_EXPORT_DIR, help=f"Output directory (default: {COLUMNAR_EXPORT_DIR})")
+    parser.add_argument("--format", choices=["parquet", "csv"], default=None, help="Default: parquet if pyarrow is installed, else csv")
+    parser.add_argument("--user-id", type=int, default=None, help="Internal user id (default: all users)")
+    parser.add_argument("--full", action="store_true", help="Discard previous output and export everything again")
+    args = parser.parse_args()
+
+    init_db()
+    counts = export_columnar(args.user_id, args.out_dir, args.format, args.full)
+    for table, rows in counts.items():
+        logger.info(f"{table}: {rows} rows written")
@@ -0,0 +1,22 @@
+import argparse
+import asyncio
+import logging
+from datetime import date
+from database.db import init_db
+from bot.recommendations import RecommendationEngine
+from config import PLAN_BATCH_CONCURRENCY, PLAN_BATCH_BUDGET
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate daily plans for active users whose data changed.")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="Plan date (default: today, UTC)")
+    parser.add_argument("--concurrency", type=int, default=PLAN_BATCH_CONCURRENCY)
+    parser.add_argument("--budget", type=int, default=PLAN_BATCH_BUDGET, help="Max Gemini calls this run")
+    args = parser.parse_args()
+
+    init_db()
+    stats = asyncio.run(RecommendationEngine().pregenerate_plans(args.date, args.concurrency, args.budget))
+    logger.info(f"Done: {stats}")
@@ -1,9 +1,11 @@
+import asyncio
 import logging
 import os
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from config import TELEGRAM_BOT_TOKEN
+from config import TELEGRAM_BOT_TOKEN, BOT_MODE, BOT_WORKERS, WEBHOOK_QUEUE_SIZE
 from database.db import init_db
-from bot.handlers import handle_message
+from bot.application import build_application
+from bot.sharding import run_sharded
+from bot.webhook import serve_webhook, config_error as webhook_config_error
 
 # Enable logging
 logging.basicConfig(
@@ -21,19 +23,25 @@ def main():
         logger.error("TELEGRAM_BOT_TOKEN not found in environment variables.")
         return
 
-    # Create the Application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    if BOT_MODE == "webhook" and webhook_config_error():
+        logger.error(webhook_config_error())
+        return
 
-    # Unified message handler for Photos and Text (Conversational)
-    # Note: We can keep a basic /start for new users, but handled conversationally
-    application.add_handler(CommandHandler("start", handle_message)) 
-    
-    # Catch all text and photos
-    application.add_handler(MessageHandler(filters.PHOTO | filters.TEXT, handle_message))
+    # Several worker processes, sharded by user
+    if BOT_WORKERS > 1:
+        asyncio.run(run_sharded())
+        return
+
+    # Create the Application
+    # Bounded ingress in webhook mode: the webhook answers 503 once this many updates are waiting
+    application = build_application(polling=BOT_MODE != "webhook", queue_size=WEBHOOK_QUEUE_SIZE)
 
     # Run the bot
-    logger.info("Bot is polling...")
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        asyncio.run(serve_webhook(application))
+    else:
+        logger.info("Bot is polling...")
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
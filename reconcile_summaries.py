@@ -0,0 +1,28 @@
+import argparse
+import logging
+from database.db import init_db
+from datetime import date
+from services.analytics import backfill_daily_summaries, check_daily_summaries
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or verify DailySummary rows from raw meals/workouts/metrics.")
+    parser.add_argument("--user-id", type=int, action="append", default=None,
+                        help="Internal user id, repeatable (default: all users)")
+    parser.add_argument("--from", dest="start_date", type=date.fromisoformat, default=None, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end_date", type=date.fromisoformat, default=None, help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--check", action="store_true", help="Only compare stored summaries with a rebuild")
+    args = parser.parse_args()
+
+    init_db()
+    if args.check:
+        mismatches = check_daily_summaries(start_date=args.start_date, end_date=args.end_date, user_ids=args.user_id)
+        for user_id, day, field, stored, expected in mismatches:
+            logger.warning(f"user={user_id} date={day} {field}: stored={stored} expected={expected}")
+        logger.info(f"{len(mismatches)} mismatches found.")
+    else:
+        count = backfill_daily_summaries(args.user_id, args.start_date, args.end_date)
+        logger.info(f"Rebuilt {count} daily summary rows.")
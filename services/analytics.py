@@ -1,68 +1,276 @@
 from sqlalchemy import func
-from datetime import datetime, date
-from database.models import Meal, Workout, BodyMetric, DailySummary, User
-from database.db import SessionLocal
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from database.models import Meal, Workout, BodyMetric, DailySummary, PeriodSummary, User
+from database.summaries import rebuild_period_summaries, WEEK, MONTH
+from database.db import SessionLocal, run_db
+
+SUMMARY_FIELDS = [
+    "total_calories_in", "total_calories_out", "total_protein",
+    "total_carbs", "total_fats", "workout_count", "weight_kg",
+]
+
+def _as_date(value):
+    # func.date() comes back as a string on SQLite and as a date on Postgres
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+def day_bounds(start_date: date, end_date: date = None):
+    """
+    Half-open [start, end) datetime range covering start_date..end_date (inclusive).
+    Filter with `timestamp >= start AND timestamp < end` so the (user_id, timestamp) indexes are used.
+    """
+    start = datetime.combine(start_date, datetime.min.time())
+    end = datetime.combine(end_date or start_date, datetime.min.time()) + timedelta(days=1)
+    return start, end
 
 def get_daily_totals(user_id: int, target_date: date = None):
-    """Calculates total calories and macros for a specific date."""
+    """Reads total calories and macros for a specific date from its DailySummary row."""
     if target_date is None:
         target_date = datetime.utcnow().date()
-        
+
     db = SessionLocal()
     try:
-        # Aggregate Meals
-        meals = db.query(
-            func.sum(Meal.calories).label("total_calories"),
-            func.sum(Meal.protein).label("total_protein"),
-            func.sum(Meal.carbs).label("total_carbs"),
-            func.sum(Meal.fats).label("total_fats")
-        ).filter(
-            Meal.user_id == user_id,
-            func.date(Meal.timestamp) == target_date
-        ).first()
-
-        # Aggregate Workouts
-        workouts = db.query(
-            func.count(Workout.id).label("count"),
-            func.sum(Workout.calories_burned).label("total_burned")
-        ).filter(
-            Workout.user_id == user_id,
-            func.date(Workout.timestamp) == target_date
-        ).first()
-
-        # Get latest weight for that day (or most recent)
-        weight_metric = db.query(BodyMetric).filter(
-            BodyMetric.user_id == user_id,
-            func.date(BodyMetric.timestamp) <= target_date
-        ).order_by(BodyMetric.timestamp.desc()).first()
-
-        totals = {
-            "calories_in": meals.total_calories or 0.0,
-            "protein": meals.total_protein or 0.0,
-            "carbs": meals.total_carbs or 0.0,
-            "fats": meals.total_fats or 0.0,
-            "calories_out": workouts.total_burned or 0.0,
-            "workout_count": workouts.count or 0,
-            "weight": weight_metric.weight_kg if weight_metric else None
-        }
-        
-        # Update or Create DailySummary record
         summary = db.query(DailySummary).filter(
             DailySummary.user_id == user_id,
             DailySummary.date == target_date
         ).first()
 
-        if not summary:
-            summary = DailySummary(user_id=user_id, date=target_date)
-            db.add(summary)
+        # Latest weight for that day (or most recent before it)
+        weight = summary.weight_kg if summary else None
+        if weight is None:
+            weight = db.query(DailySummary.weight_kg).filter(
+                DailySummary.user_id == user_id,
+                DailySummary.date <= target_date,
+                DailySummary.weight_kg.isnot(None)
+            ).order_by(DailySummary.date.desc()).limit(1).scalar()
+
+        return {
+            "calories_in": (summary.total_calories_in if summary else 0.0) or 0.0,
+            "protein": (summary.total_protein if summary else 0.0) or 0.0,
+            "carbs": (summary.total_carbs if summary else 0.0) or 0.0,
+            "fats": (summary.total_fats if summary else 0.0) or 0.0,
+            "calories_out": (summary.total_calories_out if summary else 0.0) or 0.0,
+            "workout_count": (summary.workout_count if summary else 0) or 0,
+            "weight": weight
+        }
+    finally:
+        db.close()
+
+async def get_daily_totals_async(user_id: int, target_date: date = None):
+    """Non-blocking variant of get_daily_totals for use inside bot handlers."""
+    return await run_db(get_daily_totals, user_id, target_date)
+
+def _scope(query, model, user_ids=None, start_date: date = None, end_date: date = None):
+    """Filters a Meal/Workout/BodyMetric query by users and an index-friendly [start, end] day range."""
+    if user_ids is not None:
+        query = query.filter(model.user_id.in_(user_ids))
+    if start_date:
+        query = query.filter(model.timestamp >= day_bounds(start_date)[0])
+    if end_date:
+        query = query.filter(model.timestamp < day_bounds(end_date)[1])
+    return query
+
+def _user_ids(user_id=None, user_ids=None):
+    if user_id is not None:
+        return [user_id]
+    return list(user_ids) if user_ids is not None else None
+
+PERIOD_FIELDS = [
+    "days_in_period", "total_calories_in", "total_calories_out", "total_protein", "total_carbs",
+    "total_fats", "workout_count", "avg_calories_in", "avg_protein", "days_logged", "workout_days",
+    "weigh_in_days", "weight_start", "weight_end", "weight_delta",
+]
+
+def get_period_summaries(user_id: int, period: str = WEEK, start_date: date = None, end_date: date = None):
+    """
+    Weekly or monthly rollups (oldest first) overlapping [start_date, end_date], read from
+    PeriodSummary: a year is 12 monthly or 53 weekly rows, whatever the history size.
+    Periods with nothing logged are absent.
+    """
+    if period not in (WEEK, MONTH):
+        raise ValueError(f"period must be '{WEEK}' or '{MONTH}'")
+    db = SessionLocal()
+    try:
+        q = db.query(PeriodSummary).filter(PeriodSummary.user_id == user_id, PeriodSummary.period == period)
+        if start_date:
+            # The period containing start_date begins on or before it
+            q = q.filter(PeriodSummary.period_start > start_date - timedelta(days=31 if period == MONTH else 7))
+        if end_date:
+            q = q.filter(PeriodSummary.period_start <= end_date)
+        result = []
+        for row in q.order_by(PeriodSummary.period_start):
+            if start_date and row.period_start + timedelta(days=row.days_in_period) <= start_date:
+                continue
+            result.append({"period_start": row.period_start, **{f: getattr(row, f) for f in PERIOD_FIELDS}})
+        return result
+    finally:
+        db.close()
+
+async def get_period_summaries_async(user_id: int, period: str = WEEK, start_date: date = None, end_date: date = None):
+    """Non-blocking variant of get_period_summaries for use inside bot handlers."""
+    return await run_db(get_period_summaries, user_id, period, start_date, end_date)
+
+def _aggregate_daily(db, user_id: int = None, start_date: date = None, end_date: date = None, user_ids=None):
+    """
+    Recomputes every (user_id, date) summary from raw rows, one GROUP BY per table.
+    Optionally limited to one user / a list of users and to a day range (inclusive).
+    """
+    user_ids = _user_ids(user_id, user_ids)
+    rows = defaultdict(lambda: {
+        "total_calories_in": 0.0, "total_calories_out": 0.0, "total_protein": 0.0,
+        "total_carbs": 0.0, "total_fats": 0.0, "workout_count": 0, "weight_kg": None,
+    })
 
-        summary.total_calories_in = totals["calories_in"]
-        summary.total_calories_out = totals["calories_out"]
-        summary.total_protein = totals["protein"]
-        summary.workout_count = totals["workout_count"]
-        summary.weight_kg = totals["weight"]
-        
+    # Meals
+    meal_day = func.date(Meal.timestamp)
+    q = db.query(
+        Meal.user_id, meal_day,
+        func.sum(Meal.calories), func.sum(Meal.protein),
+        func.sum(Meal.carbs), func.sum(Meal.fats)
+    )
+    q = _scope(q, Meal, user_ids, start_date, end_date)
+    for uid, day, cals, prot, carbs, fats in q.group_by(Meal.user_id, meal_day):
+        row = rows[(uid, _as_date(day))]
+        row["total_calories_in"] = cals or 0.0
+        row["total_protein"] = prot or 0.0
+        row["total_carbs"] = carbs or 0.0
+        row["total_fats"] = fats or 0.0
+
+    # Workouts
+    workout_day = func.date(Workout.timestamp)
+    q = db.query(
+        Workout.user_id, workout_day,
+        func.count(Workout.id), func.sum(Workout.calories_burned)
+    )
+    q = _scope(q, Workout, user_ids, start_date, end_date)
+    for uid, day, count, burned in q.group_by(Workout.user_id, workout_day):
+        row = rows[(uid, _as_date(day))]
+        row["workout_count"] = count or 0
+        row["total_calories_out"] = burned or 0.0
+
+    # Body metrics: last weight of each day wins
+    q = db.query(BodyMetric.user_id, BodyMetric.timestamp, BodyMetric.weight_kg)
+    q = _scope(q, BodyMetric, user_ids, start_date, end_date)
+    for uid, ts, weight in q.order_by(BodyMetric.timestamp):
+        rows[(uid, ts.date())]["weight_kg"] = weight
+
+    return rows
+
+def get_range_totals(user_id: int, start_date: date, end_date: date = None):
+    """
+    Daily totals for every day in [start_date, end_date] (inclusive), oldest first.
+    Aggregates raw rows with one GROUP BY per table. Days with nothing logged come back as
+    zeros, and weight carries forward from the last weigh-in (like get_daily_totals).
+    """
+    end_date = end_date or datetime.utcnow().date()
+    db = SessionLocal()
+    try:
+        rows = _aggregate_daily(db, user_id, start_date, end_date)
+
+        # Weight going into the range
+        weight = db.query(BodyMetric.weight_kg).filter(
+            BodyMetric.user_id == user_id,
+            BodyMetric.timestamp < day_bounds(start_date)[0]
+        ).order_by(BodyMetric.timestamp.desc()).limit(1).scalar()
+    finally:
+        db.close()
+
+    series = []
+    day = start_date
+    while day <= end_date:
+        row = rows.get((user_id, day))
+        if row and row["weight_kg"] is not None:
+            weight = row["weight_kg"]
+        series.append({
+            "date": day,
+            "calories_in": row["total_calories_in"] if row else 0.0,
+            "protein": row["total_protein"] if row else 0.0,
+            "carbs": row["total_carbs"] if row else 0.0,
+            "fats": row["total_fats"] if row else 0.0,
+            "calories_out": row["total_calories_out"] if row else 0.0,
+            "workout_count": row["workout_count"] if row else 0,
+            "weight": weight,
+        })
+        day += timedelta(days=1)
+    return series
+
+async def get_range_totals_async(user_id: int, start_date: date, end_date: date = None):
+    """Non-blocking variant of get_range_totals for use inside bot handlers."""
+    return await run_db(get_range_totals, user_id, start_date, end_date)
+
+def backfill_daily_summaries(user_ids=None, start_date: date = None, end_date: date = None):
+    """
+    Replaces the DailySummary rows of the given users (default: all) within [start_date, end_date]
+    (default: all time) with values rebuilt from raw rows, in a single transaction.
+    Returns the number of summary rows written.
+    """
+    user_ids = _user_ids(user_ids=user_ids)
+    db = SessionLocal()
+    try:
+        rows = _aggregate_daily(db, start_date=start_date, end_date=end_date, user_ids=user_ids)
+
+        q = db.query(DailySummary)
+        if user_ids is not None:
+            q = q.filter(DailySummary.user_id.in_(user_ids))
+        if start_date:
+            q = q.filter(DailySummary.date >= start_date)
+        if end_date:
+            q = q.filter(DailySummary.date <= end_date)
+        q.delete(synchronize_session=False)
+
+        now = datetime.utcnow()
+        db.bulk_insert_mappings(DailySummary, [
+            {"user_id": uid, "date": day, "updated_at": now, **values}
+            for (uid, day), values in rows.items()
+        ])
+        # Bulk writes skip the flush hook, so re-roll the affected weeks/months here
+        rebuild_period_summaries(db.connection(), user_ids, start_date, end_date)
         db.commit()
-        return totals
+        return len(rows)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def rebuild_daily_summaries(user_id: int = None):
+    """
+    Backfill/reconcile: replaces DailySummary rows with values rebuilt from raw rows.
+    Runs in a single transaction. Returns the number of summary rows written.
+    """
+    return backfill_daily_summaries(_user_ids(user_id))
+
+def check_daily_summaries(user_id: int = None, tolerance: float = 0.01, start_date: date = None,
+                          end_date: date = None, user_ids=None):
+    """
+    Compares stored DailySummary rows with a rebuild from raw rows, without writing.
+    Returns a list of (user_id, date, field, stored, expected) mismatches.
+    """
+    user_ids = _user_ids(user_id, user_ids)
+    db = SessionLocal()
+    try:
+        expected = _aggregate_daily(db, start_date=start_date, end_date=end_date, user_ids=user_ids)
+
+        q = db.query(DailySummary)
+        if user_ids is not None:
+            q = q.filter(DailySummary.user_id.in_(user_ids))
+        if start_date:
+            q = q.filter(DailySummary.date >= start_date)
+        if end_date:
+            q = q.filter(DailySummary.date <= end_date)
+        stored = {(s.user_id, s.date): s for s in q}
+
+        mismatches = []
+        for key in set(expected) | set(stored):
+            summary = stored.get(key)
+            for field in SUMMARY_FIELDS:
+                want = expected[key][field] if key in expected else (None if field == "weight_kg" else 0)
+                have = getattr(summary, field) if summary else (None if field == "weight_kg" else 0)
+                if want is None or have is None:
+                    if want != have:
+                        mismatches.append((*key, field, have, want))
+                elif abs((have or 0) - (want or 0)) > tolerance:
+                    mismatches.append((*key, field, have, want))
+        return mismatches
     finally:
         db.close()
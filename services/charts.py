@@ -0,0 +1,139 @@
+"""
+Report charts rendered with matplotlib's object-oriented API into PNG bytes.
+
+Nothing touches pyplot's global state, so charts can be rendered from several threads or
+processes at once. PNGs are cached by a hash of the plotted data plus CHART_STYLE_VERSION.
+The cache has two tiers: an in-process LRU, and a shared directory on disk written via
+os.replace. Every data change produces a new key, so the disk tier is swept after each
+write down to CHART_CACHE_MAX_FILES, least recently used first (hits refresh a file's mtime).
+Re-exporting unchanged history therefore skips rendering entirely.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from config import CHART_CACHE_DIR, CHART_CACHE_ENTRIES, CHART_CACHE_MAX_FILES
+
+logger = logging.getLogger(__name__)
+
+# Bump when chart styling changes so cached PNGs are not reused
+CHART_STYLE_VERSION = 1
+
+class ChartCache:
+    def __init__(self, directory=CHART_CACHE_DIR, max_entries=CHART_CACHE_ENTRIES, max_files=CHART_CACHE_MAX_FILES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png") if self.directory else None
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        path = self._path(key)
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    png = f.read()
+                os.utime(path)  # recently used: survives the next sweep
+            except OSError:
+                return None
+            self._remember(key, png)
+            return png
+        return None
+
+    def put(self, key, png):
+        self._remember(key, png)
+        path = self._path(key)
+        if not path:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temp file in the same directory, then rename: readers never see a partial PNG
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(png)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write chart cache file: {e}")
+            return
+        self._sweep()
+
+    def _sweep(self):
+        """Removes the least recently used files beyond max_files. Safe to run from several processes."""
+        try:
+            with os.scandir(self.directory) as it:
+                files = [(entry.stat().st_mtime, entry.path) for entry in it if entry.name.endswith(".png")]
+        except OSError:
+            return
+        if len(files) <= self.max_files:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:  # already removed by another worker
+                pass
+
+    def _remember(self, key, png):
+        with self._lock:
+            self._memory[key] = png
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+chart_cache = ChartCache()
+
+def _data_key(kind, *series):
+    payload = json.dumps([kind, CHART_STYLE_VERSION, [[str(v) for v in s] for s in series]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _render(plot, title, ylabel):
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    plot(ax)
+    ax.set_title(title)
+    ax.set_xlabel('Date')
+    ax.set_ylabel(ylabel)
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+def _cached(kind, series, render):
+    key = _data_key(kind, *series)
+    png = chart_cache.get(key)
+    if png is None:
+        png = render()
+        chart_cache.put(key, png)
+    return png
+
+def calories_chart(dates, calories_in, calories_out):
+    """PNG bytes of the 'Calories: In vs Out' line chart."""
+    def plot(ax):
+        ax.plot(dates, calories_in, label='Calories In', marker='o', color='skyblue')
+        ax.plot(dates, calories_out, label='Calories Out', marker='x', color='salmon')
+        ax.legend()
+    return _cached("calories", (dates, calories_in, calories_out),
+                   lambda: _render(plot, 'Calories: In vs Out', 'Calories'))
+
+def weight_chart(dates, weights):
+    """PNG bytes of the 'Weight Trend' line chart (days without a weigh-in already removed)."""
+    def plot(ax):
+        ax.plot(dates, weights, color='green', marker='s', linestyle='-')
+    return _cached("weight", (dates, weights),
+                   lambda: _render(plot, 'Weight Trend', 'Weight (kg)'))
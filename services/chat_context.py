@@ -0,0 +1,137 @@
+"""
+Per-user cache of the data context sent with chat prompts.
+
+An entry holds today's totals, the last few meals and workouts and the trend figures,
+already formatted for the prompt. It stays valid until that user's meals, workouts or
+body metrics change: the flush hook below notes which users were touched, and their
+entries are dropped once the transaction commits. It also expires when the day changes.
+A chat message with nothing new logged therefore does no DB work at all.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import CHAT_CONTEXT_CACHE_SIZE
+from database.db import SessionLocal, run_db
+from database.models import Meal, Workout, BodyMetric
+from services.analytics import get_daily_totals
+from services.trends import user_trend_summary, format_trends
+
+logger = logging.getLogger(__name__)
+
+RECENT_DAYS = 3
+RECENT_ITEMS = 5
+WATCHED_MODELS = (Meal, Workout, BodyMetric)
+
+def _recent_items(user_id):
+    db = SessionLocal()
+    try:
+        since = datetime.utcnow() - timedelta(days=RECENT_DAYS)
+        meals = db.query(Meal.food_name, Meal.calories).filter(
+            Meal.user_id == user_id, Meal.timestamp >= since
+        ).order_by(Meal.timestamp.desc()).limit(RECENT_ITEMS).all()
+        workouts = db.query(Workout.exercise_name, Workout.duration_minutes).filter(
+            Workout.user_id == user_id, Workout.timestamp >= since
+        ).order_by(Workout.timestamp.desc()).limit(RECENT_ITEMS).all()
+        return meals, workouts
+    finally:
+        db.close()
+
+def build_context(user_id):
+    """Formats the prompt context from the DB. Blocking."""
+    totals = get_daily_totals(user_id)
+    meals, workouts = _recent_items(user_id)
+    context = (
+        f"Date: {datetime.now().strftime('%A, %d %b')}\n"
+        f"Today's Stats:\n"
+        f"- Calories: {totals['calories_in']:.0f} In / {totals['calories_out']:.0f} Out\n"
+        f"- Protein: {totals['protein']:.1f}g\n"
+        f"- Workouts: {totals['workout_count']}\n"
+        f"- Current Weight: {totals['weight'] or 'Unknown'} kg"
+    )
+    if meals:
+        context += "\nRecent Meals: " + ", ".join(f"{name} ({cals or 0:.0f} cal)" for name, cals in meals)
+    if workouts:
+        context += "\nRecent Workouts: " + ", ".join(
+            f"{name} ({minutes:g} min)" if minutes else name for name, minutes in workouts)
+    trend_lines = format_trends(user_trend_summary(user_id))
+    if trend_lines:
+        context += f"\nTrends:\n{trend_lines}"
+    return context
+
+class ChatContextCache:
+    def __init__(self, maxsize=CHAT_CONTEXT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # user_id -> (day, context)
+        # Bumped on every invalidation, so a build that raced a write is not stored
+        self._versions = {}
+        # Invalidation fires from DB worker threads, lookups from the event loop
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, day):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] != day:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def version(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def put(self, user_id, day, context, version):
+        with self._lock:
+            if self._versions.get(user_id, 0) != version:
+                return  # the user's data changed while this context was being built
+            self._entries[user_id] = (day, context)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for user_id in self._versions:
+                self._versions[user_id] += 1
+
+    async def get_context(self, user_id):
+        """The user's prompt context, built (on the DB pool) only if their data changed."""
+        day = datetime.utcnow().date()
+        context = self.get(user_id, day)
+        if context is None:
+            version = self.version(user_id)
+            context = await run_db(build_context, user_id)
+            self.put(user_id, day, context, version)
+        return context
+
+chat_context_cache = ChatContextCache()
+
+@event.listens_for(Session, "after_flush")
+def _note_touched_users(session, flush_context):
+    touched = session.info.setdefault("chat_context_users", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, WATCHED_MODELS) and obj.user_id is not None:
+            touched.add(obj.user_id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_touched_users(session):
+    touched = session.info.pop("chat_context_users", None)
+    if touched:
+        chat_context_cache.invalidate(touched)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_touched_users(session):
+    session.info.pop("chat_context_users", None)
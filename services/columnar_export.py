@@ -0,0 +1,223 @@
+"""
+Columnar bulk export for analysis: meals, workouts, body metrics and daily summaries,
+written as Parquet (CSV when pyarrow is not installed) and partitioned by month:
+
+    <out_dir>/meals/month=2024-05/part-<run>-0000.parquet
+
+Runs are incremental at month granularity. Meals, workouts and body metrics can be edited
+and deleted, so every month with a change since the last run is rewritten as a whole in
+all four tables, which keeps the datasets consistent with each other. The change marker is
+DailySummary.updated_at: the flush hook touches the summary row of every day whose
+meals, workouts or metrics were inserted, updated or deleted. Changes are re-read from
+CHANGE_LAG before the previous run, so a transaction that committed late is still picked up.
+Rewriting a month twice is harmless. The watermark is kept in <out_dir>/_export_state.json.
+Pass full=True to start over; that deletes only the table directories and the state file,
+never anything else in <out_dir>. Rows without a timestamp are not exported.
+"""
+import csv
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, Integer, Float, DateTime, Date
+from config import COLUMNAR_EXPORT_DIR
+from database.db import SessionLocal
+from database.models import Meal, Workout, BodyMetric, DailySummary
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # CSV output without pyarrow
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "_export_state.json"
+STATE_VERSION = 2  # 1: per-table id watermarks (append-only export)
+BATCH_ROWS = 50_000
+CHANGE_LAG = timedelta(minutes=10)  # longer than any write transaction
+EXCLUDED_COLUMNS = {"image_path"}  # local file paths mean nothing to analysts
+
+# Exported table -> (model, column its month is taken from)
+TABLES = {
+    "meals": (Meal, Meal.timestamp),
+    "workouts": (Workout, Workout.timestamp),
+    "body_metrics": (BodyMetric, BodyMetric.timestamp),
+    "daily_summaries": (DailySummary, DailySummary.date),
+}
+
+def _month_start(month):
+    return datetime.strptime(month, "%Y-%m").date()
+
+def _next_month(start):
+    return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+def _columns(model):
+    return [c for c in model.__table__.columns if c.name not in EXCLUDED_COLUMNS]
+
+def _arrow_schema(columns):
+    """Explicit schema so every part file agrees, even when a batch is all NULL in some column."""
+    types = []
+    for c in columns:
+        if isinstance(c.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(c.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(c.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(c.type, Date):
+            arrow_type = pa.date32()
+        else:  # String, Text
+            arrow_type = pa.string()
+        types.append(pa.field(c.name, arrow_type))
+    return pa.schema(types)
+
+class ColumnarExporter:
+    def __init__(self, out_dir=COLUMNAR_EXPORT_DIR, fmt=None):
+        self.out_dir = out_dir
+        self.fmt = fmt or ("parquet" if pa is not None else "csv")
+        if fmt is None and pa is None:
+            logger.warning("pyarrow is not installed; writing CSV instead of Parquet")
+        if self.fmt == "parquet" and pa is None:
+            raise RuntimeError("Parquet export needs pyarrow; install it or use fmt='csv'")
+        self.run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")  # unique per run: parts never overwrite
+        self._parts = 0
+
+    def _state_path(self):
+        return os.path.join(self.out_dir, STATE_FILE)
+
+    def load_state(self):
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def clear(self):
+        """Removes this exporter's output (table directories and state file) from out_dir."""
+        for table in TABLES:
+            shutil.rmtree(os.path.join(self.out_dir, table), ignore_errors=True)
+        for name in (STATE_FILE, STATE_FILE + ".tmp"):
+            try:
+                os.remove(os.path.join(self.out_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def save_state(self, state):
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp = self._state_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp, self._state_path())
+
+    def _write(self, path, columns, rows):
+        """Writes one file atomically (temp name, then rename), so readers never see partial parts."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        if self.fmt == "parquet":
+            names = [c.name for c in columns]
+            table = pa.Table.from_pylist([dict(zip(names, row)) for row in rows], schema=_arrow_schema(columns))
+            pq.write_table(table, tmp, compression="zstd")
+        else:
+            with open(tmp, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow([c.name for c in columns])
+                writer.writerows(rows)
+        os.replace(tmp, path)
+
+    def _part_path(self, table, month):
+        self._parts += 1
+        return os.path.join(self.out_dir, table, f"month={month}", f"part-{self.run_id}-{self._parts:04d}.{self.fmt}")
+
+    def _months_with_rows(self, db, user_id):
+        """Every month between the earliest and latest row of any table (first or full run)."""
+        months = set()
+        for model, column in TABLES.values():
+            stmt = select(func.min(column), func.max(column))
+            if user_id is not None:
+                stmt = stmt.where(model.user_id == user_id)
+            first, last = db.execute(stmt).one()
+            if first is None:
+                continue
+            first, last = (v.date() if isinstance(v, datetime) else v for v in (first, last))
+            month = first.replace(day=1)
+            while month <= last:
+                months.add(month.strftime("%Y-%m"))
+                month = _next_month(month)
+        return months
+
+    def changed_months(self, db, since, user_id=None):
+        """Months with a meal, workout, metric or summary change after `since` (ISO timestamp)."""
+        if since is None:
+            return self._months_with_rows(db, user_id)
+        stmt = select(DailySummary.date).where(
+            DailySummary.updated_at > datetime.fromisoformat(since) - CHANGE_LAG
+        ).distinct()
+        if user_id is not None:
+            stmt = stmt.where(DailySummary.user_id == user_id)
+        return {day.strftime("%Y-%m") for day in db.scalars(stmt)}
+
+    def export_month(self, db, table, month, user_id=None):
+        """Replaces one month partition of a table with its current rows. Returns rows written."""
+        model, column = TABLES[table]
+        columns = _columns(model)
+        start = _month_start(month)
+        end = _next_month(start)
+        if isinstance(column.type, DateTime):
+            start, end = datetime.combine(start, datetime.min.time()), datetime.combine(end, datetime.min.time())
+        stmt = select(*columns).where(column >= start, column < end)
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        stmt = stmt.order_by(model.id).execution_options(yield_per=BATCH_ROWS, stream_results=True)
+
+        month_dir = os.path.join(self.out_dir, table, f"month={month}")
+        old_parts = set(os.listdir(month_dir)) if os.path.isdir(month_dir) else set()
+        written, batch = 0, []
+        for row in db.execute(stmt):
+            batch.append(tuple(row))
+            if len(batch) >= BATCH_ROWS:
+                self._write(self._part_path(table, month), columns, batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            self._write(self._part_path(table, month), columns, batch)
+            written += len(batch)
+
+        # New parts first, then drop the old ones (the month disappears if it has no rows left)
+        for name in old_parts:
+            os.remove(os.path.join(month_dir, name))
+        if not written and os.path.isdir(month_dir):
+            os.rmdir(month_dir)
+        return written
+
+    def run(self, user_id=None, full=False):
+        """Rewrites every month changed since the last run. Returns {table: rows written}."""
+        if full:
+            self.clear()
+        state = self.load_state()
+        if state and state.get("version") != STATE_VERSION:
+            raise ValueError(f"{self.out_dir} was written by an older exporter; rerun with full=True")
+        if state.get("format", self.fmt) != self.fmt or state.get("user_id", user_id) != user_id:
+            raise ValueError(f"{self.out_dir} holds a different export (format/user); use full=True or another directory")
+
+        counts = dict.fromkeys(TABLES, 0)
+        db = SessionLocal()
+        try:
+            started = datetime.utcnow()
+            months = sorted(self.changed_months(db, state.get("changed_since"), user_id))
+            for month in months:
+                for table in TABLES:
+                    counts[table] += self.export_month(db, table, month, user_id)
+        finally:
+            db.close()
+
+        state.update({"version": STATE_VERSION, "format": self.fmt, "user_id": user_id,
+                      "changed_since": started.isoformat(), "last_run": self.run_id})
+        self.save_state(state)
+        logger.info(f"Columnar export ({self.fmt}) to {self.out_dir}: {len(months)} months rewritten, {counts}")
+        return counts
+
+def export_columnar(user_id=None, out_dir=COLUMNAR_EXPORT_DIR, fmt=None, full=False):
+    """Incremental Parquet/CSV export partitioned by month. Returns rows written per table."""
+    return ColumnarExporter(out_dir, fmt).run(user_id=user_id, full=full)
@@ -1,26 +1,47 @@
+import io
 import pandas as pd
-import matplotlib.pyplot as plt
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
+from openpyxl.chart import LineChart, Reference
 from openpyxl.drawing.image import Image as ExcelImage
 import os
+from sqlalchemy import select
 from database.db import SessionLocal
 from database.models import Workout, Meal, DailySummary
+from services.analytics import day_bounds
+from services.charts import calories_chart, weight_chart
 
-# Set non-interactive backend for matplotlib
-plt.switch_backend('Agg')
+# Rows fetched per round trip by the streaming export (server-side cursor on PostgreSQL)
+STREAM_BATCH_ROWS = 1000
 
-def generate_excel_report(user_id):
-    """Generates an Excel report with data sheets and charts."""
+SUMMARY_HEADERS = ["Date", "Calories In", "Calories Out", "Protein (g)", "Weight (kg)"]
+MEAL_HEADERS = ["Time", "Food", "Calories", "Protein", "Carbs", "Fats", "Notes"]
+WORKOUT_HEADERS = ["Time", "Exercise", "Sets", "Reps", "Calories Burned", "Notes"]
+
+def _in_range(query, model, user_id, start_date=None, end_date=None):
+    """Filters a Meal/Workout query (or select()) by user and an index-friendly timestamp range."""
+    query = query.filter(model.user_id == user_id)
+    if start_date:
+        query = query.filter(model.timestamp >= day_bounds(start_date)[0])
+    if end_date:
+        query = query.filter(model.timestamp < day_bounds(end_date)[1])
+    return query
+
+def generate_excel_report(user_id, start_date=None, end_date=None):
+    """Generates an Excel report with data sheets and charts, optionally limited to a date range."""
     # Ensure directories exist
     os.makedirs("exports", exist_ok=True)
-    os.makedirs("images/plots", exist_ok=True)
     
     filename = f"exports/fitness_report_{user_id}.xlsx"
     db = SessionLocal()
     
     try:
         # 1. Fetch Daily Summary Data
-        summaries = db.query(DailySummary).filter(DailySummary.user_id == user_id).order_by(DailySummary.date).all()
+        summary_query = db.query(DailySummary).filter(DailySummary.user_id == user_id)
+        if start_date:
+            summary_query = summary_query.filter(DailySummary.date >= start_date)
+        if end_date:
+            summary_query = summary_query.filter(DailySummary.date <= end_date)
+        summaries = summary_query.order_by(DailySummary.date).all()
         data_summary = [{
             "Date": s.date, 
             "Calories In": s.total_calories_in, 
@@ -31,7 +52,7 @@ def generate_excel_report(user_id):
         df_summary = pd.DataFrame(data_summary)
         
         # 2. Fetch Meals Data
-        meals = db.query(Meal).filter(Meal.user_id == user_id).order_by(Meal.timestamp).all()
+        meals = _in_range(db.query(Meal), Meal, user_id, start_date, end_date).order_by(Meal.timestamp).all()
         data_meals = [{
             "Time": m.timestamp.strftime("%Y-%m-%d %H:%M"),
             "Food": m.food_name,
@@ -44,7 +65,7 @@ def generate_excel_report(user_id):
         df_meals = pd.DataFrame(data_meals)
 
         # 3. Fetch Workouts Data
-        workouts = db.query(Workout).filter(Workout.user_id == user_id).order_by(Workout.timestamp).all()
+        workouts = _in_range(db.query(Workout), Workout, user_id, start_date, end_date).order_by(Workout.timestamp).all()
         data_workouts = [{
             "Time": w.timestamp.strftime("%Y-%m-%d %H:%M"),
             "Exercise": w.exercise_name,
@@ -73,44 +94,15 @@ def generate_excel_report(user_id):
             wb = load_workbook(filename)
             ws = wb['Summary']
             
-            # Plot 1: Calories In vs Out
-            plt.figure(figsize=(10, 6))
-            plt.plot(df_summary['Date'], df_summary['Calories In'], label='Calories In', marker='o', color='skyblue')
-            plt.plot(df_summary['Date'], df_summary['Calories Out'], label='Calories Out', marker='x', color='salmon')
-            plt.title('Calories: In vs Out')
-            plt.xlabel('Date')
-            plt.ylabel('Calories')
-            plt.legend()
-            plt.grid(True, linestyle='--', alpha=0.7)
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            
-            plot_path_cals = f"images/plots/cals_{user_id}.png"
-            plt.savefig(plot_path_cals)
-            plt.close()
-            
-            # Insert into Excel
-            img = ExcelImage(plot_path_cals)
-            ws.add_image(img, 'H2') # Place next to data
+            # Plot 1: Calories In vs Out (rendered off pyplot, cached by the plotted data)
+            png = calories_chart(list(df_summary['Date']), list(df_summary['Calories In']), list(df_summary['Calories Out']))
+            ws.add_image(ExcelImage(io.BytesIO(png)), 'H2') # Place next to data
             
             # Plot 2: Weight Trend
             valid_weight = df_summary.dropna(subset=['Weight (kg)'])
             if not valid_weight.empty:
-                plt.figure(figsize=(10, 6))
-                plt.plot(valid_weight['Date'], valid_weight['Weight (kg)'], color='green', marker='s', linestyle='-')
-                plt.title('Weight Trend')
-                plt.xlabel('Date')
-                plt.ylabel('Weight (kg)')
-                plt.grid(True, linestyle='--', alpha=0.7)
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                
-                plot_path_weight = f"images/plots/weight_{user_id}.png"
-                plt.savefig(plot_path_weight)
-                plt.close()
-                
-                img2 = ExcelImage(plot_path_weight)
-                ws.add_image(img2, 'H35') # Place below the first chart
+                png = weight_chart(list(valid_weight['Date']), list(valid_weight['Weight (kg)']))
+                ws.add_image(ExcelImage(io.BytesIO(png)), 'H35') # Place below the first chart
 
             wb.save(filename)
             
@@ -118,3 +110,110 @@ def generate_excel_report(user_id):
 
     finally:
         db.close()
+
+def report_charts(user_id, start_date=None, end_date=None):
+    """
+    PNG previews of the report's charts as (caption, png) pairs, sent to the chat next to the
+    workbook. They come from the chart cache, so re-exporting unchanged history renders nothing.
+    """
+    db = SessionLocal()
+    try:
+        stmt = select(
+            DailySummary.date, DailySummary.total_calories_in, DailySummary.total_calories_out, DailySummary.weight_kg
+        ).where(DailySummary.user_id == user_id)
+        if start_date:
+            stmt = stmt.where(DailySummary.date >= start_date)
+        if end_date:
+            stmt = stmt.where(DailySummary.date <= end_date)
+        rows = db.execute(stmt.order_by(DailySummary.date)).all()
+    finally:
+        db.close()
+    if not rows:
+        return []
+
+    dates = [r.date for r in rows]
+    charts = [("Calories: In vs Out", calories_chart(
+        dates, [r.total_calories_in or 0 for r in rows], [r.total_calories_out or 0 for r in rows]))]
+    weighed = [r for r in rows if r.weight_kg is not None]
+    if weighed:
+        charts.append(("Weight Trend", weight_chart([r.date for r in weighed], [r.weight_kg for r in weighed])))
+    return charts
+
+def _stream_rows(db, stmt):
+    """Yields plain row tuples in batches; nothing is held beyond the current batch."""
+    result = db.execute(stmt.execution_options(yield_per=STREAM_BATCH_ROWS, stream_results=True))
+    for row in result:
+        yield row
+
+def _line_chart(ws, title, y_title, columns, rows, anchor):
+    """Native Excel line chart over Summary columns, dates (column A) as categories."""
+    chart = LineChart()
+    chart.title = title
+    chart.x_axis.title = "Date"
+    chart.y_axis.title = y_title
+    chart.width, chart.height = 24, 12
+    for col in columns:
+        chart.add_data(Reference(ws, min_col=col, min_row=1, max_row=rows + 1), titles_from_data=True)
+    chart.set_categories(Reference(ws, min_col=1, min_row=2, max_row=rows + 1))
+    ws.add_chart(chart, anchor)
+
+def generate_excel_report_streaming(user_id, start_date=None, end_date=None, filename=None):
+    """
+    Same report as generate_excel_report, in constant memory and a single pass.
+    Rows are read as column tuples with yield_per and appended straight to a write-only workbook.
+    The charts are native Excel charts that reference the Summary cells, so no images
+    are rendered and the file is never re-opened.
+    """
+    os.makedirs("exports", exist_ok=True)
+    filename = filename or f"exports/fitness_report_{user_id}.xlsx"
+    wb = Workbook(write_only=True)
+    db = SessionLocal()
+
+    try:
+        # 1. Summary (one row per day) + charts over the written range
+        ws = wb.create_sheet("Summary")
+        ws.append(SUMMARY_HEADERS)
+        stmt = select(
+            DailySummary.date, DailySummary.total_calories_in, DailySummary.total_calories_out,
+            DailySummary.total_protein, DailySummary.weight_kg
+        ).where(DailySummary.user_id == user_id)
+        if start_date:
+            stmt = stmt.where(DailySummary.date >= start_date)
+        if end_date:
+            stmt = stmt.where(DailySummary.date <= end_date)
+
+        days, has_weight = 0, False
+        for row in _stream_rows(db, stmt.order_by(DailySummary.date)):
+            ws.append(list(row))
+            days += 1
+            has_weight = has_weight or row.weight_kg is not None
+
+        if days:
+            _line_chart(ws, "Calories: In vs Out", "Calories", [2, 3], days, "H2")
+            if has_weight:
+                _line_chart(ws, "Weight Trend", "Weight (kg)", [5], days, "H35")
+        else:
+            ws.append(["No summary data yet"])
+
+        # 2. Meals, 3. Workouts (sheets only created when there is data, like the pandas export)
+        meal_stmt = _in_range(select(
+            Meal.timestamp, Meal.food_name, Meal.calories, Meal.protein, Meal.carbs, Meal.fats, Meal.notes
+        ), Meal, user_id, start_date, end_date).order_by(Meal.timestamp)
+        workout_stmt = _in_range(select(
+            Workout.timestamp, Workout.exercise_name, Workout.sets, Workout.reps,
+            Workout.calories_burned, Workout.notes
+        ), Workout, user_id, start_date, end_date).order_by(Workout.timestamp)
+
+        for title, headers, stmt in (("Meals", MEAL_HEADERS, meal_stmt), ("Workouts", WORKOUT_HEADERS, workout_stmt)):
+            sheet = None
+            for timestamp, *rest in _stream_rows(db, stmt):
+                if sheet is None:
+                    sheet = wb.create_sheet(title)
+                    sheet.append(headers)
+                sheet.append([timestamp.strftime("%Y-%m-%d %H:%M"), *rest])
+
+        wb.save(filename)
+        return filename
+
+    finally:
+        db.close()
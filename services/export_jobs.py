@@ -0,0 +1,178 @@
+"""
+Background export jobs.
+
+Excel reports, plus PNG previews of their charts from the chart cache, are rendered in a
+process pool, so neither the event loop nor the GIL is held by openpyxl or matplotlib. A user
+has at most one job in flight (asking again returns the running job), and at most
+EXPORT_WORKERS jobs render at once. The finished file is sent back to the chat as a document,
+followed by the chart images. Recent jobs keep their status and timings for /export status.
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from telegram import InputMediaPhoto
+from config import EXPORT_WORKERS, EXPORT_MAX_QUEUED
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+def _render(user_id, start_date, end_date):
+    """Runs in a worker process. Returns the workbook path and the (caption, png) chart previews."""
+    from services.export import generate_excel_report_streaming, report_charts
+    filename = generate_excel_report_streaming(user_id, start_date, end_date)
+    return filename, report_charts(user_id, start_date, end_date)
+
+class ExportJob:
+    def __init__(self, job_id, user_id, chat_id, start_date=None, end_date=None):
+        self.id = job_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.status = QUEUED
+        self.filename = None
+        self.error = None
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def wait_seconds(self):
+        end = self.started_at or time.monotonic()
+        return end - self.created_at
+
+    @property
+    def render_seconds(self):
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def snapshot(self):
+        render = self.render_seconds
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "wait_s": round(self.wait_seconds, 2),
+            "render_s": round(render, 2) if render is not None else None,
+            "error": self.error,
+        }
+
+class ExportQueue:
+    def __init__(self, workers=EXPORT_WORKERS, max_queued=EXPORT_MAX_QUEUED, history=200):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._pool = None
+        self._slots = None
+        self._ids = itertools.count(1)
+        self._active = {}  # user_id -> job in flight
+        self._tasks = set()
+        self._history = deque(maxlen=history)
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn: workers start clean instead of inheriting the bot's threads and DB connections
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._pool
+
+    def submit(self, bot, user_id, chat_id, start_date=None, end_date=None):
+        """
+        Queues an export and returns (job, created). While the user already has a job in flight,
+        that job is returned with created=False. Returns (None, False) when the queue is full.
+        """
+        job = self._active.get(user_id)
+        if job is not None:
+            return job, False
+        if len(self._active) >= self.max_queued:
+            return None, False
+
+        job = ExportJob(next(self._ids), user_id, chat_id, start_date, end_date)
+        self._active[user_id] = job
+        task = asyncio.get_running_loop().create_task(self._run(bot, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job, True
+
+    async def _run(self, bot, job):
+        pool = self._get_pool()
+        try:
+            async with self._slots:
+                job.status = RUNNING
+                job.started_at = time.monotonic()
+                loop = asyncio.get_running_loop()
+                job.filename, charts = await loop.run_in_executor(
+                    pool, _render, job.user_id, job.start_date, job.end_date)
+            job.finished_at = time.monotonic()
+
+            # 2. Deliver back to the chat
+            with open(job.filename, "rb") as document:
+                await bot.send_document(chat_id=job.chat_id, document=document,
+                                        filename=os.path.basename(job.filename),
+                                        caption="📊 Your fitness report is ready!")
+            await self._send_charts(bot, job, charts)
+            job.status = DONE
+            logger.info(f"Export {job.id} for user {job.user_id} done: waited {job.wait_seconds:.1f}s, "
+                        f"rendered in {job.render_seconds:.1f}s")
+        except Exception as e:
+            job.finished_at = job.finished_at or time.monotonic()
+            job.status = FAILED
+            job.error = str(e)
+            logger.error(f"Export {job.id} for user {job.user_id} failed: {e}")
+            try:
+                await bot.send_message(chat_id=job.chat_id, text="Sorry, I couldn't build your report. Try again later.")
+            except Exception as send_error:
+                logger.warning(f"Could not report export failure: {send_error}")
+        finally:
+            self._active.pop(job.user_id, None)
+            self._history.append(job)
+
+    @staticmethod
+    async def _send_charts(bot, job, charts):
+        """Chart previews are a bonus: failing to send them does not fail the export."""
+        try:
+            if len(charts) > 1:
+                await bot.send_media_group(chat_id=job.chat_id, media=[
+                    InputMediaPhoto(png, caption=caption) for caption, png in charts])
+            elif charts:
+                caption, png = charts[0]
+                await bot.send_photo(chat_id=job.chat_id, photo=png, caption=caption)
+        except Exception as e:
+            logger.warning(f"Could not send charts for export {job.id}: {e}")
+
+    def status(self, user_id):
+        """The user's in-flight job, else their most recent finished one, else None."""
+        job = self._active.get(user_id)
+        if job is not None:
+            return job
+        for job in reversed(self._history):
+            if job.user_id == user_id:
+                return job
+        return None
+
+    def stats(self):
+        finished = [job for job in self._history if job.status == DONE]
+        renders = sorted(job.render_seconds for job in finished)
+        return {
+            "in_flight": len(self._active),
+            "running": sum(1 for job in self._active.values() if job.status == RUNNING),
+            "done": len(finished),
+            "failed": sum(1 for job in self._history if job.status == FAILED),
+            "avg_wait_s": round(sum(job.wait_seconds for job in finished) / len(finished), 2) if finished else 0.0,
+            "p95_render_s": round(renders[min(len(renders) - 1, int(len(renders) * 0.95))], 2) if renders else 0.0,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+export_queue = ExportQueue()
@@ -0,0 +1,169 @@
+"""
+Local nutrition table with a prebuilt lookup index.
+
+Foods (macros per 100g) are loaded once from a CSV or SQLite file and indexed by
+token, so a lookup only scores the entries that share a word with the query instead
+of scanning the whole table. Misspelled words are corrected against the vocabulary
+with a character-trigram index before the token lookup.
+"""
+import csv
+import logging
+import math
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from config import FOOD_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {"a", "an", "and", "of", "with", "the", "some", "my", "for", "in", "on", "to"}
+MIN_FUZZY_TOKEN = 4  # shorter words must match exactly
+FUZZY_THRESHOLD = 0.6  # trigram Dice similarity needed to correct a word
+
+def _stem(token):
+    """Very small plural folding: 'eggs' -> 'egg', 'berries' -> 'berry', 'potatoes' -> 'potato'."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith("oes"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text):
+    words = re.findall(r"[a-z]+", text.lower())
+    return [_stem(w) for w in words if w not in STOPWORDS]
+
+def _trigrams(token):
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class FoodDatabase:
+    def __init__(self, foods):
+        """
+        foods: iterable of (name, {"cals", "prot", "carbs", "fat", "piece", "cup"}) pairs; "piece" is
+        grams per item and "cup" grams per US cup (None when the food is not measured by volume).
+        """
+        self.names = []
+        self.entries = []
+        self._exact = {}
+        self._token_count = []
+        self._postings = defaultdict(list)
+        self._vocab_trigrams = defaultdict(list)
+
+        for name, macros in foods:
+            idx = len(self.names)
+            tokens = set(tokenize(name))
+            if not tokens:
+                continue
+            self.names.append(name)
+            self.entries.append(macros)
+            self._exact.setdefault(" ".join(tokenize(name)), idx)
+            self._token_count.append(len(tokens))
+            for token in tokens:
+                self._postings[token].append(idx)
+
+        total = max(len(self.names), 1)
+        self._idf = {t: math.log(1 + total / len(p)) for t, p in self._postings.items()}
+        for token in self._postings:
+            for gram in _trigrams(token):
+                self._vocab_trigrams[gram].append(token)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        return cls((r["name"].strip().lower(), _macros(r)) for r in rows if r.get("name"))
+
+    @classmethod
+    def from_sqlite(cls, path, table="foods"):
+        conn = sqlite3.connect(path)
+        try:
+            conn.row_factory = sqlite3.Row
+            rows = [dict(r) for r in conn.execute(f"SELECT * FROM {table}")]
+        finally:
+            conn.close()
+        return cls((r["name"].strip().lower(), _macros(r)) for r in rows if r["name"])
+
+    @classmethod
+    def load(cls, path=FOOD_DB_PATH, fallback=None):
+        """Loads the table from a .csv or .db/.sqlite file; uses `fallback` (dict) if the file is missing."""
+        if path and os.path.exists(path):
+            if path.endswith((".db", ".sqlite", ".sqlite3")):
+                db = cls.from_sqlite(path)
+            else:
+                db = cls.from_csv(path)
+            logger.info(f"Loaded {len(db)} foods from {path}")
+            return db
+        logger.warning(f"Food database {path} not found, using built-in foods")
+        return cls((fallback or {}).items())
+
+    def _correct(self, token):
+        """Maps an unknown word to the closest vocabulary word, or None."""
+        if token in self._postings:
+            return token
+        if len(token) < MIN_FUZZY_TOKEN:
+            return None
+        grams = _trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for word in self._vocab_trigrams.get(gram, ()):
+                shared[word] += 1
+        best, best_score = None, FUZZY_THRESHOLD
+        for word, count in shared.items():
+            score = 2 * count / (len(grams) + len(word))  # a word has len(word) padded trigrams
+            if score > best_score:
+                best, best_score = word, score
+        return best
+
+    def lookup(self, query, min_coverage=0.0):
+        """
+        Returns (name, macros) for the best match of a free-text food name, or None.
+        Ranking: weight (IDF) of matched words, then the share of the entry's words matched,
+        then the shorter name. `min_coverage` is the share of query words the match must explain.
+        """
+        tokens = tokenize(query)
+        exact = self._exact.get(" ".join(tokens))
+        if exact is not None:
+            return self.names[exact], self.entries[exact]
+
+        scores = defaultdict(float)
+        hits = defaultdict(int)
+        for token in dict.fromkeys(filter(None, map(self._correct, tokens))):
+            weight = self._idf[token]
+            for idx in self._postings[token]:
+                scores[idx] += weight
+                hits[idx] += 1
+        if not scores:
+            return None
+
+        best = max(scores, key=lambda i: (scores[i], hits[i] / self._token_count[i], -len(self.names[i])))
+        if hits[best] < min_coverage * len(set(tokens)):
+            return None
+        return self.names[best], self.entries[best]
+
+def _optional(value):
+    return float(value) if value not in (None, "") else None
+
+def _macros(row):
+    return {
+        "cals": float(row["calories"] or 0),
+        "prot": float(row["protein"] or 0),
+        "carbs": float(row["carbs"] or 0),
+        "fat": float(row["fat"] or 0),
+        "piece": _optional(row.get("piece_grams")),
+        "cup": _optional(row.get("cup_grams")),
+    }
+
+_food_db = None
+
+def get_food_db(fallback=None):
+    """Process-wide FoodDatabase, loaded on first use."""
+    global _food_db
+    if _food_db is None:
+        _food_db = FoodDatabase.load(FOOD_DB_PATH, fallback=fallback)
+    return _food_db
@@ -3,6 +3,9 @@ import logging
 import json
 import asyncio
 from config import GEMINI_API_KEY
+from services.vision_cache import vision_cache
+from services.rate_limiter import INTERACTIVE
+from services.llm_client import LLMClient, LLMError, RateLimited
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -10,38 +13,32 @@ logger = logging.getLogger(__name__)
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
 
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
 class GeminiService:
     def __init__(self):
         # Use flash model for speed and cost efficiency
         self.model = genai.GenerativeModel('gemini-2.0-flash')
         self.vision_model = genai.GenerativeModel('gemini-2.0-flash')
+        self.llm = LLMClient(self.model.generate_content, name="gemini")
 
-    async def _generate_with_retry(self, inputs):
-        """Helper to run generation with retry logic."""
-        max_retries = 2
-        delay = 5 
-
-        for attempt in range(max_retries):
-            try:
-                await asyncio.sleep(2) # Throttle to prevent rate limits
-                response = await asyncio.to_thread(self.model.generate_content, inputs)
-                return response
-            except Exception as e:
-                error_str = str(e)
-                if "429" in error_str or "quota" in error_str.lower():
-                    logger.warning(f"Rate limit hit on attempt {attempt+1}")
-                    if attempt == max_retries - 1:
-                        return "RATE_LIMIT"
-                else:
-                    logger.warning(f"Gemini API attempt {attempt+1} failed: {e}")
-                
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(delay)
-        return None
+    async def _generate(self, inputs, priority=INTERACTIVE):
+        """Runs generation through the shared LLM client. Returns the response, "RATE_LIMIT" or None."""
+        try:
+            return await self.llm.generate(inputs, priority=priority)
+        except RateLimited:
+            return "RATE_LIMIT"
+        except LLMError as e:
+            logger.warning(f"Gemini call failed: {e}")
+            return None
 
-    async def analyze_image(self, image_path, caption=""):
+    async def analyze_image(self, image, caption="", user_id=None):
         """
         Analyzes image (Food, Workout, or Data).
+        `image` is JPEG bytes (sent inline, nothing touches disk) or a file path. `user_id` scopes
+        near-duplicate cache hits to that user's own photos.
         Returns JSON.
         """
         prompt = f"""
@@ -63,24 +60,31 @@ class GeminiService:
         """
         
         try:
-            sample_file = genai.upload_file(path=image_path, display_name="User Upload")
-            response = await self._generate_with_retry([prompt, sample_file])
+            image_bytes = image if isinstance(image, (bytes, bytearray)) else await asyncio.to_thread(_read_file, image)
+
+            # Same (or near-identical) photo with the same caption -> answer from cache, no API call
+            cached, cache_key = await vision_cache.get(image_bytes, caption, user_id)
+            if cached:
+                return cached
+
+            image_part = {"mime_type": "image/jpeg", "data": bytes(image_bytes)}
+            response = await self._generate([prompt, image_part])
             
             if response == "RATE_LIMIT":
                 return {"type": "error", "reply": "My brain is tired (Rate Limit). Please try again in 1 minute! 🧠💤"}
             
             if response:
                 text = response.text.replace("```json", "").replace("```", "").strip()
-                return json.loads(text)
+                result = json.loads(text)
+                if result.get("type") in ("meal", "workout", "metric"):
+                    await vision_cache.put(cache_key, result)
+                return result
         except Exception as e:
             logger.error(f"Vision error: {e}")
         return None
 
-    async def chat(self, user_text, context_str):
-        """
-        Conversational response with database context.
-        """
-        final_prompt = f"""
+    def _chat_prompt(self, user_text, context_str):
+        return f"""
         Role: Fitness Coach. Tone: Encouraging, concise.
         User Data/Stats: {context_str}
         
@@ -88,10 +92,32 @@ class GeminiService:
         
         Answer the user naturally. Use the data to be specific.
         """
-        
-        response = await self._generate_with_retry(final_prompt)
+
+    async def chat(self, user_text, context_str):
+        """
+        Conversational response with database context.
+        """
+        response = await self._generate(self._chat_prompt(user_text, context_str))
         
         if response == "RATE_LIMIT":
             return "My brain is tired (Rate Limit). Please try again in 1 minute! 🧠💤"
             
-        return response.text if response else "I'm having trouble thinking right now. Try again?"
\ No newline at end of file
+        return response.text if response else "I'm having trouble thinking right now. Try again?"
+
+    async def complete_chat(self, user_text, context_str):
+        """Chat reply text; raises LLMError instead of returning a canned message (used by the router)."""
+        response = await self.llm.generate(self._chat_prompt(user_text, context_str), priority=INTERACTIVE)
+        return response.text
+
+    async def stream_chat(self, user_text, context_str):
+        """
+        Streams the conversational response as text fragments.
+        Raises LLMError (before or during the stream); callers fall back to chat().
+        """
+        async for chunk in self.llm.stream(self._chat_prompt(user_text, context_str), priority=INTERACTIVE):
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # chunk without text parts (e.g. safety metadata only)
+            if text:
+                yield text
@@ -0,0 +1,277 @@
+"""
+Unified LLM call path: rate limiting, retries, deadlines and circuit breaking.
+
+Every Gemini caller goes through LLMClient.generate(), which
+- waits for the shared rate limiter (priority-aware),
+- retries rate-limit and transient errors with exponential backoff and full jitter,
+- never runs past the per-call deadline,
+- fails fast while the provider's circuit breaker is open,
+- propagates asyncio cancellation, so an abandoned update stops waiting immediately.
+
+The provider is any callable taking the inputs (sync or async), so a local fake can
+stand in for Gemini.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from config import LLM_MAX_ATTEMPTS, LLM_DEADLINE_SECONDS, LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET_SECONDS
+from services.rate_limiter import gemini_limiter, estimate_tokens, DEFAULT
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
+logger = logging.getLogger(__name__)
+
+class LLMError(Exception):
+    """The provider could not produce a response."""
+
+class RateLimited(LLMError):
+    """Quota exhausted and the deadline left no room to wait it out."""
+
+class ProviderUnavailable(LLMError):
+    """The circuit breaker is open; the provider is failing and is not being called."""
+
+class DeadlineExceeded(LLMError):
+    """The call did not finish within its deadline."""
+
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+def classify_error(exc):
+    """Maps a provider exception to rate_limit / transient / fatal."""
+    if google_exceptions is not None:
+        if isinstance(exc, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+            return RATE_LIMIT
+        if isinstance(exc, (google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError,
+                            google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout,
+                            google_exceptions.Aborted)):
+            return TRANSIENT
+        if isinstance(exc, google_exceptions.GoogleAPICallError):
+            return FATAL
+    code = getattr(exc, "code", None) or getattr(exc, "status", None)
+    if code == 429:
+        return RATE_LIMIT
+    if isinstance(code, int) and code >= 500:
+        return TRANSIENT
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return TRANSIENT
+    return FATAL
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one trial call through after `reset_timeout`."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, threshold=LLM_BREAKER_THRESHOLD, reset_timeout=LLM_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self):
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+        return self.state == self.CLOSED
+
+    def release(self):
+        """Ends a half-open trial without a verdict (cancelled or rate limited)."""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit '{self.name}' opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+_breakers = {}
+
+def get_breaker(name):
+    """One breaker per provider, shared by every client of that provider."""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+class LLMClient:
+    def __init__(self, call, name="gemini", limiter=gemini_limiter, max_attempts=LLM_MAX_ATTEMPTS,
+                 base_delay=1.0, max_delay=20.0, deadline=LLM_DEADLINE_SECONDS):
+        self.call = call
+        self.name = name
+        self.limiter = limiter
+        self.breaker = get_breaker(name)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    async def _invoke(self, inputs, **kwargs):
+        if asyncio.iscoroutinefunction(self.call):
+            return await self.call(inputs, **kwargs)
+        return await asyncio.to_thread(self.call, inputs, **kwargs)
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def generate(self, inputs, priority=DEFAULT, deadline=None, **kwargs):
+        """
+        Returns the provider response or raises an LLMError subclass.
+        `deadline` (seconds) bounds the whole call including queueing and retries.
+        """
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        tokens = estimate_tokens(inputs)
+        last_error = None
+
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                raise ProviderUnavailable(f"{self.name} circuit is open") from last_error
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"{self.name} call exceeded its deadline") from last_error
+
+            if self.limiter is not None:
+                try:
+                    await asyncio.wait_for(self.limiter.acquire(tokens, priority=priority), remaining)
+                except asyncio.TimeoutError as e:
+                    # Still queued for quota; the provider itself is fine
+                    self.breaker.release()
+                    raise RateLimited(f"{self.name} quota wait exceeded the deadline") from e
+                except asyncio.CancelledError:
+                    self.breaker.release()
+                    raise
+
+            try:
+                remaining = deadline_at - time.monotonic()
+                response = await asyncio.wait_for(self._invoke(inputs, **kwargs), max(remaining, 0.001))
+            except asyncio.TimeoutError as e:
+                self.breaker.record_failure()
+                raise DeadlineExceeded(f"{self.name} call exceeded its deadline") from e
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == FATAL:
+                    # A bad request says nothing about provider health
+                    self.breaker.record_success()
+                    raise LLMError(f"{self.name} request failed: {e}") from e
+                last_error = e
+                delay = self._backoff(attempt)
+                if kind == RATE_LIMIT:
+                    self.breaker.release()
+                    logger.warning(f"{self.name} rate limited (attempt {attempt + 1}/{self.max_attempts})")
+                else:
+                    self.breaker.record_failure()
+                    logger.warning(f"{self.name} attempt {attempt + 1}/{self.max_attempts} failed: {e}")
+
+                if attempt == self.max_attempts - 1 or time.monotonic() + delay >= deadline_at:
+                    break
+                if kind == RATE_LIMIT and self.limiter is not None:
+                    self.limiter.pause(delay)  # every caller backs off; the next acquire() waits it out
+                else:
+                    await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            if self.limiter is not None:
+                usage = getattr(response, "usage_metadata", None)
+                self.limiter.record_usage(tokens, getattr(usage, "total_token_count", None))
+            return response
+
+        if classify_error(last_error) == RATE_LIMIT:
+            raise RateLimited(f"{self.name} is rate limited") from last_error
+        raise LLMError(f"{self.name} failed after retries: {last_error}") from last_error
+
+    async def stream(self, inputs, priority=DEFAULT, deadline=None, **kwargs):
+        """
+        Async iterator over the provider's streamed chunks (`call(inputs, stream=True)`).
+        Rate limiting and the circuit breaker apply as in generate(); there are no retries,
+        because a partial answer may already have been shown to the user. The deadline bounds
+        the wait for the first chunk and then each gap between chunks, so a long answer that
+        keeps flowing is never cut off.
+        """
+        deadline = deadline or self.deadline
+        deadline_at = time.monotonic() + deadline
+        if not self.breaker.allow():
+            raise ProviderUnavailable(f"{self.name} circuit is open")
+        tokens = estimate_tokens(inputs)
+        if self.limiter is not None:
+            try:
+                await asyncio.wait_for(self.limiter.acquire(tokens, priority=priority), deadline_at - time.monotonic())
+            except asyncio.TimeoutError as e:
+                self.breaker.release()
+                raise RateLimited(f"{self.name} quota wait exceeded the deadline") from e
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            # Runs in a worker thread: iterate the blocking stream and hand chunks to the loop
+            try:
+                for chunk in self.call(inputs, stream=True, **kwargs):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        producer = loop.run_in_executor(None, produce)
+        received = False
+        try:
+            while True:
+                remaining = deadline_at - time.monotonic()
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(remaining, 0.001))
+                except asyncio.TimeoutError as e:
+                    self.breaker.record_failure()
+                    stage = "next" if received else "first"
+                    raise DeadlineExceeded(f"{self.name} stream: no {stage} chunk within {deadline:g}s") from e
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    kind = classify_error(item)
+                    if kind == RATE_LIMIT:
+                        self.breaker.release()
+                        raise RateLimited(f"{self.name} is rate limited") from item
+                    if kind == TRANSIENT:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    raise LLMError(f"{self.name} stream failed: {item}") from item
+                received = True
+                yield item
+                deadline_at = time.monotonic() + deadline
+            self.breaker.record_success()
+        finally:
+            stop.set()  # consumer went away (cancelled/closed) or finished: stop reading the stream
+            if not received:
+                self.breaker.release()
+            producer.add_done_callback(lambda f: f.exception())
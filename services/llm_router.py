@@ -0,0 +1,246 @@
+"""
+Latency-aware routing of chat requests between Gemini and a local Ollama server.
+
+Each backend keeps live stats: an EWMA and p95 of successful call latency, an EWMA error
+rate and its in-flight count. Gemini also reports its rate-limiter queue and any 429 pause.
+Backends whose circuit is open are skipped, and the rest are ranked by expected latency.
+
+chat() hedges: if the first backend has not answered within its own p95, the next one
+starts too, and the first answer wins while the loser is cancelled. The loser's time so far
+counts as a lower bound on its latency, so a backend that keeps losing drops in the ranking.
+A failure (e.g. Gemini
+rate limited) fails over right away. stream_chat() does not hedge, because a partial reply
+may already be on screen. It only fails over when a backend fails before its first chunk.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from config import ROUTER_HEDGE_MIN_SECONDS, ROUTER_HEDGE_DEFAULT_SECONDS
+from services.llm_client import LLMError, RateLimited, ProviderUnavailable, CircuitBreaker, get_breaker
+
+logger = logging.getLogger(__name__)
+
+MIN_SAMPLES = 5  # latency samples needed before the p95 is trusted as a hedge budget
+
+class BackendStats:
+    def __init__(self, expected_latency, alpha=0.2, window=200):
+        self.alpha = alpha
+        self.latency_ewma = expected_latency
+        self.latencies = deque(maxlen=window)
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, elapsed, ok):
+        self.calls += 1
+        if ok:
+            self.latency_ewma += self.alpha * (elapsed - self.latency_ewma)
+            self.latencies.append(elapsed)
+        else:
+            self.failures += 1
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def record_censored(self, elapsed):
+        """A call cancelled after `elapsed` without an answer: its latency was at least that."""
+        self.calls += 1
+        self.latency_ewma = max(self.latency_ewma, elapsed)
+        self.latencies.append(elapsed)
+
+    def p95(self):
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+class Backend:
+    """
+    One chat provider. `complete(text, context)` returns the reply text and `stream(text, context)`
+    yields fragments; both raise on failure. `guarded` backends already run behind their own
+    LLMClient breaker. For the others the router keeps the breaker itself.
+    """
+    def __init__(self, name, complete, stream, limiter=None, guarded=False, expected_latency=3.0):
+        self.name = name
+        self.complete = complete
+        self.stream = stream
+        self.limiter = limiter
+        self.guarded = guarded
+        self.breaker = get_breaker(name)
+        self.stats = BackendStats(expected_latency)
+
+    def available(self):
+        return self.breaker.state != CircuitBreaker.OPEN or \
+            time.monotonic() - self.breaker.opened_at >= self.breaker.reset_timeout
+
+    def quota_wait(self):
+        """Seconds a new request would likely wait for quota before it is even sent."""
+        if self.limiter is None:
+            return 0.0
+        stats = self.limiter.stats()
+        wait = stats["paused_for_s"]
+        if stats["queue_depth"] or stats["requests_available"] < 1:
+            # Each queued request ahead of us needs one more request slot (rpm / 60 per second)
+            wait += (stats["queue_depth"] + 1) * 60.0 / max(stats["rpm"], 1.0)
+        return wait
+
+    def expected_latency(self):
+        stats = self.stats
+        penalty = 1.0 / max(0.05, 1.0 - stats.error_rate)
+        return (stats.latency_ewma * (1 + stats.in_flight) + self.quota_wait()) * penalty
+
+    def hedge_budget(self):
+        p95 = self.stats.p95()
+        return ROUTER_HEDGE_DEFAULT_SECONDS if p95 is None else max(ROUTER_HEDGE_MIN_SECONDS, p95)
+
+    def snapshot(self):
+        stats = self.stats
+        p95 = stats.p95()
+        return {
+            "name": self.name,
+            "available": self.available(),
+            "breaker": self.breaker.state,
+            "latency_ewma_ms": round(stats.latency_ewma * 1000),
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "error_rate": round(stats.error_rate, 3),
+            "in_flight": stats.in_flight,
+            "quota_wait_s": round(self.quota_wait(), 2),
+            "calls": stats.calls,
+            "failures": stats.failures,
+        }
+
+class LLMRouter:
+    def __init__(self, backends):
+        self.backends = list(backends)
+
+    @classmethod
+    def for_services(cls, gemini, ollama=None):
+        from services.rate_limiter import gemini_limiter
+        backends = [Backend("gemini", gemini.complete_chat, gemini.stream_chat,
+                            limiter=gemini_limiter, guarded=True, expected_latency=2.0)]
+        if ollama is not None:
+            backends.append(Backend("ollama", ollama.complete_chat, ollama.stream_chat,
+                                    expected_latency=6.0))
+        return cls(backends)
+
+    def rank(self):
+        """Available backends, fastest expected first."""
+        return sorted((b for b in self.backends if b.available()), key=lambda b: b.expected_latency())
+
+    def stats(self):
+        return [backend.snapshot() for backend in self.backends]
+
+    async def _call(self, backend, user_text, context_str):
+        if not backend.guarded and not backend.breaker.allow():
+            raise ProviderUnavailable(f"{backend.name} circuit is open")
+        backend.stats.in_flight += 1
+        started = time.monotonic()
+        try:
+            reply = await backend.complete(user_text, context_str)
+        except asyncio.CancelledError:
+            if not backend.guarded:
+                backend.breaker.release()
+            raise  # lost the hedge or the update was abandoned; says nothing about the backend
+        except Exception:
+            backend.stats.record(time.monotonic() - started, ok=False)
+            if not backend.guarded:
+                backend.breaker.record_failure()
+            raise
+        finally:
+            backend.stats.in_flight -= 1
+        backend.stats.record(time.monotonic() - started, ok=True)
+        if not backend.guarded:
+            backend.breaker.record_success()
+        return reply
+
+    def _give_up(self, errors):
+        if not errors:
+            raise ProviderUnavailable("No chat backend is available")
+        for error in errors:
+            if isinstance(error, RateLimited):
+                raise error
+        last = errors[-1]
+        if isinstance(last, LLMError):
+            raise last
+        raise LLMError(f"All chat backends failed: {last}") from last
+
+    async def chat(self, user_text, context_str):
+        """Reply text from the first backend to answer. Raises an LLMError subclass if all fail."""
+        waiting = self.rank()
+        running = {}
+        started = {}
+        errors = []
+
+        def launch():
+            backend = waiting.pop(0)
+            task = asyncio.ensure_future(self._call(backend, user_text, context_str))
+            running[task] = backend
+            started[task] = time.monotonic()
+            return backend
+
+        try:
+            if waiting:
+                launch()
+            while running:
+                # Only the most recently started backend sets the hedge clock
+                newest = list(running.values())[-1]
+                timeout = newest.hedge_budget() if waiting else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    backend = launch()
+                    logger.info(f"Hedging chat to {backend.name}: {newest.name} is past its "
+                                f"{newest.hedge_budget():.1f}s budget")
+                    continue
+
+                for task in done:
+                    backend = running.pop(task)
+                    if task.exception() is None:
+                        for loser, other in running.items():  # lost the hedge; cancelled below
+                            other.stats.record_censored(time.monotonic() - started[loser])
+                        return task.result()
+                    errors.append(task.exception())
+                    logger.warning(f"{backend.name} chat failed: {task.exception()}")
+
+                if not running and waiting:
+                    backend = launch()
+                    logger.info(f"Failing over chat to {backend.name}")
+            self._give_up(errors)
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def stream_chat(self, user_text, context_str):
+        """Streams reply fragments from the best backend, failing over only before the first fragment."""
+        errors = []
+        for backend in self.rank():
+            if not backend.guarded and not backend.breaker.allow():
+                continue
+            backend.stats.in_flight += 1
+            started = time.monotonic()
+            outcome = None
+            try:
+                async for piece in backend.stream(user_text, context_str):
+                    outcome = "streaming"
+                    yield piece
+                outcome = "ok"
+                return
+            except Exception as e:
+                if outcome == "streaming":
+                    outcome = "error"
+                    raise  # already on screen; the caller finalizes the partial reply
+                outcome = "error"
+                errors.append(e)
+                logger.warning(f"{backend.name} stream failed before its first chunk: {e}")
+            finally:
+                backend.stats.in_flight -= 1
+                if outcome in ("ok", "error"):
+                    backend.stats.record(time.monotonic() - started, ok=outcome == "ok")
+                if not backend.guarded:
+                    if outcome == "ok":
+                        backend.breaker.record_success()
+                    elif outcome == "error":
+                        backend.breaker.record_failure()
+                    else:
+                        backend.breaker.release()
+        self._give_up(errors)
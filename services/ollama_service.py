@@ -1,37 +1,86 @@
-import requests
+import aiohttp
+import asyncio
 import json
 import base64
 import logging
-import os
+from config import OLLAMA_HOST, OLLAMA_TIMEOUT_SECONDS, OLLAMA_MAX_CONNECTIONS
 
 logger = logging.getLogger(__name__)
 
-OLLAMA_HOST = "http://localhost:11434"
 VISION_MODEL = "llama3.2-vision:11b"
 TEXT_MODEL = "llama3:8b"
 
+class OllamaError(Exception):
+    """Ollama returned an error or an unusable response."""
+
+def _encode_image(image):
+    """Base64 for JPEG bytes or an image file path. CPU/disk-bound; run off the event loop."""
+    if isinstance(image, (bytes, bytearray)):
+        data = bytes(image)
+    else:
+        with open(image, "rb") as image_file:
+            data = image_file.read()
+    return base64.b64encode(data).decode('utf-8')
+
 class OllamaService:
-    def __init__(self):
-        pass
+    def __init__(self, host=OLLAMA_HOST):
+        self.host = host.rstrip("/")
+        self._session = None
+
+    def _get_session(self):
+        """Shared keep-alive session; created lazily inside the running event loop."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=OLLAMA_MAX_CONNECTIONS, keepalive_timeout=60),
+                # No total cap: streams may run long, but each read must make progress
+                timeout=aiohttp.ClientTimeout(total=None, connect=5, sock_read=OLLAMA_TIMEOUT_SECONDS),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _stream_generate(self, payload):
+        """POSTs to /api/generate with streaming on and yields each NDJSON chunk as a dict."""
+        session = self._get_session()
+        async with session.post(f"{self.host}/api/generate", json={**payload, "stream": True}) as response:
+            response.raise_for_status()
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise OllamaError(chunk["error"])
+                yield chunk
+                if chunk.get("done"):
+                    break
+
+    async def stream_tokens(self, payload):
+        """Async iterator over generated text fragments, so callers can reply before generation ends."""
+        async for chunk in self._stream_generate(payload):
+            token = chunk.get("response")
+            if token:
+                yield token
 
-    def _encode_image(self, image_path):
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+    async def _generate(self, payload):
+        return "".join([token async for token in self.stream_tokens(payload)])
 
-    async def analyze_image(self, image_path, user_prompt=None):
+    async def analyze_image(self, image, user_prompt=None):
         """
-        Analyzes an image using llama3.2-vision.
+        Analyzes an image (JPEG bytes or a file path) using llama3.2-vision.
         """
         try:
-            base64_image = self._encode_image(image_path)
-            
+            base64_image = await asyncio.to_thread(_encode_image, image)
+
             # Context-aware prompt to categorize and extract data
             system_instruction = """
             You are a fitness AI. Analyze the image.
             1. If FOOD: Identify items, estimate weight, calories, protein, carbs, fat.
             2. If WORKOUT: Identify exercise, equipment, form, estimated calories burned.
             3. If DATA/SCREENSHOT: Extract numbers (weight, steps, etc).
-            
+
             Return JSON ONLY:
             {
                 "type": "meal" | "workout" | "metric" | "unknown",
@@ -43,50 +92,50 @@ class OllamaService:
                 }
             }
             """
-            
+
             prompt = f"{system_instruction}\nUser Note: {user_prompt if user_prompt else ''}"
 
             payload = {
                 "model": VISION_MODEL,
                 "prompt": prompt,
                 "images": [base64_image],
-                "stream": False,
-                "format": "json" 
+                "format": "json"
             }
 
-            response = requests.post(f"{OLLAMA_HOST}/api/generate", json=payload)
-            response.raise_for_status()
-            result = response.json()
-            
-            return json.loads(result['response'])
+            return json.loads(await self._generate(payload))
 
         except Exception as e:
             logger.error(f"Ollama Vision Error: {e}")
             return None
 
-    async def chat(self, prompt, context_data=""):
-        """
-        Generates a text response using llama3:8b with database context.
-        """
-        try:
-            full_prompt = f"""
+    def _chat_payload(self, prompt, context_data=""):
+        full_prompt = f"""
             System: You are a helpful fitness coach.
             Context: {context_data}
-            
+
             User: {prompt}
-            
+
             Response (Keep it concise, friendly, and data-driven):
             """
-            
-            payload = {
-                "model": TEXT_MODEL,
-                "prompt": full_prompt,
-                "stream": False
-            }
+        return {"model": TEXT_MODEL, "prompt": full_prompt}
 
-            response = requests.post(f"{OLLAMA_HOST}/api/generate", json=payload)
-            response.raise_for_status()
-            return response.json()['response']
+    def stream_chat(self, prompt, context_data=""):
+        """Streams the chat reply as text fragments (async iterator). Raises on connection errors."""
+        return self.stream_tokens(self._chat_payload(prompt, context_data))
+
+    async def complete_chat(self, prompt, context_data=""):
+        """Chat reply text; raises on connection or model errors (used by the router)."""
+        text = await self._generate(self._chat_payload(prompt, context_data))
+        if not text.strip():
+            raise OllamaError("empty response")
+        return text
+
+    async def chat(self, prompt, context_data=""):
+        """
+        Generates a text response using llama3:8b with database context.
+        """
+        try:
+            return await self.complete_chat(prompt, context_data)
 
         except Exception as e:
             logger.error(f"Ollama Chat Error: {e}")
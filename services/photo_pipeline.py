@@ -0,0 +1,84 @@
+"""
+In-memory photo pipeline for incoming Telegram photos.
+
+Picks the smallest Telegram rendition that still meets the target resolution,
+downloads it into memory, downscales/re-encodes it on a worker pool, and hands the
+JPEG bytes straight to the model. Saving a copy to disk is an optional background step.
+"""
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from config import PHOTO_TARGET_PX, PHOTO_JPEG_QUALITY, PHOTO_WORKERS, PHOTO_ARCHIVE_DIR
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # images are sent as downloaded without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Pillow releases the GIL while decoding, resizing and encoding, so threads scale here
+_image_pool = ThreadPoolExecutor(max_workers=PHOTO_WORKERS, thread_name_prefix="photo")
+_archive_tasks = set()
+
+def pick_photo_size(photo_sizes, target_px=PHOTO_TARGET_PX):
+    """Smallest PhotoSize whose longer side is >= target_px; the largest one if none is big enough."""
+    ordered = sorted(photo_sizes, key=lambda p: p.width * p.height)
+    for size in ordered:
+        if max(size.width, size.height) >= target_px:
+            return size
+    return ordered[-1]
+
+def downscale(image_bytes, max_px=PHOTO_TARGET_PX, quality=PHOTO_JPEG_QUALITY):
+    """Fits the image into max_px x max_px and re-encodes it as JPEG. CPU-bound."""
+    if Image is None:
+        return image_bytes
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_px, max_px), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+async def fetch_photo(photo_sizes, target_px=PHOTO_TARGET_PX):
+    """Downloads the best-fitting rendition into memory and returns model-ready JPEG bytes."""
+    photo = pick_photo_size(photo_sizes, target_px)
+    telegram_file = await photo.get_file()
+    raw = bytes(await telegram_file.download_as_bytearray())
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_image_pool, downscale, raw, target_px)
+    except Exception as e:
+        logger.warning(f"Could not re-encode photo, sending original: {e}")
+        return raw
+
+def _write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+def archive_photo(image_bytes, telegram_id):
+    """
+    Schedules a background write of the photo under PHOTO_ARCHIVE_DIR and returns its path,
+    or None when archiving is disabled. Never blocks the caller.
+    """
+    if not PHOTO_ARCHIVE_DIR:
+        return None
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    path = os.path.join(PHOTO_ARCHIVE_DIR, f"upload_{telegram_id}_{timestamp}.jpg")
+
+    task = asyncio.get_running_loop().run_in_executor(_image_pool, _write_file, path, image_bytes)
+    _archive_tasks.add(task)
+    task.add_done_callback(_archive_done)
+    return path
+
+def _archive_done(task):
+    _archive_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.warning(f"Photo archive write failed: {task.exception()}")
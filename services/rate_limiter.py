@@ -0,0 +1,159 @@
+"""
+Process-wide async rate limiter for Gemini calls.
+
+Two token buckets enforce the requests-per-minute and tokens-per-minute budgets.
+Callers queue by priority class (interactive chat before batch jobs), so nothing
+sleeps while there is budget left, and bursts wait only as long as the budget requires.
+With BOT_WORKERS > 1 each shard worker gets an equal share of the quota (set_budget()).
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from config import GEMINI_RPM, GEMINI_TPM
+
+# Priority classes (lower is served first)
+INTERACTIVE = 0
+DEFAULT = 1
+BATCH = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", DEFAULT: "default", BATCH: "batch"}
+
+IMAGE_TOKENS = 258  # Gemini bills a standard image as a fixed token count
+DEFAULT_OUTPUT_TOKENS = 512
+
+def estimate_tokens(inputs, output_tokens=DEFAULT_OUTPUT_TOKENS):
+    """Rough prompt+completion token estimate (~4 characters per token)."""
+    parts = inputs if isinstance(inputs, (list, tuple)) else [inputs]
+    total = output_tokens
+    for part in parts:
+        total += len(part) // 4 if isinstance(part, str) else IMAGE_TOKENS
+    return total
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # Requests larger than the whole bucket only need it to be full
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+class RateLimiter:
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, name="gemini"):
+        self.name = name
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._waiters = []  # heap of (priority, seq, future, tokens)
+        self._seq = itertools.count()
+        self._timer = None
+        self._paused_until = 0.0
+        self._acquired = {p: 0 for p in PRIORITY_NAMES}
+        self._waits = {p: deque(maxlen=500) for p in PRIORITY_NAMES}
+
+    def set_budget(self, rpm, tpm):
+        """Replaces the per-minute budgets; the buckets start full."""
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        return now
+
+    def _wait_time(self, tokens):
+        now = self._refill()
+        return max(self._paused_until - now, self._requests.wait_time(1), self._tokens.wait_time(tokens))
+
+    def _take(self, tokens):
+        self._requests.level -= 1
+        self._tokens.level -= min(tokens, self._tokens.capacity)
+
+    def _dispatch(self):
+        """Grants capacity to queued callers in priority order; re-arms the timer if the head must wait."""
+        self._timer = None
+        while self._waiters:
+            priority, _, future, tokens = self._waiters[0]
+            if future.done():  # cancelled while queued
+                heapq.heappop(self._waiters)
+                continue
+            delay = self._wait_time(tokens)
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._take(tokens)
+            future.set_result(None)
+
+    async def acquire(self, tokens=1, priority=DEFAULT):
+        """Waits until one request and `tokens` tokens of budget are available."""
+        started = time.monotonic()
+        if not self._waiters and self._wait_time(tokens) <= 0:
+            self._take(tokens)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._seq), future, tokens))
+            if self._timer is None:
+                self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.refund(tokens)  # granted just as we were cancelled
+                raise
+        self._acquired[priority] = self._acquired.get(priority, 0) + 1
+        self._waits.setdefault(priority, deque(maxlen=500)).append(time.monotonic() - started)
+
+    def refund(self, tokens):
+        self._refill()
+        self._requests.level = min(self._requests.capacity, self._requests.level + 1)
+        self._tokens.level = min(self._tokens.capacity, self._tokens.level + tokens)
+
+    def record_usage(self, estimated, actual):
+        """Corrects the token bucket once the real usage of a call is known."""
+        if actual:
+            self._refill()
+            self._tokens.level -= actual - estimated
+
+    def pause(self, seconds):
+        """Holds every caller back, e.g. after the provider answered 429."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._waiters:
+            self._dispatch()
+
+    def stats(self):
+        """Queue depth, wait times and remaining budget, for logging and health checks."""
+        self._refill()
+        queued = [w for w in self._waiters if not w[2].done()]
+        by_priority = {}
+        for priority, label in PRIORITY_NAMES.items():
+            waits = sorted(self._waits.get(priority, ()))
+            by_priority[label] = {
+                "queued": sum(1 for w in queued if w[0] == priority),
+                "acquired": self._acquired.get(priority, 0),
+                "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+                "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+                "max_wait_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+            }
+        return {
+            "name": self.name,
+            "queue_depth": len(queued),
+            "rpm": self._requests.capacity,
+            "requests_available": round(self._requests.level, 2),
+            "tokens_available": round(self._tokens.level),
+            "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "priorities": by_priority,
+        }
+
+gemini_limiter = RateLimiter()
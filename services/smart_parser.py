@@ -1,22 +1,23 @@
 import re
+from services.food_db import get_food_db
 
-# Simple local cache for common foods (per 100g) and exercises (cal/min)
-# In production, this would be a database table
+# Built-in foods (per 100g, "piece" = grams per item, "cup" = grams per US cup), used when the food database file
+# (FOOD_DB_PATH) is missing, and exercises (cal/min)
 FOOD_CACHE = {
     "chicken": {"cals": 165, "prot": 31, "carbs": 0, "fat": 3.6},
-    "chicken breast": {"cals": 165, "prot": 31, "carbs": 0, "fat": 3.6},
-    "rice": {"cals": 130, "prot": 2.7, "carbs": 28, "fat": 0.3},
-    "white rice": {"cals": 130, "prot": 2.7, "carbs": 28, "fat": 0.3},
-    "egg": {"cals": 155, "prot": 13, "carbs": 1.1, "fat": 11},
-    "eggs": {"cals": 155, "prot": 13, "carbs": 1.1, "fat": 11},
+    "chicken breast": {"cals": 165, "prot": 31, "carbs": 0, "fat": 3.6, "piece": 170},
+    "rice": {"cals": 130, "prot": 2.7, "carbs": 28, "fat": 0.3, "cup": 158},
+    "white rice": {"cals": 130, "prot": 2.7, "carbs": 28, "fat": 0.3, "cup": 158},
+    "egg": {"cals": 155, "prot": 13, "carbs": 1.1, "fat": 11, "piece": 50},
+    "eggs": {"cals": 155, "prot": 13, "carbs": 1.1, "fat": 11, "piece": 50},
     "beef": {"cals": 250, "prot": 26, "carbs": 0, "fat": 17},
-    "steak": {"cals": 271, "prot": 25, "carbs": 0, "fat": 19},
-    "potato": {"cals": 77, "prot": 2, "carbs": 17, "fat": 0.1},
-    "oats": {"cals": 389, "prot": 16.9, "carbs": 66, "fat": 6.9},
-    "milk": {"cals": 42, "prot": 3.4, "carbs": 5, "fat": 1},
-    "banana": {"cals": 89, "prot": 1.1, "carbs": 22.8, "fat": 0.3},
-    "apple": {"cals": 52, "prot": 0.3, "carbs": 14, "fat": 0.2},
-    "bread": {"cals": 265, "prot": 9, "carbs": 49, "fat": 3.2},
+    "steak": {"cals": 271, "prot": 25, "carbs": 0, "fat": 19, "piece": 220},
+    "potato": {"cals": 77, "prot": 2, "carbs": 17, "fat": 0.1, "piece": 173},
+    "oats": {"cals": 389, "prot": 16.9, "carbs": 66, "fat": 6.9, "cup": 81},
+    "milk": {"cals": 42, "prot": 3.4, "carbs": 5, "fat": 1, "cup": 244},
+    "banana": {"cals": 89, "prot": 1.1, "carbs": 22.8, "fat": 0.3, "piece": 118},
+    "apple": {"cals": 52, "prot": 0.3, "carbs": 14, "fat": 0.2, "piece": 182},
+    "bread": {"cals": 265, "prot": 9, "carbs": 49, "fat": 3.2, "piece": 30},
 }
 
 EXERCISE_CACHE = {
@@ -32,73 +33,267 @@ EXERCISE_CACHE = {
     "swim": 10
 }
 
+# Strength exercises: alias -> display name. Burn is estimated from the number of sets.
+STRENGTH_EXERCISES = {
+    "bench press": "Bench Press", "bench": "Bench Press",
+    "squat": "Squat", "squats": "Squat",
+    "deadlift": "Deadlift", "deadlifts": "Deadlift",
+    "overhead press": "Overhead Press", "ohp": "Overhead Press", "shoulder press": "Overhead Press",
+    "row": "Row", "rows": "Row", "barbell row": "Row",
+    "pull up": "Pull Up", "pull ups": "Pull Up", "pullup": "Pull Up", "pullups": "Pull Up",
+    "push up": "Push Up", "push ups": "Push Up", "pushup": "Push Up", "pushups": "Push Up",
+    "curl": "Curl", "curls": "Curl", "bicep curl": "Curl", "bicep curls": "Curl",
+    "lunge": "Lunge", "lunges": "Lunge",
+    "dip": "Dip", "dips": "Dip",
+    "leg press": "Leg Press",
+}
+STRENGTH_MIN_PER_SET = 2  # work + rest
+STRENGTH_CAL_PER_MIN = 6
+
+# Past-tense verbs that name a cardio exercise ("ran 5k")
+EXERCISE_VERBS = {"ran": "run", "jogged": "run", "walked": "walk", "cycled": "cycling", "biked": "bike", "swam": "swim"}
+MIN_PER_KM = {"run": 6, "running": 6, "walk": 12, "walking": 12, "cycling": 3, "bike": 3, "swim": 20, "swimming": 20}
+DEFAULT_CAL_PER_MIN = 5
+
+# Units -> grams
+MASS_UNITS = {
+    "g": 1, "gr": 1, "gram": 1, "grams": 1, "kg": 1000, "mg": 0.001,
+    "oz": 28.35, "ounce": 28.35, "ounces": 28.35, "lb": 453.6, "lbs": 453.6, "pound": 453.6, "pounds": 453.6,
+}
+# Units -> US cups (240 ml); converted with the food's own grams per cup, so a food without one goes to the AI
+VOLUME_UNITS = {
+    "cup": 1, "cups": 1, "tbsp": 1 / 16, "tablespoon": 1 / 16, "tablespoons": 1 / 16,
+    "tsp": 1 / 48, "teaspoon": 1 / 48, "teaspoons": 1 / 48,
+    "ml": 1 / 240, "l": 1000 / 240, "liter": 1000 / 240, "litre": 1000 / 240, "liters": 1000 / 240, "litres": 1000 / 240,
+}
+PIECE_UNITS = {"piece", "pieces", "pc", "pcs", "slice", "slices", "whole"}
+TIME_UNITS = {"min": 1, "mins": 1, "minute": 1, "minutes": 1, "h": 60, "hr": 60, "hrs": 60, "hour": 60, "hours": 60}
+DISTANCE_UNITS = {
+    "km": 1, "k": 1, "kms": 1, "meter": 0.001, "meters": 0.001, "metre": 0.001, "metres": 0.001,
+    "mi": 1.609, "mile": 1.609, "miles": 1.609,
+}
+MIN_BARE_METRES = 100  # a bare "m": "200 m swim" is metres, "30m run" is minutes
+LIFT_UNITS = {"kg": 1, "kgs": 1, "lb": 0.4536, "lbs": 0.4536}
+COUNT_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "half": 0.5}
+MAX_BARE_PIECES = 20  # "2 eggs" is pieces, "200 rice" is grams
+MIN_FOOD_COVERAGE = 0.5
+# Words that say something was not eaten or done ("i skipped bread", "no run today"); "didn't" tokenizes as "didn"
+NEGATION_WORDS = {"no", "not", "never", "without", "skip", "skipped", "skipping", "didn", "didnt", "don", "dont"}
+
+FOOD_FILLER = {
+    "i", "ate", "eat", "eaten", "had", "have", "having", "just", "for", "breakfast", "lunch", "dinner",
+    "snack", "of", "some", "my", "today", "also", "about", "around", "approx",
+}
+WORKOUT_FILLER = {"i", "did", "do", "went", "for", "of", "at", "a", "an", "today", "just", "also", "set", "sets", "rep", "reps", "x"}
+
+SEGMENT_SPLIT = re.compile(r"[,;\n+&]|\band\b|\bthen\b|\bwith\b|\bplus\b")
+TOKEN_RE = re.compile(r"(?P<setrep>\d+)\s*[x×]\s*(?P<reps>\d+)|(?P<num>\d+(?:\.\d+)?(?:/\d+)?)|(?P<word>[a-z]+)|(?P<at>@)")
+
+def _tokenize(segment):
+    tokens = []
+    for m in TOKEN_RE.finditer(segment):
+        if m.group("setrep"):
+            tokens.append(("setrep", (int(m.group("setrep")), int(m.group("reps")))))
+        elif m.group("num"):
+            num = m.group("num")
+            if "/" in num:
+                top, bottom = num.split("/")
+                value = float(top) / float(bottom) if float(bottom) else 0.0
+            else:
+                value = float(num)
+            tokens.append(("num", value))
+        elif m.group("word"):
+            tokens.append(("word", m.group("word")))
+    return tokens
+
+def _is_filler(tokens):
+    return all(kind == "word" and (value in FOOD_FILLER or value in COUNT_WORDS) for kind, value in tokens)
+
 class SmartParser:
+    @staticmethod
+    def _parse_food_segment(tokens):
+        """'2 eggs', '200g rice', '1/2 cup oats', 'a slice of bread' -> meal dict, or None."""
+        qty, unit, words = None, None, []
+        for i, (kind, value) in enumerate(tokens):
+            if kind == "setrep":
+                return None
+            if kind == "num":
+                if qty is not None:
+                    return None
+                qty = value
+            elif value in MASS_UNITS or value in VOLUME_UNITS or value in PIECE_UNITS:
+                # A unit only counts right after a quantity ("200g", "a cup", "rice 2 cups")
+                after_qty = i > 0 and (tokens[i - 1][0] == "num" or tokens[i - 1][1] in COUNT_WORDS)
+                if unit is None and qty is not None and after_qty:
+                    unit = value
+                else:
+                    words.append(value)
+            elif value in COUNT_WORDS and qty is None and not words:
+                qty = COUNT_WORDS[value]
+            elif value not in FOOD_FILLER:
+                words.append(value)
+
+        if not words:
+            return None
+        # Most of the words must belong to the food, so questions that mention a food don't match
+        match = get_food_db(fallback=FOOD_CACHE).lookup(" ".join(words), min_coverage=MIN_FOOD_COVERAGE)
+        if not match:
+            return None
+        food_name, macros = match
+        piece = macros.get("piece")
+
+        if unit in MASS_UNITS:
+            grams = qty * MASS_UNITS[unit]
+        elif unit in VOLUME_UNITS:
+            if not macros.get("cup"):
+                return None
+            grams = qty * VOLUME_UNITS[unit] * macros["cup"]
+        elif unit in PIECE_UNITS:
+            if not piece:
+                return None
+            grams = qty * piece
+        elif qty is None:
+            if not piece:
+                return None
+            grams = piece
+        elif piece and qty <= MAX_BARE_PIECES:
+            grams = qty * piece
+        else:
+            grams = qty
+
+        if grams <= 0:
+            return None
+        ratio = grams / 100.0
+        return {
+            "food_name": food_name.title(),
+            "weight_grams": round(grams, 1),
+            "calories": round(macros["cals"] * ratio),
+            "protein": round(macros["prot"] * ratio, 1),
+            "carbs": round(macros["carbs"] * ratio, 1),
+            "fats": round(macros["fat"] * ratio, 1),
+            "source": "smart_cache"
+        }
+
+    @staticmethod
+    def _parse_workout_segment(tokens):
+        """'3x10 bench 60kg', '3 sets of 10 squats at 100kg', '30 min run', 'ran 5k' -> workout dict, or None."""
+        sets = reps = weight = duration = distance = None
+        pending = None
+        words = []
+        for i, (kind, value) in enumerate(tokens):
+            nxt = tokens[i + 1][1] if i + 1 < len(tokens) and tokens[i + 1][0] == "word" else None
+            if kind == "setrep":
+                sets, reps = value
+            elif kind == "num":
+                if nxt in TIME_UNITS:
+                    duration = value * TIME_UNITS[nxt]
+                elif nxt in LIFT_UNITS:
+                    weight = value * LIFT_UNITS[nxt]
+                elif nxt in DISTANCE_UNITS:
+                    distance = value * DISTANCE_UNITS[nxt]
+                elif nxt == "m":
+                    if value >= MIN_BARE_METRES:
+                        distance = value / 1000
+                    else:
+                        duration = value
+                elif nxt in ("sets", "set", "x"):
+                    sets = int(value)
+                elif nxt in ("reps", "rep"):
+                    reps = int(value)
+                elif sets is not None and reps is None:
+                    reps = int(value)  # "3 sets of 10"
+                else:
+                    pending = value
+            elif value in TIME_UNITS or value in LIFT_UNITS or value in DISTANCE_UNITS or value == "m":
+                continue  # consumed with its number
+            elif value not in WORKOUT_FILLER:
+                words.append(EXERCISE_VERBS.get(value, value))
+
+        phrase = " ".join(words)
+        strength = None
+        for alias in sorted(STRENGTH_EXERCISES, key=len, reverse=True):
+            if re.search(rf"\b{alias}\b", phrase):
+                strength = STRENGTH_EXERCISES[alias]
+                break
+
+        if strength:
+            if reps is None and sets is None and pending is not None:
+                reps = int(pending)
+            if sets is None and reps is None:
+                return None
+            sets = sets or 1
+            minutes = duration or sets * STRENGTH_MIN_PER_SET
+            return {
+                "exercise_name": strength,
+                "sets": sets,
+                "reps": reps,
+                "weight_kg": round(weight, 1) if weight else None,
+                "duration_minutes": minutes,
+                "calories_burned": round(minutes * STRENGTH_CAL_PER_MIN),
+                "source": "smart_cache"
+            }
+
+        cardio = next((key for key in EXERCISE_CACHE if re.search(rf"\b{key}\b", phrase)), None)
+        if duration is None and distance is not None and cardio:
+            duration = distance * MIN_PER_KM.get(cardio, 6)
+        if duration is None or not words or sets is not None:
+            return None
+        rate = EXERCISE_CACHE[cardio] if cardio else DEFAULT_CAL_PER_MIN
+        return {
+            "exercise_name": (cardio or phrase).title(),
+            "duration_minutes": round(duration, 1),
+            "calories_burned": round(duration * rate),
+            "source": "smart_cache"
+        }
+
+    @staticmethod
+    def parse_message(text):
+        """
+        Parses a whole message into meals and workouts, e.g.
+        '2 eggs and 200g rice, 3x10 bench 60kg'.
+        Returns {"meals": [...], "workouts": [...]} only if every part was understood, None otherwise
+        (so partially understood messages still go to the AI).
+        """
+        text = text.lower().strip()
+        if "?" in text:
+            return None  # questions go to the AI
+        meals, workouts = [], []
+        for segment in SEGMENT_SPLIT.split(text):
+            tokens = _tokenize(segment)
+            if any(kind == "word" and value in NEGATION_WORDS for kind, value in tokens):
+                return None
+            if not tokens or _is_filler(tokens):
+                continue
+            workout = SmartParser._parse_workout_segment(tokens)
+            if workout:
+                workouts.append(workout)
+                continue
+            food = SmartParser._parse_food_segment(tokens)
+            if food:
+                meals.append(food)
+                continue
+            return None
+        if not meals and not workouts:
+            return None
+        return {"meals": meals, "workouts": workouts}
+
     @staticmethod
     def parse_food(text):
         """
         Tries to parse '250g chicken' patterns.
-        Returns dict with macros if successful, None otherwise.
+        Returns dict with macros for the first food if the message is only food, None otherwise.
         """
-        text = text.lower().strip()
-        
-        # Regex for "100g food" or "100 ml food"
-        match = re.search(r'(\d+)\s*(?:g|ml|oz)?\s+([a-zA-Z\s]+)', text)
-        if match:
-            try:
-                amount = float(match.group(1))
-                food_name = match.group(2).strip()
-                
-                # Check cache (partial match)
-                # e.g. "grilled chicken" -> matches "chicken"
-                cache_hit = None
-                for key in FOOD_CACHE:
-                    if key in food_name or food_name in key:
-                        cache_hit = FOOD_CACHE[key]
-                        food_name = key # normalize name
-                        break
-                
-                if cache_hit:
-                    ratio = amount / 100.0
-                    return {
-                        "food_name": food_name.title(),
-                        "weight_grams": amount,
-                        "calories": round(cache_hit["cals"] * ratio),
-                        "protein": round(cache_hit["prot"] * ratio, 1),
-                        "carbs": round(cache_hit["carbs"] * ratio, 1),
-                        "fats": round(cache_hit["fat"] * ratio, 1),
-                        "source": "smart_cache"
-                    }
-            except:
-                pass
+        parsed = SmartParser.parse_message(text)
+        if parsed and parsed["meals"] and not parsed["workouts"]:
+            return parsed["meals"][0]
         return None
 
     @staticmethod
     def parse_workout(text):
         """
-        Tries to parse '30 min run' patterns.
+        Tries to parse '30 min run' / '3x10 bench 60kg' patterns.
         """
-        text = text.lower().strip()
-        
-        # Regex for "30 min run"
-        match = re.search(r'(\d+)\s*(?:min|mins|minutes)?\s+([a-zA-Z\s]+)', text)
-        if match:
-            try:
-                duration = float(match.group(1))
-                exercise_name = match.group(2).strip()
-                
-                # Check cache
-                rate = 5 # Default burn rate
-                for key in EXERCISE_CACHE:
-                    if key in exercise_name:
-                        rate = EXERCISE_CACHE[key]
-                        break
-                
-                return {
-                    "exercise_name": exercise_name.title(),
-                    "duration_minutes": duration,
-                    "calories_burned": round(duration * rate),
-                    "source": "smart_cache"
-                }
-            except:
-                pass
+        parsed = SmartParser.parse_message(text)
+        if parsed and parsed["workouts"] and not parsed["meals"]:
+            return parsed["workouts"][0]
         return None
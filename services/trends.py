@@ -0,0 +1,177 @@
+"""
+Vectorized trend analytics over DailySummary.
+
+A cohort's daily series is loaded with a single query into contiguous users x days
+NumPy arrays. Every metric is then computed for all users at once:
+- 7/30-day rolling intake, averaged over the days that have meals logged
+- an exponentially smoothed weight trend, which carries over days without a weigh-in
+- an adaptive TDEE: average intake minus the energy equivalent of the weight trend's
+  slope over the TDEE window, valid only when enough days are logged
+- daily calorie balance (intake - TDEE)
+"""
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import select
+from database.db import SessionLocal, run_db
+from database.models import DailySummary
+
+KCAL_PER_KG = 7700.0  # energy content of 1 kg of body weight change
+WEIGHT_ALPHA = 0.1  # EMA smoothing per day (~10-day memory)
+TDEE_WINDOW = 28
+MIN_LOGGED_FRACTION = 0.6  # TDEE needs intake logged on at least this share of the window
+
+class DailySeries:
+    """users x days arrays (float64, C-contiguous); NaN weight means no weigh-in that day."""
+    def __init__(self, user_ids, start_date, days):
+        self.user_ids = list(user_ids)
+        self.start_date = start_date
+        self.days = days
+        self.row = {uid: i for i, uid in enumerate(self.user_ids)}
+        shape = (len(self.user_ids), days)
+        self.intake = np.zeros(shape)
+        self.burned = np.zeros(shape)
+        self.protein = np.zeros(shape)
+        self.weight = np.full(shape, np.nan)
+
+    @property
+    def logged(self):
+        return self.intake > 0
+
+def load_series(user_ids, start_date, end_date=None):
+    """Loads [start_date, end_date] for the given users with one query."""
+    end_date = end_date or datetime.utcnow().date()
+    series = DailySeries(user_ids, start_date, (end_date - start_date).days + 1)
+    if not series.user_ids:
+        return series
+
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(
+            DailySummary.user_id, DailySummary.date, DailySummary.total_calories_in,
+            DailySummary.total_calories_out, DailySummary.total_protein, DailySummary.weight_kg
+        ).where(
+            DailySummary.user_id.in_(series.user_ids),
+            DailySummary.date >= start_date,
+            DailySummary.date <= end_date
+        )).all()
+    finally:
+        db.close()
+    if not rows:
+        return series
+
+    uids, dates, intake, burned, protein, weight = zip(*rows)
+    r = np.fromiter((series.row[u] for u in uids), dtype=np.intp, count=len(rows))
+    c = np.fromiter((d.toordinal() for d in dates), dtype=np.intp, count=len(rows)) - start_date.toordinal()
+    as_float = lambda values: np.array(values, dtype=float)  # None -> NaN
+    series.intake[r, c] = np.nan_to_num(as_float(intake))
+    series.burned[r, c] = np.nan_to_num(as_float(burned))
+    series.protein[r, c] = np.nan_to_num(as_float(protein))
+    series.weight[r, c] = as_float(weight)
+    return series
+
+def _window_sum(values, window):
+    """Trailing sum over the last `window` days (shorter at the start), along axis 1."""
+    csum = np.cumsum(values, axis=1)
+    out = csum.copy()
+    out[:, window:] -= csum[:, :-window]
+    return out
+
+def rolling_intake(intake, logged, window):
+    """Mean intake over the logged days of each trailing window; NaN where nothing was logged."""
+    counts = _window_sum(logged.astype(float), window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, _window_sum(intake, window) / counts, np.nan)
+
+def weight_trend(weight, alpha=WEIGHT_ALPHA):
+    """
+    Exponential moving average of weight. It starts at each user's first weigh-in and is
+    carried unchanged over days without one. The loop runs over days; each step updates
+    every user at once.
+    """
+    trend = np.full_like(weight, np.nan)
+    current = np.full(weight.shape[0], np.nan)
+    for day in range(weight.shape[1]):
+        observed = weight[:, day]
+        has = ~np.isnan(observed)
+        first = has & np.isnan(current)
+        current = np.where(first, observed, current)
+        update = has & ~first
+        current[update] += alpha * (observed[update] - current[update])
+        trend[:, day] = current
+    return trend
+
+def adaptive_tdee(intake, logged, trend, window=TDEE_WINDOW, min_logged=MIN_LOGGED_FRACTION):
+    """
+    Energy balance estimate per day: mean logged intake over the window minus the calories
+    stored/lost according to the weight trend's change across the window.
+    """
+    avg_intake = rolling_intake(intake, logged, window)
+    delta = np.full_like(trend, np.nan)
+    delta[:, window:] = trend[:, window:] - trend[:, :-window]
+    tdee = avg_intake - delta * KCAL_PER_KG / window
+    enough = _window_sum(logged.astype(float), window) >= min_logged * window
+    enough[:, :window] = False
+    return np.where(enough, tdee, np.nan)
+
+def compute_trends(series):
+    """All trend arrays for a DailySeries, each users x days."""
+    logged = series.logged
+    trend = weight_trend(series.weight)
+    tdee = adaptive_tdee(series.intake, logged, trend)
+    balance = np.where(logged, series.intake - tdee, np.nan)
+    return {
+        "intake_7d": rolling_intake(series.intake, logged, 7),
+        "intake_30d": rolling_intake(series.intake, logged, 30),
+        "protein_7d": rolling_intake(series.protein, logged, 7),
+        "weight_trend": trend,
+        "tdee": tdee,
+        "balance": balance,
+        "balance_7d": rolling_intake(np.nan_to_num(balance), logged & ~np.isnan(balance), 7),
+    }
+
+def _latest(values):
+    value = float(values[-1])
+    return None if np.isnan(value) else value
+
+def user_trend_summary(user_id, days=120, end_date=None):
+    """Latest trend values for one user (None where there is not enough data)."""
+    end_date = end_date or datetime.utcnow().date()
+    series = load_series([user_id], end_date - timedelta(days=days - 1), end_date)
+    trends = compute_trends(series)
+    row = {name: values[0] for name, values in trends.items()}
+    trend = row["weight_trend"]
+    weekly_change = trend[-1] - trend[-8] if len(trend) >= 8 else np.nan
+    return {
+        "intake_7d": _latest(row["intake_7d"]),
+        "intake_30d": _latest(row["intake_30d"]),
+        "protein_7d": _latest(row["protein_7d"]),
+        "weight_trend": _latest(trend),
+        "weight_change_per_week": None if np.isnan(weekly_change) else float(weekly_change),
+        "tdee": _latest(row["tdee"]),
+        "balance_7d": _latest(row["balance_7d"]),
+    }
+
+async def user_trend_summary_async(user_id, days=120, end_date=None):
+    """Non-blocking variant of user_trend_summary for use inside bot handlers."""
+    return await run_db(user_trend_summary, user_id, days, end_date)
+
+def format_trends(summary):
+    """Compact lines for model prompts; only metrics with enough data are included."""
+    lines = []
+    if summary["intake_7d"] is not None:
+        line = f"- Avg intake: {summary['intake_7d']:.0f} kcal/day (7d)"
+        if summary["intake_30d"] is not None:
+            line += f", {summary['intake_30d']:.0f} kcal/day (30d)"
+        lines.append(line)
+    if summary["protein_7d"] is not None:
+        lines.append(f"- Avg protein: {summary['protein_7d']:.0f} g/day (7d)")
+    if summary["weight_trend"] is not None:
+        line = f"- Weight trend: {summary['weight_trend']:.1f} kg"
+        if summary["weight_change_per_week"] is not None:
+            line += f" ({summary['weight_change_per_week']:+.2f} kg/week)"
+        lines.append(line)
+    if summary["tdee"] is not None:
+        lines.append(f"- Estimated TDEE: {summary['tdee']:.0f} kcal/day")
+    if summary["balance_7d"] is not None:
+        lines.append(f"- Calorie balance: {summary['balance_7d']:+.0f} kcal/day (7d avg)")
+    return "\n".join(lines)
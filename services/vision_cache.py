@@ -0,0 +1,165 @@
+"""
+Persistent cache for vision analysis results.
+
+Entries are keyed by the image's SHA-256 and the normalized caption; exact hits are shared
+by all users. On an exact miss, the same user's photos with the same caption whose
+perceptual hash (dHash) is within a few bits are treated as the same picture, so a re-sent
+breakfast photo is answered from the database without an API call. Another user's similar
+plate is never served: its portion and calories are not theirs. Body metric results only ever match exactly: two screenshots of the
+same scale app differ only in a few digits, which dHash does not see.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from config import VISION_CACHE_TTL_HOURS, VISION_CACHE_MAX_ENTRIES, VISION_CACHE_MAX_DISTANCE
+from database.db import SessionLocal, run_db
+from database.models import VisionCacheEntry
+
+try:
+    from PIL import Image
+except ImportError:  # perceptual matching is skipped without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Result types served only for the identical image, never for a near-duplicate
+EXACT_ONLY_TYPES = {"metric"}
+
+def _dhash(image_bytes, size=8):
+    """64-bit difference hash: compares neighbouring pixels of a 9x8 grayscale thumbnail."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        pixels = list(img.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return f"{value:016x}"
+
+def image_hashes(image_bytes):
+    """Returns (sha256 hex, dHash hex or None). CPU-bound; run off the event loop."""
+    content_hash = hashlib.sha256(image_bytes).hexdigest()
+    perceptual_hash = None
+    if Image is not None:
+        try:
+            perceptual_hash = _dhash(image_bytes)
+        except Exception as e:
+            logger.warning(f"Could not compute perceptual hash: {e}")
+    return content_hash, perceptual_hash
+
+def caption_hash(caption):
+    normalized = " ".join((caption or "").lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+class VisionCache:
+    def __init__(self, ttl_hours=VISION_CACHE_TTL_HOURS, max_entries=VISION_CACHE_MAX_ENTRIES,
+                 max_distance=VISION_CACHE_MAX_DISTANCE):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+
+    def lookup(self, content_hash, perceptual_hash, caption_key, user_id=None):
+        """Returns the cached analysis dict, or None. Near-duplicates need a user_id. Blocking."""
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - self.ttl
+            entry = db.query(VisionCacheEntry).filter(
+                VisionCacheEntry.content_hash == content_hash,
+                VisionCacheEntry.caption_hash == caption_key,
+                VisionCacheEntry.created_at >= cutoff
+            ).first()
+
+            if entry is None and perceptual_hash and user_id is not None and self.max_distance > 0:
+                target = int(perceptual_hash, 16)
+                candidates = db.query(VisionCacheEntry.id, VisionCacheEntry.perceptual_hash).filter(
+                    VisionCacheEntry.user_id == user_id,
+                    VisionCacheEntry.caption_hash == caption_key,
+                    VisionCacheEntry.created_at >= cutoff,
+                    VisionCacheEntry.perceptual_hash.isnot(None)
+                ).all()
+                best_id, best_distance = None, self.max_distance + 1
+                for entry_id, phash in candidates:
+                    distance = bin(target ^ int(phash, 16)).count("1")
+                    if distance < best_distance:
+                        best_id, best_distance = entry_id, distance
+                if best_id is not None:
+                    entry = db.get(VisionCacheEntry, best_id)
+                    result = json.loads(entry.result)
+                    if result.get("type") in EXACT_ONLY_TYPES:  # stored before they lost their dHash
+                        return None
+
+            if entry is None:
+                return None
+            entry.last_hit_at = datetime.utcnow()
+            entry.hit_count = (entry.hit_count or 0) + 1
+            result = json.loads(entry.result)
+            db.commit()
+            return result
+        finally:
+            db.close()
+
+    def store(self, content_hash, perceptual_hash, caption_key, user_id, result):
+        """Saves an analysis and evicts expired/least-recently-hit entries. Blocking."""
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            db.query(VisionCacheEntry).filter(
+                VisionCacheEntry.content_hash == content_hash,
+                VisionCacheEntry.caption_hash == caption_key
+            ).delete(synchronize_session=False)
+            if result.get("type") in EXACT_ONLY_TYPES:
+                perceptual_hash = None  # never a near-duplicate candidate
+            db.add(VisionCacheEntry(
+                user_id=user_id,
+                content_hash=content_hash,
+                perceptual_hash=perceptual_hash,
+                caption_hash=caption_key,
+                result=json.dumps(result),
+                created_at=now,
+                last_hit_at=now,
+            ))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()  # the same image was stored concurrently
+                return
+            self._evict(db, now)
+        finally:
+            db.close()
+
+    def _evict(self, db, now):
+        db.query(VisionCacheEntry).filter(
+            VisionCacheEntry.created_at < now - self.ttl
+        ).delete(synchronize_session=False)
+
+        overflow = db.query(VisionCacheEntry).count() - self.max_entries
+        if overflow > 0:
+            stale_ids = [row.id for row in db.query(VisionCacheEntry.id)
+                         .order_by(VisionCacheEntry.last_hit_at).limit(overflow)]
+            db.query(VisionCacheEntry).filter(
+                VisionCacheEntry.id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+        db.commit()
+
+    async def get(self, image_bytes, caption="", user_id=None):
+        """Returns (cached result or None, cache key) without blocking the event loop."""
+        content_hash, perceptual_hash = await asyncio.to_thread(image_hashes, image_bytes)
+        key = (content_hash, perceptual_hash, caption_hash(caption), user_id)
+        try:
+            return await run_db(self.lookup, *key), key
+        except Exception as e:
+            logger.warning(f"Vision cache lookup failed: {e}")
+            return None, key
+
+    async def put(self, key, result):
+        try:
+            await run_db(self.store, *key, result)
+        except Exception as e:
+            logger.warning(f"Vision cache store failed: {e}")
+
+vision_cache = VisionCache()
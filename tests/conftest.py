@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+# Point the app at a throwaway SQLite file before any project module creates the engine
+_DB_DIR = tempfile.mkdtemp(prefix="fitness-tracker-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/test.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+@pytest.fixture
+def db():
+    from database.db import Base, SessionLocal, engine, init_db
+    init_db()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,12 @@
+import os
+from services.charts import ChartCache
+
+def test_disk_tier_keeps_most_recently_used(tmp_path):
+    cache = ChartCache(directory=str(tmp_path), max_entries=1, max_files=3)
+    for i in range(3):
+        cache.put(f"k{i}", b"png")
+        os.utime(tmp_path / f"k{i}.png", (i, i))
+    assert cache.get("k0") == b"png"  # served from disk, refreshes its mtime
+
+    cache.put("k3", b"png")
+    assert sorted(os.listdir(tmp_path)) == ["k0.png", "k2.png", "k3.png"]
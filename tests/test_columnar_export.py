@@ -0,0 +1,55 @@
+import csv
+import glob
+import os
+from datetime import datetime
+from database.models import User, Meal
+from services.columnar_export import ColumnarExporter
+
+def _exported(out_dir, table):
+    rows = []
+    for path in sorted(glob.glob(os.path.join(out_dir, table, "month=*", "*.csv"))):
+        with open(path, newline="") as f:
+            rows.extend(csv.DictReader(f))
+    return rows
+
+def _run(out_dir):
+    return ColumnarExporter(out_dir, fmt="csv").run()
+
+def test_edits_and_deletes_reach_the_export(db, tmp_path):
+    out_dir = str(tmp_path)
+    user = User(telegram_id=1, name="Test")
+    db.add(user)
+    db.commit()
+    meal = Meal(user_id=user.id, timestamp=datetime(2024, 5, 1, 12), food_name="rice",
+                calories=100, protein=2, carbs=20, fats=1)
+    db.add(meal)
+    db.commit()
+
+    _run(out_dir)
+    assert [float(r["calories"]) for r in _exported(out_dir, "meals")] == [100]
+
+    meal.calories = 999
+    db.commit()
+    _run(out_dir)
+    assert [float(r["calories"]) for r in _exported(out_dir, "meals")] == [999]
+    assert [float(r["total_calories_in"]) for r in _exported(out_dir, "daily_summaries")] == [999]
+
+    meal.food_name = "brown rice"  # no numeric change
+    db.commit()
+    _run(out_dir)
+    assert [r["food_name"] for r in _exported(out_dir, "meals")] == ["brown rice"]
+
+    db.delete(meal)
+    db.commit()
+    _run(out_dir)
+    assert _exported(out_dir, "meals") == []
+
+def test_full_run_only_removes_its_own_output(db, tmp_path):
+    out_dir = str(tmp_path)
+    (tmp_path / "report.xlsx").write_text("keep me")
+    (tmp_path / "charts").mkdir()
+    _run(out_dir)
+    ColumnarExporter(out_dir, fmt="csv").run(full=True)
+    assert (tmp_path / "report.xlsx").read_text() == "keep me"
+    assert (tmp_path / "charts").is_dir()
+    assert (tmp_path / "_export_state.json").exists()
@@ -0,0 +1,137 @@
+import asyncio
+import time
+import pytest
+from services import llm_client
+from services.llm_client import (LLMClient, CircuitBreaker, LLMError, RateLimited, ProviderUnavailable,
+                                 DeadlineExceeded)
+from services.rate_limiter import RateLimiter
+
+class ProviderError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+class FakeProvider:
+    """Local stand-in for Gemini: fails with the scripted errors, then answers."""
+    def __init__(self, errors=(), delay=0.0, chunks=("Hello", " world")):
+        self.errors = list(errors)
+        self.delay = delay
+        self.chunks = chunks
+        self.calls = []
+
+    def __call__(self, inputs, stream=False):
+        self.calls.append(time.monotonic())
+        if self.delay:
+            time.sleep(self.delay)
+        if self.errors:
+            raise self.errors.pop(0)
+        if stream:
+            return iter(self.chunks)
+        return "ok"
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(llm_client, "_breakers", {})
+
+def _client(provider, **kwargs):
+    kwargs.setdefault("limiter", None)
+    kwargs.setdefault("base_delay", 0.01)
+    return LLMClient(provider, name="fake", **kwargs)
+
+def test_retries_rate_limit_with_backoff():
+    provider = FakeProvider(errors=[ProviderError(429), ProviderError(429)])
+    client = _client(provider, limiter=RateLimiter(rpm=1000, tpm=10_000_000, name="fake"))
+    assert asyncio.run(client.generate("hi")) == "ok"
+    assert len(provider.calls) == 3
+    assert client.breaker.state == CircuitBreaker.CLOSED  # 429 is not a provider failure
+
+def test_rate_limit_gives_up_after_max_attempts():
+    provider = FakeProvider(errors=[ProviderError(429)] * 5)
+    with pytest.raises(RateLimited):
+        asyncio.run(_client(provider, max_attempts=3).generate("hi"))
+    assert len(provider.calls) == 3
+
+def test_fatal_error_is_not_retried():
+    provider = FakeProvider(errors=[ProviderError(400)])
+    with pytest.raises(LLMError):
+        asyncio.run(_client(provider).generate("hi"))
+    assert len(provider.calls) == 1
+
+def test_breaker_opens_then_lets_one_trial_through(monkeypatch):
+    breaker = CircuitBreaker("fake", threshold=2, reset_timeout=0.1)
+    monkeypatch.setattr(llm_client, "_breakers", {"fake": breaker})
+    provider = FakeProvider(errors=[ProviderError(503)] * 2)
+    client = _client(provider, max_attempts=2)
+
+    with pytest.raises(LLMError):
+        asyncio.run(client.generate("hi"))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(ProviderUnavailable):
+        asyncio.run(client.generate("hi"))
+    assert len(provider.calls) == 2  # open: the provider is not called
+
+    time.sleep(0.15)
+    assert breaker.allow()  # half-open: one trial
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # ...and only one
+    breaker.release()
+
+    assert asyncio.run(client.generate("hi")) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_failed_half_open_trial_reopens(monkeypatch):
+    breaker = CircuitBreaker("fake", threshold=1, reset_timeout=0.05)
+    monkeypatch.setattr(llm_client, "_breakers", {"fake": breaker})
+    client = _client(FakeProvider(errors=[ProviderError(503)] * 2), max_attempts=1)
+    with pytest.raises(LLMError):
+        asyncio.run(client.generate("hi"))
+    time.sleep(0.1)
+    with pytest.raises(LLMError):
+        asyncio.run(client.generate("hi"))
+    assert breaker.state == CircuitBreaker.OPEN
+
+def test_deadline_bounds_a_slow_call():
+    client = _client(FakeProvider(delay=0.5), deadline=0.1)
+
+    async def timed():
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await client.generate("hi")
+        return time.monotonic() - started
+
+    assert asyncio.run(timed()) < 0.4  # the provider thread is abandoned, not awaited
+    assert client.breaker.failures == 1
+
+def test_cancellation_propagates_and_frees_the_trial(monkeypatch):
+    breaker = CircuitBreaker("fake", threshold=1, reset_timeout=0.0)
+    breaker.record_failure()  # open; the next allow() is the half-open trial
+    monkeypatch.setattr(llm_client, "_breakers", {"fake": breaker})
+    client = _client(FakeProvider(delay=0.3))
+
+    async def cancel_midway():
+        task = asyncio.create_task(client.generate("hi"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_midway())
+    assert breaker.allow()  # the cancelled call did not keep the trial slot
+
+async def _collect(client):
+    return [chunk async for chunk in client.stream("hi")]
+
+def test_stream_yields_chunks():
+    assert asyncio.run(_collect(_client(FakeProvider()))) == ["Hello", " world"]
+
+def test_stream_failing_before_first_chunk():
+    client = _client(FakeProvider(errors=[ProviderError(503)]))
+    with pytest.raises(LLMError):
+        asyncio.run(_collect(client))
+    assert client.breaker.failures == 1
+
+def test_stream_rate_limited_before_first_chunk():
+    client = _client(FakeProvider(errors=[ProviderError(429)]))
+    with pytest.raises(RateLimited):
+        asyncio.run(_collect(client))
+    assert client.breaker.failures == 0
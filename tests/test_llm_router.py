@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+from services import llm_client, llm_router
+from services.llm_router import Backend, LLMRouter
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(llm_client, "_breakers", {})
+
+def _backend(name, delay, expected_latency):
+    async def complete(text, context):
+        await asyncio.sleep(delay)
+        return name
+
+    async def stream(text, context):
+        yield name
+
+    return Backend(name, complete, stream, expected_latency=expected_latency)
+
+def test_hedge_loser_is_ranked_down(monkeypatch):
+    monkeypatch.setattr(llm_router, "ROUTER_HEDGE_MIN_SECONDS", 0.05)
+    monkeypatch.setattr(llm_router, "ROUTER_HEDGE_DEFAULT_SECONDS", 0.05)
+    slow, fast = _backend("slow", 5.0, 0.01), _backend("fast", 0.0, 0.03)
+    router = LLMRouter([slow, fast])
+    assert router.rank()[0] is slow
+
+    async def main():
+        reply = await router.chat("hi", "")
+        await asyncio.sleep(0)  # let the cancelled loser unwind
+        return reply
+
+    assert asyncio.run(main()) == "fast"
+    # The loser's time until cancellation counts, instead of it keeping its prior forever
+    assert slow.stats.latency_ewma >= 0.05
+    assert len(slow.stats.latencies) == 1
+    assert slow.stats.in_flight == 0
+    assert router.rank()[0] is fast
+
+def test_failure_fails_over():
+    async def broken(text, context):
+        raise RuntimeError("boom")
+
+    bad = Backend("bad", broken, None, expected_latency=0.01)
+    router = LLMRouter([bad, _backend("good", 0.0, 1.0)])
+    assert asyncio.run(router.chat("hi", "")) == "good"
+    assert bad.stats.failures == 1
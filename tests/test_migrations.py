@@ -0,0 +1,45 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from database.db import Base, SessionLocal, engine, init_db
+from database.models import Meal, DailySummary
+from services.analytics import check_daily_summaries
+
+# Tables as created by versions before incremental summaries
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, telegram_id INTEGER UNIQUE, name VARCHAR, goals TEXT, preferences TEXT)",
+    "CREATE TABLE meals (id INTEGER PRIMARY KEY, user_id INTEGER, timestamp DATETIME, food_name VARCHAR, "
+    "weight_grams FLOAT, calories FLOAT, protein FLOAT, carbs FLOAT, fats FLOAT, image_path VARCHAR, notes TEXT)",
+    "CREATE TABLE daily_summary (id INTEGER PRIMARY KEY, user_id INTEGER, date DATE, total_calories_in FLOAT, "
+    "total_calories_out FLOAT, total_protein FLOAT, workout_count INTEGER, weight_kg FLOAT)",
+    "INSERT INTO users (id, telegram_id, name) VALUES (1, 5, 'Test')",
+    "INSERT INTO meals (user_id, timestamp, food_name, calories, protein, carbs, fats) "
+    "VALUES (1, '2024-05-01 09:00:00', 'oats', 500, 10, 50, 5)",
+    "INSERT INTO daily_summary (user_id, date, total_calories_in) VALUES (1, '2024-05-01', 123)",
+    "INSERT INTO daily_summary (user_id, date, total_calories_in) VALUES (1, '2024-05-01', 456)",
+]
+
+def test_init_db_upgrades_legacy_database():
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+    try:
+        init_db()
+        init_db()  # idempotent
+
+        columns = {c["name"] for c in inspect(engine).get_columns("daily_summary")}
+        assert {"total_carbs", "total_fats", "updated_at"} <= columns
+        indexes = {ix["name"] for ix in inspect(engine).get_indexes("meals")}
+        assert "ix_meals_user_timestamp" in indexes
+
+        db = SessionLocal()
+        try:
+            db.add(Meal(user_id=1, timestamp=datetime(2024, 5, 1, 19), food_name="apple",
+                        calories=100, protein=1, carbs=20, fats=0))
+            db.commit()
+            rows = db.query(DailySummary).all()
+            assert [(r.total_calories_in, r.total_carbs) for r in rows] == [(600, 70)]
+        finally:
+            db.close()
+        assert check_daily_summaries() == []
+    finally:
+        Base.metadata.drop_all(bind=engine)
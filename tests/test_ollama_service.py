@@ -0,0 +1,79 @@
+import asyncio
+import json
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from services.ollama_service import OllamaService, OllamaError
+
+# Scripted NDJSON replies of the fake /api/generate, chosen by the request's "prompt"
+SCRIPTS = {
+    "tokens": [{"response": "Hel"}, {"response": "lo"}, {"response": "!", "done": True}],
+    "error": [{"response": "Par"}, {"error": "model crashed"}],
+    "empty": [{"response": "", "done": True}],
+    "json": [{"response": '{"type": "meal", '}, {"response": '"data": {"calories": 250}}', "done": True}],
+}
+
+def _fake_ollama(requests):
+    async def generate(request):
+        payload = await request.json()
+        requests.append(payload)
+        script = next(name for name in SCRIPTS if name in payload["prompt"])
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        for chunk in SCRIPTS[script]:
+            await response.write((json.dumps(chunk) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/api/generate", generate)
+    return app
+
+def _run(scenario):
+    """Runs `scenario(service)` against a fake Ollama server; returns (result, requests seen)."""
+    requests = []
+
+    async def main():
+        async with TestServer(_fake_ollama(requests)) as server:
+            service = OllamaService(host=str(server.make_url("/")))
+            try:
+                return await scenario(service)
+            finally:
+                await service.close()
+
+    return asyncio.run(main()), requests
+
+def test_stream_tokens_yields_fragments_in_order():
+    async def scenario(service):
+        return [token async for token in service.stream_tokens({"model": "m", "prompt": "tokens"})]
+
+    tokens, requests = _run(scenario)
+    assert tokens == ["Hel", "lo", "!"]
+    assert requests[0]["stream"] is True
+
+def test_error_chunk_raises_ollama_error():
+    async def scenario(service):
+        received = []
+        with pytest.raises(OllamaError, match="model crashed"):
+            async for token in service.stream_tokens({"model": "m", "prompt": "error"}):
+                received.append(token)
+        return received
+
+    assert _run(scenario)[0] == ["Par"]
+
+def test_complete_chat_joins_stream_and_rejects_empty():
+    async def scenario(service):
+        text = await service.complete_chat("tokens")
+        with pytest.raises(OllamaError):
+            await service.complete_chat("empty")
+        return text
+
+    assert _run(scenario)[0] == "Hello!"
+
+def test_analyze_image_parses_streamed_json():
+    async def scenario(service):
+        return await service.analyze_image(b"\xff\xd8fake-jpeg", user_prompt="json")
+
+    result, requests = _run(scenario)
+    assert result == {"type": "meal", "data": {"calories": 250}}
+    assert requests[0]["images"] and requests[0]["format"] == "json"
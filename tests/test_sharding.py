@@ -0,0 +1,69 @@
+import multiprocessing
+import time
+from bot.sharding import ShardSupervisor
+
+SPAWN = multiprocessing.get_context("spawn")
+
+def _update(update_id, user_id=5):
+    return {"update_id": update_id, "message": {"message_id": update_id, "from": {"id": user_id}, "text": "hi"}}
+
+class FakeProcess:
+    """Stands in for a shard worker; `alive` is flipped by the test."""
+    def __init__(self, target, args, name):
+        self.args = args
+        self.alive = False
+        self.exitcode = None
+        self.pid = None
+
+    def start(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def close(self):
+        pass
+
+class FakeContext:
+    """Real spawn-context queues, fake processes."""
+    Queue = SPAWN.Queue
+
+    def Process(self, target, args, name):
+        return FakeProcess(target, args, name)
+
+def _drain(q, count):
+    return [q.get(timeout=5)["update_id"] for _ in range(count)]
+
+def _supervisor(monkeypatch, queue_size):
+    monkeypatch.setattr("bot.sharding.multiprocessing.get_context", lambda method: FakeContext())
+    supervisor = ShardSupervisor(workers=1, queue_size=queue_size)
+    supervisor.start()
+    return supervisor
+
+def test_unacked_updates_go_to_the_restarted_worker(monkeypatch):
+    supervisor = _supervisor(monkeypatch, queue_size=10)
+    shard = supervisor.shards[0]
+    for update_id in (1, 2, 3):
+        assert supervisor.accept(_update(update_id))
+
+    # The worker takes update 1 and acks it, then dies; the old queue is never read again
+    assert _drain(shard.queue, 1) == [1]
+    shard.acks.put(1)
+    time.sleep(0.2)
+    shard.process.alive = False
+    assert not supervisor.accept(_update(4))  # webhook answers 503 / poller holds its offset
+
+    supervisor._spawn(shard)
+    assert _drain(shard.queue, 2) == [2, 3]
+    assert list(shard.pending) == [2, 3]
+    assert supervisor.accept(_update(4))
+
+def test_full_pending_buffer_rejects_until_acked(monkeypatch):
+    supervisor = _supervisor(monkeypatch, queue_size=2)
+    shard = supervisor.shards[0]
+    assert supervisor.accept(_update(1)) and supervisor.accept(_update(2))
+    assert not supervisor.accept(_update(3))
+    _drain(shard.queue, 1)
+    shard.acks.put(1)
+    time.sleep(0.2)
+    assert supervisor.accept(_update(3))
@@ -0,0 +1,33 @@
+import pytest
+from services.smart_parser import SmartParser
+
+@pytest.mark.parametrize("text, minutes", [
+    ("200 m swim", 4),       # metres at the swim pace, not 200 minutes
+    ("swam 1500m", 30),
+    ("400 metres swim", 8),
+    ("30m run", 30),         # small bare "m" stays minutes
+    ("45 min cycling", 45),
+    ("ran 5k", 30),
+])
+def test_cardio_duration(text, minutes):
+    workout, = SmartParser.parse_message(text)["workouts"]
+    assert workout["duration_minutes"] == minutes
+
+@pytest.mark.parametrize("text, grams", [
+    ("1/2 cup oats", 40.5),  # dry oats, not water
+    ("200ml milk", 203.3),
+    ("a cup of rice", 158),
+])
+def test_volume_uses_food_density(text, grams):
+    meal, = SmartParser.parse_message(text)["meals"]
+    assert meal["weight_grams"] == grams
+
+@pytest.mark.parametrize("text", [
+    "1 cup bread",  # no grams per cup: left to the AI
+    "i skipped bread today",
+    "i didn't eat bread",
+    "rice and no bread",
+    "no run today",
+])
+def test_not_parsed_locally(text):
+    assert SmartParser.parse_message(text) is None
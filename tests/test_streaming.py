@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from telegram.error import RetryAfter
+from bot import streaming
+from bot.streaming import reply_streaming, CURSOR
+from services.llm_client import LLMClient, DeadlineExceeded
+
+class FakeSent:
+    def __init__(self, text, throttle_final=0):
+        self.text = text
+        self.throttle_final = throttle_final
+
+    async def edit_text(self, text):
+        if not text.endswith(CURSOR) and self.throttle_final:
+            self.throttle_final -= 1
+            raise RetryAfter(1)
+        self.text = text
+
+class FakeMessage:
+    def __init__(self, throttle_final=0):
+        self.throttle_final = throttle_final
+        self.sent = []
+
+    async def reply_text(self, text):
+        self.sent.append(FakeSent(text, self.throttle_final))
+        return self.sent[-1]
+
+async def _chunks(*pieces):
+    for piece in pieces:
+        yield piece
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    slept = []
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+    monkeypatch.setattr(streaming.asyncio, "sleep", fake_sleep)
+    return slept
+
+def test_throttled_final_edit_is_retried(no_sleep):
+    message = FakeMessage(throttle_final=1)
+    text = asyncio.run(reply_streaming(message, _chunks("Hello ", "world"), min_interval=0))
+    assert text == "Hello world"
+    assert [m.text for m in message.sent] == ["Hello world"]
+    assert no_sleep == [1.0]
+
+def test_final_edit_falls_back_to_new_message(no_sleep):
+    message = FakeMessage(throttle_final=10)
+    asyncio.run(reply_streaming(message, _chunks("Hello ", "world"), min_interval=0))
+    assert message.sent[-1].text == "Hello world"
+    assert not message.sent[0].text.endswith("world")
+
+def _slow_stream(gap, count):
+    def call(inputs, stream=False):
+        import time
+        for i in range(count):
+            time.sleep(gap)
+            yield f"{i} "
+    return call
+
+async def _collect(client):
+    return [chunk async for chunk in client.stream("hi")]
+
+def test_stream_deadline_applies_per_chunk():
+    # 6 chunks 0.1s apart: longer than the 0.3s deadline overall, but never idle that long
+    client = LLMClient(_slow_stream(0.1, 6), name="stream-ok", limiter=None, deadline=0.3)
+    assert len(asyncio.run(_collect(client))) == 6
+    assert client.breaker.failures == 0
+
+def test_stream_stall_exceeds_deadline():
+    client = LLMClient(_slow_stream(0.5, 2), name="stream-stall", limiter=None, deadline=0.2)
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(_collect(client))
+
+def test_blank_stream_sends_nothing_and_returns_empty():
+    message = FakeMessage()
+    assert asyncio.run(reply_streaming(message, _chunks(" ", "\n"))) == ""
+    assert message.sent == []
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+from database.models import User, Meal, Workout, DailySummary
+from services.analytics import check_daily_summaries
+
+DAY = datetime(2024, 5, 1, 12)
+
+def _totals(db):
+    db.expire_all()
+    return {s.date: (s.total_calories_in, s.total_calories_out, s.workout_count)
+            for s in db.query(DailySummary)}
+
+def _user(db):
+    user = User(telegram_id=1, name="Test")
+    db.add(user)
+    db.commit()
+    return user
+
+def test_update_after_commit_replaces_old_amount(db):
+    user = _user(db)
+    meal = Meal(user_id=user.id, timestamp=DAY, food_name="rice", calories=100, protein=2, carbs=20, fats=1)
+    db.add(meal)
+    db.commit()  # expires `meal`
+
+    meal.calories = 300
+    db.commit()
+
+    assert _totals(db)[DAY.date()][0] == 300
+    assert check_daily_summaries() == []
+
+def test_move_after_commit_leaves_old_day(db):
+    user = _user(db)
+    meal = Meal(user_id=user.id, timestamp=DAY, food_name="rice", calories=100, protein=2, carbs=20, fats=1)
+    workout = Workout(user_id=user.id, timestamp=DAY, exercise_name="run", calories_burned=250)
+    db.add_all([meal, workout])
+    db.commit()
+
+    next_day = DAY + timedelta(days=1)
+    meal.timestamp = next_day
+    workout.timestamp = next_day
+    db.commit()
+
+    totals = _totals(db)
+    assert totals[DAY.date()] == (0, 0, 0)
+    assert totals[next_day.date()] == (100, 250, 1)
+    assert check_daily_summaries() == []
+
+def test_delete_after_commit(db):
+    user = _user(db)
+    meal = Meal(user_id=user.id, timestamp=DAY, food_name="rice", calories=100, protein=2, carbs=20, fats=1)
+    db.add(meal)
+    db.commit()
+
+    db.delete(meal)
+    db.commit()
+
+    assert _totals(db)[DAY.date()][0] == 0
+    assert check_daily_summaries() == []
@@ -0,0 +1,31 @@
+import json
+from database.models import VisionCacheEntry
+from services.vision_cache import VisionCache, caption_hash
+
+PHASH = "f0f0f0f0f0f0f0f0"
+NEAR_PHASH = "f0f0f0f0f0f0f0f1"  # one bit away
+CAPTION = caption_hash("")
+
+def test_near_duplicate_meal_is_served(db):
+    cache = VisionCache(max_distance=4)
+    cache.store("a" * 64, PHASH, CAPTION, 1, {"type": "meal", "reply": "Logged"})
+    assert cache.lookup("b" * 64, NEAR_PHASH, CAPTION, 1)["type"] == "meal"
+
+def test_near_duplicate_is_not_served_to_another_user(db):
+    cache = VisionCache(max_distance=4)
+    cache.store("a" * 64, PHASH, CAPTION, 1, {"type": "meal", "reply": "Logged"})
+    assert cache.lookup("b" * 64, NEAR_PHASH, CAPTION, 2) is None
+    assert cache.lookup("b" * 64, NEAR_PHASH, CAPTION) is None
+    assert cache.lookup("a" * 64, PHASH, CAPTION, 2)["type"] == "meal"  # the identical image is shared
+
+def test_metric_only_matches_exact_image(db):
+    cache = VisionCache(max_distance=4)
+    cache.store("a" * 64, PHASH, CAPTION, 1, {"type": "metric", "data": {"weight_kg": 80.2}})
+    assert cache.lookup("b" * 64, NEAR_PHASH, CAPTION, 1) is None
+    assert cache.lookup("a" * 64, PHASH, CAPTION, 1)["data"] == {"weight_kg": 80.2}
+
+def test_metric_stored_with_perceptual_hash_is_not_near_matched(db):
+    db.add(VisionCacheEntry(user_id=1, content_hash="a" * 64, perceptual_hash=PHASH, caption_hash=CAPTION,
+                            result=json.dumps({"type": "metric", "data": {"weight_kg": 80.2}})))
+    db.commit()
+    assert VisionCache(max_distance=4).lookup("b" * 64, NEAR_PHASH, CAPTION, 1) is None
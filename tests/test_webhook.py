@@ -0,0 +1,39 @@
+import asyncio
+from aiohttp.test_utils import TestClient, TestServer
+from bot import webhook
+from bot.webhook import create_webhook_app, SECRET_HEADER
+
+UPDATE = {"update_id": 1, "message": {"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"},
+                                      "from": {"id": 5, "is_bot": False, "first_name": "a"}, "text": "hi"}}
+
+class Sink:
+    def __init__(self):
+        self.updates = []
+
+    def accept(self, data):
+        self.updates.append(data)
+        return True
+
+    def health(self):
+        return True, {}
+
+async def _post(sink, headers, secret="s3cret"):
+    async with TestClient(TestServer(create_webhook_app(sink, path="/telegram", secret=secret))) as client:
+        return (await client.post("/telegram", json=UPDATE, headers=headers)).status
+
+def test_secret_token_is_checked():
+    sink = Sink()
+    assert asyncio.run(_post(sink, {})) == 403
+    assert asyncio.run(_post(sink, {SECRET_HEADER: "wrong"})) == 403
+    assert asyncio.run(_post(sink, {SECRET_HEADER: "s3cret"})) == 200
+    assert [u["update_id"] for u in sink.updates] == [1]
+
+def test_public_webhook_requires_secret(monkeypatch):
+    monkeypatch.setattr(webhook, "WEBHOOK_URL", "https://bot.example.com")
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "")
+    assert webhook.config_error()
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "s3cret")
+    assert webhook.config_error() is None
+    monkeypatch.setattr(webhook, "WEBHOOK_URL", None)
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "")
+    assert webhook.config_error() is None  # local testing